@@ -47,7 +47,7 @@ class ProductModelAdmin(admin.ModelAdmin):
     model = models.Product
     inlines = [StockInline]
     list_display = [
-        'parent', 'style', 'color', 'price', 'discounted_price', 'views'
+        'parent', 'style', 'color', 'price', 'discounted_price', 'views', 'trending_score'
     ]
     ordering = ['parent']
     search_fields = ['parent__name', 'parent__id', "style"]
@@ -96,3 +96,10 @@ class ImageModelAdmin(admin.ModelAdmin):
 
 
 
+
+@admin.register(models.ImageJob)
+class ImageJobModelAdmin(admin.ModelAdmin):
+    model = models.ImageJob
+    list_display = ['id', 'source', 'status', 'attempts', 'created_at', 'finished_at']
+    list_filter = ['status']
+    search_fields = ['source']
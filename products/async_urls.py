@@ -0,0 +1,16 @@
+from django.urls import re_path, path
+
+from . import async_views, views
+
+# the same URLs as products.urls, served by async views where available
+urlpatterns = [
+    re_path(r'^p/(?P<slug>[-\w]+)/$', async_views.AsyncProductDetail.as_view(), name='product_detail'),
+    path('', async_views.AsyncProductList.as_view(), name='product_list'),
+    path('search/', views.ProductSearch.as_view(), name='product_search'),
+    path('autocomplete/', views.ProductAutocomplete.as_view(), name='product_autocomplete'),
+    re_path(
+        r'^(?P<path>[\w/-]+)/$',
+        async_views.AsyncProductByCategoryList.as_view(),
+        name='product_by_category_list',
+    ),
+]
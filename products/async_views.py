@@ -0,0 +1,129 @@
+"""
+Async variants of the product views for ASGI deployments
+(see products.async_urls). They use the async ORM and cache API,
+which Django runs in the thread of sync code (sync_to_async with
+thread_sensitive=True), so queries and cache reads of a request run
+one after another.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.http import Http404
+from django.views.generic.base import ContextMixin
+
+from products import caching, facets, signals
+from products.category_tree import aget_category_tree
+from products.pagination import CursorPaginator, InvalidCursor
+from products.views import ProductByCategoryList, ProductDetail, ProductList
+
+
+class AsyncProductList(ProductList):
+    # the object count of the current request, see get_paginator
+    count = None
+
+    async def aget_queryset(self):
+        return self.get_queryset()
+
+    def get_paginator(self, *args, **kwargs):
+        paginator = super().get_paginator(*args, **kwargs)
+        if self.count is not None:
+            # counted with the async ORM, see apaginate_queryset
+            paginator.count = self.count
+
+        return paginator
+
+    async def apaginate_queryset(self, queryset, page_size):
+        """
+        Returns the same as paginate_queryset(),
+        with objects of the page fetched with the async ORM.
+        """
+        if self.pagination_mode == "cursor":
+            paginator = CursorPaginator(queryset, self.get_ordering(), page_size)
+            try:
+                page = await paginator.apage(self.request.GET.get(self.cursor_param_name))
+            except InvalidCursor as e:
+                raise Http404(str(e))
+
+            return paginator, page, page.object_list, page.has_other_pages()
+
+        self.count = await queryset.acount()
+        paginator, page, object_list, is_paginated = self.paginate_queryset(queryset, page_size)
+        page.object_list = [obj async for obj in object_list]
+
+        return paginator, page, page.object_list, is_paginated
+
+    async def aget_context_data(self, **kwargs):
+        page_size = self.get_paginate_by(self.object_list)
+        paginator, page, object_list, is_paginated = await self.apaginate_queryset(self.object_list, page_size)
+        filter_options = await facets.aget_filter_options()
+        facet_counts = await facets.aget_facet_counts(self.get_filter(), self.category)
+        context = {
+            "paginator": paginator,
+            "page_obj": page,
+            "is_paginated": is_paginated,
+            "object_list": object_list,
+            self.get_context_object_name(object_list): object_list,
+            **filter_options,
+            "facet_counts": facet_counts,
+            **kwargs,
+        }
+
+        # skips MultipleObjectMixin, which would paginate synchronously
+        return ContextMixin.get_context_data(self, **context)
+
+    async def get(self, request, *args, **kwargs):
+        self.object_list = await self.aget_queryset()
+        context = await self.aget_context_data()
+        return self.render_to_response(context)
+
+
+class AsyncProductByCategoryList(AsyncProductList, ProductByCategoryList):
+    async def aget_queryset(self):
+        self.category_tree = await aget_category_tree()
+        return self.get_queryset()
+
+    def get_category(self):
+        # the tree is loaded by aget_queryset
+        return self.resolve_category()
+
+    async def aget_context_data(self, **kwargs):
+        context = await super().aget_context_data(**kwargs)
+        context.update(self.get_category_context())
+        return context
+
+
+class AsyncProductDetail(ProductDetail):
+    async def afetch_object(self):
+        """
+        The async variant of ProductDetail.fetch_object().
+        """
+        product = self.get_product([variant async for variant in self.get_variants_queryset()])
+        await sync_to_async(prefetch_related_objects)([product], *self.prefetch)
+
+        return product
+
+    async def aget_object(self):
+        """
+        The async variant of ProductDetail.get_object().
+        """
+        timeout = getattr(settings, "PRODUCTS_DETAIL_CACHE_TIMEOUT", None)
+        if not timeout:
+            return await self.afetch_object()
+
+        return await caching.aget_or_set_versioned(
+            self.cache_key % self.kwargs[self.slug_url_kwarg],
+            self.afetch_object,
+            timeout,
+        )
+
+    async def get(self, request, *args, **kwargs):
+        self.object = await self.aget_object()
+        # receivers access the session and the database
+        await sync_to_async(signals.product_viewed.send)(
+            sender=self.model,
+            session=self.request.session,
+            product=self.object,
+            request=self.request,
+        )
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
@@ -0,0 +1,223 @@
+"""
+Suggestions for a search box, served from an in-memory prefix index.
+
+The index is built from the database once, stored in the cache, so that
+other processes load it from there. Writes of products, parent products,
+colors and categories bump the index version once they are committed and
+rebuild the index right away, in the writing process, once per transaction
+(see invalidate_index_on_commit). Only one process rebuilds it at a time,
+requests serve the previous index until the new one is stored. Looking
+suggestions up does not query the database.
+The whole index is stored under one cache key, so with backends limiting
+the size of values (f.e. memcached, 1 MB by default) large catalogs need
+the limit raised.
+"""
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+
+from products import caching
+from products.models import Color, Product
+from products.search import tokenize
+
+AUTOCOMPLETE_INDEX_KEY = "products:autocomplete_index"
+AUTOCOMPLETE_VERSION_KEY = caching.AUTOCOMPLETE_VERSION_KEY
+AUTOCOMPLETE_LOCK_KEY = "products:autocomplete_lock"
+# seconds, after which a rebuild is considered dead (f.e. of a killed process)
+LOCK_TIMEOUT = 300
+
+PRODUCT = "product"
+CATEGORY = "category"
+COLOR = "color"
+
+# (version, PrefixIndex) of the current process
+_index = None
+
+
+class PrefixIndex:
+    """
+    Suggestions (kind, pk, label, url tuples) indexed by every word
+    of their label, in a sorted array of words searched with bisect.
+    """
+    def __init__(self, suggestions=()):
+        entries = sorted(
+            (word, suggestion)
+            for suggestion in suggestions for word in set(tokenize(suggestion[2]))
+        )
+        self.words = [word for word, suggestion in entries]
+        self.suggestions = [suggestion for word, suggestion in entries]
+
+    def __len__(self):
+        return len(self.words)
+
+    def search(self, query, limit=10):
+        """
+        Returns suggestions with a word starting with the last word
+        of the query and with words starting with each of the other ones.
+        """
+        words = tokenize(query)
+        if not words:
+            return []
+        *other_words, last_word = words
+
+        results = []
+        seen = set()
+        i = bisect_left(self.words, last_word)
+        while i < len(self.words) and self.words[i].startswith(last_word):
+            suggestion = self.suggestions[i]
+            i += 1
+            if suggestion[:2] in seen:
+                continue
+            if other_words:
+                label_words = tokenize(suggestion[2])
+                if not all(any(label_word.startswith(word) for label_word in label_words)
+                           for word in other_words):
+                    continue
+            seen.add(suggestion[:2])
+            results.append(suggestion)
+            if len(results) == limit:
+                break
+
+        return results
+
+
+def product_suggestions(products):
+    return [
+        (PRODUCT, product.pk, str(product), product.get_absolute_url())
+        for product in products
+    ]
+
+
+def color_suggestions(colors):
+    return [
+        (COLOR, color.pk, color.name, "%s?color=%s" % (reverse("product_list"), color.pk))
+        for color in colors
+    ]
+
+
+def category_suggestions():
+    from products.category_tree import get_category_tree
+
+    return [
+        (CATEGORY, category.pk, category.name, category.get_absolute_url())
+        for category in get_category_tree().categories
+    ]
+
+
+def build_index():
+    return PrefixIndex([
+        *category_suggestions(),
+        *color_suggestions(Color.objects.all()),
+        *product_suggestions(
+            Product.objects.select_related("parent").only("slug", "style", "parent__name")
+        ),
+    ])
+
+
+def _load_index(version):
+    """
+    Returns (version, PrefixIndex) of the given version kept in memory
+    or stored in the cache, or of the newest older version,
+    None if there is none.
+    """
+    global _index
+    current = _index
+    if current is not None and current[0] == version:
+        return current
+
+    cached = cache.get(AUTOCOMPLETE_INDEX_KEY)
+    if cached is not None and (current is None or cached[0] > current[0]):
+        _index = current = cached
+
+    return current
+
+
+def _store_index(version, index):
+    global _index
+    cache.set(AUTOCOMPLETE_INDEX_KEY, (version, index), None)
+    _index = (version, index)
+
+
+def rebuild_index(locked=False):
+    """
+    Builds the index of the current version and stores it. Returns False
+    if another process is building it (it builds the latest version too),
+    'locked' tells that the caller took the lock already.
+    """
+    while locked or cache.add(AUTOCOMPLETE_LOCK_KEY, 1, LOCK_TIMEOUT):
+        locked = False
+        try:
+            version = caching.get_catalog_version(AUTOCOMPLETE_VERSION_KEY)
+            _store_index(version, build_index())
+        finally:
+            cache.delete(AUTOCOMPLETE_LOCK_KEY)
+        # writers which bumped the version meanwhile could not take the lock
+        if caching.get_catalog_version(AUTOCOMPLETE_VERSION_KEY) == version:
+            return True
+
+    return False
+
+
+def _invalidate_index():
+    # locked before the version is bumped,
+    # so that requests serve the previous index instead of building one
+    locked = cache.add(AUTOCOMPLETE_LOCK_KEY, 1, LOCK_TIMEOUT)
+    caching.bump_catalog_version(AUTOCOMPLETE_VERSION_KEY)
+    rebuild_index(locked)
+
+
+class _Invalidation:
+    """
+    The invalidation of the index by all writes of a transaction,
+    done by the first of their on-commit callbacks (they run one after
+    another once all writes are committed).
+    """
+    done = False
+
+
+def invalidate_index_on_commit(using=None):
+    """
+    Bumps the index version and rebuilds the index once the current
+    transaction commits (right away outside of a transaction),
+    once for all writes of the transaction.
+    """
+    connection = transaction.get_connection(using)
+    invalidation = getattr(connection, "_autocomplete_invalidation", None)
+    if invalidation is None or invalidation.done:
+        invalidation = connection._autocomplete_invalidation = _Invalidation()
+
+    def invalidate():
+        if not invalidation.done:
+            invalidation.done = True
+            _invalidate_index()
+
+    transaction.on_commit(invalidate, using=using)
+
+
+def get_index():
+    """
+    Returns the PrefixIndex of the current version, kept in memory or loaded
+    from the cache. An index of an older version is served while another
+    process rebuilds it, the index is built in the request only if none
+    was built yet or its rebuild was missed.
+    """
+    version = caching.get_catalog_version(AUTOCOMPLETE_VERSION_KEY)
+    loaded = _load_index(version)
+    if loaded is not None and loaded[0] == version:
+        return loaded[1]
+    if rebuild_index():
+        return _index[1]
+    if loaded is not None:
+        return loaded[1]
+
+    # the first index is being built by another process
+    return build_index()
+
+
+def suggest(query, limit=10):
+    return [
+        {"type": kind, "label": label, "url": url}
+        for kind, pk, label, url in get_index().search(query, limit)
+    ]
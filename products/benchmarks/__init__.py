@@ -0,0 +1,35 @@
+"""
+Benchmarks for the products app.
+
+Every module in this package provides a run(**options) function returning
+a JSON-serializable dict with results. Run them with the 'run_benchmark'
+management command against a database with some products, f.e.:
+
+    python manage.py run_benchmark view_counter --iterations 10000
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def measure(func, iterations, threads=1):
+    """
+    Calls func() 'iterations' times spread over 'threads' threads.
+    Returns elapsed seconds and calls per second.
+    """
+    def worker(count):
+        for _ in range(count):
+            func()
+
+    counts = [iterations // threads + (i < iterations % threads) for i in range(threads)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(worker, count) for count in counts]:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "iterations": iterations,
+        "threads": threads,
+        "seconds": round(elapsed, 4),
+        "per_second": round(iterations / elapsed, 1) if elapsed else None,
+    }
@@ -0,0 +1,146 @@
+"""
+Compares throughput and latency of the sync product views (products.urls)
+and their async variants (products.async_urls) served by Django's ASGI
+handler, with 1 to 16 requests in flight at once. Requests are sent
+through an in-process ASGI client (asgiref's ApplicationCommunicator),
+so no server is needed, but every request gets its own thread
+for sync code, as under an ASGI server. Pages are rendered with minimal
+templates listing the products (TEMPLATES below), so that sync views,
+which leave fetching products to templates, do the same work.
+Generate a catalog first, f.e.:
+
+    python manage.py generate_catalog --parents 10000 --clear
+    python manage.py run_benchmark async_views
+"""
+import asyncio
+import os
+import random
+import time
+
+from asgiref.testing import ApplicationCommunicator
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from products.benchmarks.views import get_urls
+from products.stats import summarize
+
+URLCONFS = {
+    "sync": "products.urls",
+    "async": "products.async_urls",
+}
+DEFAULT_CONCURRENCY = (1, 4, 16)
+TEMPLATES = [{
+    "BACKEND": "django.template.backends.django.DjangoTemplates",
+    "OPTIONS": {
+        "loaders": [("django.template.loaders.locmem.Loader", {
+            "products/product_list.html": (
+                "{% for product in products %}{{ product.name }} {{ product.effective_price }}"
+                "{% for stock in product.stock.all %}{{ stock.size.name }}{% endfor %}{% endfor %}"
+            ),
+            "products/product_detail.html": (
+                "{{ product.name }}{% for stock in product.stock.all %}{{ stock.size.name }}{% endfor %}"
+                "{% for variant in other_products %}{{ variant.color.name }}{% endfor %}"
+            ),
+        })],
+    },
+}]
+
+
+async def request(application, url, timeout=60):
+    """
+    Sends a GET request to the ASGI application, returns the status code.
+    """
+    path, _, query = url.partition("?")
+    communicator = ApplicationCommunicator(application, {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 0),
+        "server": ("testserver", 80),
+    })
+    await communicator.send_input({"type": "http.request", "body": b""})
+    start = await communicator.receive_output(timeout)
+    message = start
+    while message["type"] != "http.response.body" or message.get("more_body"):
+        message = await communicator.receive_output(timeout)
+    await communicator.wait(timeout)
+
+    return start["status"]
+
+
+async def browse(application, urls, concurrency):
+    """
+    Requests the URLs with 'concurrency' requests in flight at once.
+    """
+    remaining = iter(urls)
+    latency = []
+
+    async def client():
+        for url in remaining:
+            start = time.perf_counter()
+            status = await request(application, url)
+            latency.append((time.perf_counter() - start) * 1000)
+            if status != 200:
+                raise ValueError("%s returned %s" % (url, status))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests_per_second": round(len(urls) / elapsed, 1) if elapsed else None,
+        "latency_ms": summarize(latency),
+    }
+
+
+def run(iterations=None, seed=0, concurrency=DEFAULT_CONCURRENCY, warmup=5, **options):
+    """
+    Sends 'iterations' (100 by default) requests per view,
+    mode and concurrency level.
+    """
+    requests = iterations or 100
+    application = ASGIHandler()
+    results = {
+        "meta": {
+            "database": connection.vendor,
+            "cpus": os.cpu_count(),
+            "requests": requests,
+        },
+    }
+
+    # allows the 'testserver' host
+    try:
+        setup_test_environment()
+        teardown = True
+    except RuntimeError:
+        # already set up, f.e. when run from tests
+        teardown = False
+
+    try:
+        for mode, urlconf in URLCONFS.items():
+            results[mode] = {}
+            cache.clear()
+            with override_settings(ROOT_URLCONF=urlconf, TEMPLATES=TEMPLATES):
+                # the same URLs for both modes
+                urls = get_urls(requests, random.Random(seed))
+                for view, view_urls in urls.items():
+                    asyncio.run(browse(application, view_urls[:warmup], 1))
+                    results[mode][view] = {
+                        str(level): asyncio.run(browse(application, view_urls, level))
+                        for level in concurrency
+                    }
+    finally:
+        if teardown:
+            teardown_test_environment()
+
+    return results
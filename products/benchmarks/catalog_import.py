@@ -0,0 +1,81 @@
+"""
+Measures the bulk catalog import (see products.catalog_import) of a feed
+of new products and of re-running it, when nothing changes. The feed
+uses categories, colors and sizes of the existing catalog and all
+writes are rolled back. Generate a catalog first, f.e.:
+
+    python manage.py generate_catalog --parents 100 --clear
+    python manage.py run_benchmark catalog_import --iterations 50000
+"""
+import io
+import json
+import random
+import time
+
+from django.db import transaction
+
+from products import catalog_import
+from products.models import Category, Color, Size
+
+
+def get_feed(variants, variants_per_parent, rng):
+    """
+    Returns a JSONL feed with 'variants' new Products.
+    """
+    categories = [
+        category.path for category in Category.objects.all()
+        if category.rght == category.lft + 1
+    ]
+    colors = list(Color.objects.values_list("name", flat=True))
+    sizes = list(Size.objects.values_list("name", flat=True))
+    if not categories or not colors or not sizes:
+        raise ValueError("The benchmark needs a catalog, run 'generate_catalog' first.")
+
+    file = io.StringIO()
+    for i in range(-(-variants // variants_per_parent)):
+        count = min(variants_per_parent, variants - i * variants_per_parent)
+        file.write(json.dumps({
+            "name": "Imported product %s" % i,
+            "category": rng.choice(categories),
+            "description": "Description of imported product %s." % i,
+            "variants": [
+                {
+                    "style": "style %s" % j,
+                    "color": rng.choice(colors),
+                    "price": str(rng.randint(20, 500)),
+                    "main_image_url": "products/imported/%s-%s.jpg" % (i, j),
+                    "images": ["products/imported/%s-%s-1.jpg" % (i, j)],
+                    "stock": {size: rng.randint(0, 20) for size in rng.sample(sizes, min(4, len(sizes)))},
+                }
+                for j in range(count)
+            ],
+        }) + "\n")
+    file.seek(0)
+
+    return file
+
+
+def run(iterations=None, seed=0, variants_per_parent=3, batch_size=500, **options):
+    """
+    Imports a feed of 'iterations' (10000 by default) variants twice.
+    """
+    iterations = iterations or 10000
+    feed = get_feed(iterations, variants_per_parent, random.Random(seed)).getvalue()
+
+    results = {"variants": iterations}
+    with transaction.atomic():
+        for name in ["import", "reimport"]:
+            start = time.perf_counter()
+            result = catalog_import.import_catalog(
+                catalog_import.read_feed(io.StringIO(feed)),
+                batch_size=batch_size,
+            )
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                **result.as_dict(),
+                "seconds": round(elapsed, 4),
+                "variants_per_second": round(iterations / elapsed, 1),
+            }
+        transaction.set_rollback(True)
+
+    return results
@@ -0,0 +1,40 @@
+"""
+Compares the latency of fetching a deep page of the product list
+with django's offset Paginator and with CursorPaginator.
+"""
+from django.core.paginator import Paginator
+
+from products.benchmarks import measure
+from products.models import Product
+from products.pagination import CursorPaginator
+from products.views import ProductList
+
+
+def run(iterations=None, page=100, per_page=24, **options):
+    iterations = iterations or 50
+    queryset = Product.prefetched.get_available_products()
+    if queryset.count() < page * per_page:
+        raise ValueError(
+            "The benchmark needs at least %s available products, "
+            "generate a larger catalog first." % (page * per_page)
+        )
+
+    results = {}
+    for name, ordering in ProductList.ordering_options.items():
+        ordered = queryset.order_by(*ordering, "pk")
+        # a new Paginator per request, so that COUNT is not cached
+        offset = measure(lambda: list(Paginator(ordered, per_page).page(page)), iterations)
+
+        cursor_paginator = CursorPaginator(queryset, ordering, per_page)
+        cursor = None
+        for _ in range(page - 1):
+            cursor = cursor_paginator.page(cursor).next_cursor
+        keyset = measure(lambda: list(cursor_paginator.page(cursor)), iterations)
+
+        results[name] = {
+            "page": page,
+            "offset_ms": round(offset["seconds"] / iterations * 1000, 3),
+            "cursor_ms": round(keyset["seconds"] / iterations * 1000, 3),
+        }
+
+    return results
@@ -0,0 +1,82 @@
+"""
+Measures the throughput of the renditions backfill (see products.images
+and the 'generate_renditions' command) with 1 worker process, half
+of the CPUs and all of them, on synthetic photo-sized JPEGs in a temporary
+storage, and the size of renditions compared to the originals.
+
+    python manage.py run_benchmark renditions --iterations 48
+"""
+import io
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from PIL import Image as PILImage
+from PIL import ImageDraw
+
+from products import images
+
+
+def get_image(rng, width, height):
+    """
+    Returns a JPEG with random shapes, which compresses like a photo
+    rather than a flat color.
+    """
+    image = PILImage.new("RGB", (width, height), tuple(rng.randrange(256) for i in range(3)))
+    draw = ImageDraw.Draw(image)
+    for i in range(50):
+        x, y = rng.randrange(width), rng.randrange(height)
+        draw.ellipse(
+            (x, y, x + rng.randrange(50, width // 2), y + rng.randrange(50, height // 2)),
+            fill=tuple(rng.randrange(256) for i in range(3)),
+        )
+    output = io.BytesIO()
+    image.save(output, "JPEG", quality=90)
+
+    return output.getvalue()
+
+
+def run(iterations=None, seed=0, width=2000, height=2500, **options):
+    """
+    Generates renditions of 'iterations' (24 by default) images
+    per number of workers.
+    """
+    iterations = iterations or 24
+    rng = random.Random(seed)
+    cpus = os.cpu_count() or 1
+    directory = tempfile.mkdtemp()
+    try:
+        storage = FileSystemStorage(location=directory)
+        names = [
+            storage.save("products/image-%s.jpg" % i, ContentFile(get_image(rng, width, height)))
+            for i in range(iterations)
+        ]
+        original_size = sum(storage.size(name) for name in names)
+
+        results = {"images": iterations, "cpus": cpus, "widths": images.get_options()[0]}
+        for workers in sorted({1, cpus // 2 or 1, cpus}):
+            with images.get_executor(workers) as executor:
+                start = time.perf_counter()
+                generated = dict(images.generate_many(names, executor=executor, storage=storage))
+                elapsed = time.perf_counter() - start
+            results["workers_%s" % workers] = {
+                "seconds": round(elapsed, 4),
+                "images_per_second": round(iterations / elapsed, 2),
+            }
+
+        for format in images.get_options()[1]:
+            size = sum(
+                storage.size(rendition["path"])
+                for data in generated.values()
+                for rendition in data["renditions"]
+                if rendition["format"] == format
+            )
+            results["%s_bytes_ratio" % format] = round(size / original_size, 4)
+    finally:
+        shutil.rmtree(directory)
+
+    return results
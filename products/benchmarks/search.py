@@ -0,0 +1,76 @@
+"""
+Compares the latency of the full-text product search (see products.search),
+ordered by relevance and by popularity, with matching the same words
+with icontains, which reads the table until a page of matches is found
+(the whole table for rare words).
+Generate a catalog first, f.e. 100k variants:
+
+    python manage.py generate_catalog --parents 33334 --variants 3 --clear
+    python manage.py run_benchmark search
+"""
+import random
+import time
+
+from django.db import connection
+from django.db.models import Q
+
+from products.models import Category, Color, Product
+from products.search import tokenize
+from products.stats import summarize
+
+
+def get_queries(count, rng):
+    """
+    Returns search queries made of color, category and product names.
+    """
+    colors = list(Color.objects.values_list("name", flat=True))
+    categories = list(Category.objects.values_list("name", flat=True))
+    products = list(Product.objects.values_list("parent__name", flat=True)[:1000])
+    if not colors or not categories or not products:
+        raise ValueError("The benchmark needs a catalog, run 'generate_catalog' first.")
+
+    words = [
+        lambda: rng.choice(colors),
+        lambda: rng.choice(categories),
+        lambda: rng.choice(products),
+        lambda: "%s %s" % (rng.choice(colors), rng.choice(categories)),
+        # prefixes, as typed
+        lambda: rng.choice(products)[:5],
+    ]
+
+    return [rng.choice(words)() for _ in range(count)]
+
+
+def icontains(queryset, query):
+    q = Q()
+    for word in tokenize(query):
+        q &= Q(search_document__icontains=word)
+
+    return queryset.filter(q)
+
+
+def run(iterations=None, seed=0, per_page=24, **options):
+    iterations = iterations or 100
+    rng = random.Random(seed)
+    queries = get_queries(iterations, rng)
+    queryset = Product.objects.filter(in_stock=True)
+
+    results = {"vendor": connection.vendor, "products": Product.objects.count()}
+    for name, search in [
+        ("indexed_relevance", lambda query: queryset.search(query).order_by("-search_rank")),
+        ("indexed_popularity", lambda query: queryset.search(query).order_by("-views")),
+        ("icontains_popularity", lambda query: icontains(queryset, query).order_by("-views")),
+    ]:
+        latencies = []
+        matches = []
+        for query in queries:
+            start = time.perf_counter()
+            page = list(search(query)[:per_page])
+            latencies.append((time.perf_counter() - start) * 1000)
+            matches.append(len(page))
+        results[name] = {
+            "latency_ms": summarize(latencies),
+            "page_results": summarize(matches, digits=1),
+        }
+
+    return results
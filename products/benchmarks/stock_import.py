@@ -0,0 +1,82 @@
+"""
+Measures the throughput of the bulk stock import (see products.stock_import)
+of all Stock rows of the catalog with a part of the quantities changed,
+and of saving the same changes row by row with Stock.save(), as the admin
+does. All writes are rolled back.
+Generate a catalog first, f.e.:
+
+    python manage.py generate_catalog --parents 33334 --variants 3 --clear
+    python manage.py run_benchmark stock_import
+"""
+import csv
+import io
+import random
+import time
+
+from django.db import transaction
+
+from products import stock_import
+from products.models import Stock
+
+
+def get_csv(rows):
+    file = io.StringIO()
+    writer = csv.writer(file)
+    writer.writerow(stock_import.FIELDS)
+    writer.writerows(rows)
+    file.seek(0)
+
+    return file
+
+
+def run(iterations=None, seed=0, batch_size=1000, changed_ratio=0.2, **options):
+    """
+    Imports all Stock rows, 'iterations' (200 by default) changed rows
+    are saved one by one for comparison.
+    """
+    iterations = iterations or 200
+    rng = random.Random(seed)
+    stock = list(Stock.objects.values_list("pk", "product__slug", "size__name", "quantity"))
+    if not stock:
+        raise ValueError("The benchmark needs a catalog, run 'generate_catalog' first.")
+
+    rows = []
+    changed = []
+    for pk, slug, size, quantity in stock:
+        if rng.random() < changed_ratio:
+            quantity += rng.randint(1, 10)
+            changed.append((pk, quantity))
+        rows.append((slug, size, quantity))
+    file = get_csv(rows)
+
+    results = {"rows": len(rows), "changed": len(changed)}
+    with transaction.atomic():
+        start = time.perf_counter()
+        result = stock_import.import_stock(
+            stock_import.read_rows(file, "csv"),
+            batch_size=batch_size,
+        )
+        elapsed = time.perf_counter() - start
+        results["bulk"] = {
+            **result.as_dict(),
+            "seconds": round(elapsed, 4),
+            "rows_per_second": round(len(rows) / elapsed, 1),
+        }
+        transaction.set_rollback(True)
+
+    sample = changed[:iterations]
+    with transaction.atomic():
+        start = time.perf_counter()
+        for pk, quantity in sample:
+            stock = Stock.objects.get(pk=pk)
+            stock.quantity = quantity
+            stock.save()
+        elapsed = time.perf_counter() - start
+        results["per_row_save"] = {
+            "rows": len(sample),
+            "seconds": round(elapsed, 4),
+            "rows_per_second": round(len(sample) / elapsed, 1) if elapsed else None,
+        }
+        transaction.set_rollback(True)
+
+    return results
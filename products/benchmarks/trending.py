@@ -0,0 +1,88 @@
+"""
+Measures folding hourly view counts into trending scores of all products
+(see products.trending): every product is viewed in each of 'hours'
+hours, the first fold adds them to zero scores, the second one decays
+all scores and adds views of one more hour. Reports the time and the
+number of UPDATE statements of each fold, views lost because the cache
+evicted counters, the cost of recording a view and the time of the first
+page of products ordered by the score.
+Scores are restored afterwards. Generate a catalog first, f.e.:
+
+    python manage.py generate_catalog --parents 25000 --clear
+    python manage.py run_benchmark trending
+"""
+import datetime
+import random
+import time
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from products import trending
+from products.benchmarks import measure
+from products.models import Product
+
+
+def fold(now, batch_size):
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        views = trending.fold_trending_scores(now, batch_size)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "views": views,
+        "seconds": round(elapsed, 4),
+        "updates": sum("UPDATE" in query["sql"] for query in queries),
+    }
+
+
+def run(iterations=None, seed=0, hours=3, batch_size=500, **options):
+    """
+    Folds views of all products, 'iterations' limits the number of products.
+    """
+    rng = random.Random(seed)
+    pks = list(Product.objects.order_by("pk").values_list("pk", flat=True)[:iterations])
+    if not pks:
+        raise ValueError("The benchmark needs a catalog, run 'generate_catalog' first.")
+
+    # hours of the past, which are not folded by the application
+    start = timezone.now() - datetime.timedelta(days=1000)
+    folded = cache.get(trending.FOLDED_KEY)
+    results = {"products": len(pks), "hours": hours, "batch_size": batch_size}
+
+    try:
+        with transaction.atomic():
+            cache.set(trending.FOLDED_KEY, trending.get_hour(start) - 1, None)
+            recorded = 0
+            for hour in range(hours + 1):
+                now = start + datetime.timedelta(hours=hour)
+                deltas = {pk: rng.randint(1, 20) for pk in pks}
+                trending.record_views(deltas, now)
+                recorded += sum(deltas.values())
+                if hour == hours - 1:
+                    results["first_fold"] = fold(now + datetime.timedelta(hours=1), batch_size)
+            results["second_fold"] = fold(now + datetime.timedelta(hours=1), batch_size)
+            # views evicted from the cache are lost, it has to hold
+            # a counter per product and hour
+            results["lost_views"] = recorded - sum(
+                results[name]["views"] for name in ["first_fold", "second_fold"]
+            )
+
+            queryset = Product.prefetched.get_available_products().order_by("-trending_score")
+            start_time = time.perf_counter()
+            list(queryset[:24])
+            results["first_page_ms"] = round((time.perf_counter() - start_time) * 1000, 3)
+            transaction.set_rollback(True)
+
+        results["record_views"] = measure(
+            lambda: trending.record_views({pks[0]: 1}, start), 10000
+        )
+    finally:
+        if folded is None:
+            cache.delete(trending.FOLDED_KEY)
+        else:
+            cache.set(trending.FOLDED_KEY, folded, None)
+
+    return results
@@ -0,0 +1,62 @@
+"""
+Compares the request-path cost of counting a product view with the write-behind
+counter (counters.BufferedCounter) and with the previous implementation,
+which read and rewrote the counter with cache.get/cache.set and saved
+the whole Product once per hour.
+"""
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from products import counters, signals
+from products.benchmarks import measure
+from products.models import Product
+
+
+def legacy_increment_product_views(product):
+    cache_view_count_key = f"{product.pk}_view_count"
+    cache_last_saved_key = f"{product.pk}_view_count_last_saved"
+
+    current_time = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    last_saved = cache.get(cache_last_saved_key) or '1900-01-01 00:00:00'
+    view_count = cache.get(cache_view_count_key) or product.views
+    view_count += 1
+    cache.set(cache_view_count_key, view_count, 60000)
+    if parse_datetime(current_time) - parse_datetime(last_saved) > timezone.timedelta(hours=1):
+        product.views = view_count
+        product.save()
+        cache.set(cache_last_saved_key, current_time, 60000)
+
+
+def run(iterations=None, threads=4, **options):
+    iterations = iterations or 10000
+    product = Product.objects.order_by("pk").first()
+    if product is None:
+        raise ValueError("The benchmark needs at least one Product in the database.")
+
+    legacy_keys = [f"{product.pk}_view_count", f"{product.pk}_view_count_last_saved"]
+    results = {}
+
+    for thread_count in sorted({1, threads}):
+        # the hourly db write is measured separately, keep it off the request path
+        cache.set(legacy_keys[0], product.views, 60000)
+        cache.set(legacy_keys[1], timezone.now().strftime('%Y-%m-%d %H:%M:%S'), 60000)
+        legacy = measure(lambda: legacy_increment_product_views(product), iterations, thread_count)
+        legacy["lost_increments"] = iterations - (cache.get(legacy_keys[0]) - product.views)
+
+        cache.set(counters.view_counter.key("last_flush"), 1, 3600)
+        before = counters.view_counter.get(product.pk)
+        write_behind = measure(lambda: signals.increment_product_views(product), iterations, thread_count)
+        write_behind["lost_increments"] = iterations - (counters.view_counter.get(product.pk) - before)
+        # do not let the benchmark views reach the database
+        cache.decr(counters.view_counter.key("count", product.pk), iterations)
+
+        results["threads_%s" % thread_count] = {
+            "legacy": legacy,
+            "write_behind": write_behind,
+            "speedup": round(write_behind["per_second"] / legacy["per_second"], 2),
+        }
+
+    cache.delete_many(legacy_keys + [counters.view_counter.key("last_flush")])
+
+    return results
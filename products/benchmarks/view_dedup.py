@@ -0,0 +1,127 @@
+"""
+Compares session store writes of the view deduplication backends
+(see products.viewed) when visitors browse product detail pages:
+returning visitors with a session cookie viewing several products
+and crawlers without cookies, one request each. Reports the number
+of session saves and bytes written, sessions created and the latency
+of requests of every backend. All writes are rolled back.
+Generate a catalog first, f.e.:
+
+    python manage.py generate_catalog --parents 1000 --clear
+    python manage.py run_benchmark view_dedup
+"""
+import random
+import time
+from contextlib import contextmanager
+from importlib import import_module
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from products.models import Product
+from products.stats import summarize
+
+BACKENDS = ["products.viewed.SessionBackend", "products.viewed.BloomFilterBackend"]
+
+
+@contextmanager
+def count_session_writes():
+    """
+    Counts saves of the session store and bytes of the saved session data.
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    save = store.save
+    writes = {"saves": 0, "created": 0, "bytes": 0}
+
+    def counting_save(self, must_create=False):
+        # saving a new session calls create(), which saves it again
+        if must_create or self.session_key is not None:
+            writes["saves"] += 1
+            writes["created"] += must_create
+            writes["bytes"] += len(self.encode(self._get_session(no_load=must_create)))
+        return save(self, must_create)
+
+    with mock.patch.object(store, "save", counting_save):
+        yield writes
+
+
+def get_visitors(count):
+    """
+    Returns clients of returning visitors, with a session
+    created by another page (f.e. a cart) before.
+    """
+    clients = [Client(HTTP_USER_AGENT="browser %s" % i) for i in range(count)]
+    for client in clients:
+        session = client.session
+        session["cart"] = []
+        session.save()
+
+    return clients
+
+
+def browse(visitors, views_per_visitor, products, rng):
+    """
+    Returns latencies in ms of requests of visitors and as many crawlers.
+    """
+    latency = []
+    requests = [(client, rng.choice(products)) for client in visitors for _ in range(views_per_visitor)]
+    requests += [
+        (Client(HTTP_USER_AGENT="crawler"), slug)
+        for slug in rng.sample(products, min(len(products), len(visitors)))
+    ]
+    rng.shuffle(requests)
+
+    for client, slug in requests:
+        start = time.perf_counter()
+        response = client.get(reverse("product_detail", args=[slug]))
+        latency.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise ValueError("%s returned %s" % (slug, response.status_code))
+
+    return latency
+
+
+def run(iterations=None, seed=0, views_per_visitor=10, **options):
+    """
+    Simulates 'iterations' (50 by default) returning visitors
+    and as many crawler requests per backend.
+    """
+    visitors = iterations or 50
+    products = list(Product.objects.values_list("slug", flat=True)[:1000])
+    if not products:
+        raise ValueError("The benchmark needs a catalog, run 'generate_catalog' first.")
+
+    try:
+        setup_test_environment()
+        teardown = True
+    except RuntimeError:
+        # already set up, f.e. when run from tests
+        teardown = False
+
+    results = {"visitors": visitors, "views_per_visitor": views_per_visitor}
+    try:
+        for backend in BACKENDS:
+            cache.clear()
+            with transaction.atomic():
+                clients = get_visitors(visitors)
+                with override_settings(PRODUCTS_VIEWED_BACKEND=backend), count_session_writes() as writes:
+                    latency = browse(clients, views_per_visitor, products, random.Random(seed))
+                transaction.set_rollback(True)
+            results[backend.rsplit(".", 1)[1]] = {
+                "requests": len(latency),
+                "session_saves": writes["saves"],
+                "sessions_created": writes["created"],
+                "session_bytes_written": writes["bytes"],
+                "latency_ms": summarize(latency),
+            }
+    finally:
+        cache.clear()
+        if teardown:
+            teardown_test_environment()
+
+    return results
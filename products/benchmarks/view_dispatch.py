@@ -0,0 +1,81 @@
+"""
+Compares the latency of product detail requests counting views in the
+request (PRODUCTS_VIEW_DISPATCH = "sync") and in a background thread
+("thread", see products.dispatch), with view counts persisted to the
+database on every view (flush_interval=0) to show the cost of persistence,
+or with the configured interval. Every request is a new visitor, so every
+view is counted. Product.views are restored afterwards.
+Generate a catalog first, f.e.:
+
+    python manage.py generate_catalog --parents 1000 --clear
+    python manage.py run_benchmark view_dispatch
+"""
+import random
+import time
+
+from django.core.cache import cache
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from products import counters, dispatch
+from products.models import Product
+from products.stats import summarize
+
+
+def browse(urls):
+    latency = []
+    for i, url in enumerate(urls):
+        client = Client(HTTP_USER_AGENT="visitor %s" % i)
+        start = time.perf_counter()
+        response = client.get(url)
+        latency.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise ValueError("%s returned %s" % (url, response.status_code))
+
+    return latency
+
+
+def run(iterations=None, seed=0, flush_interval=0, **options):
+    """
+    Requests 'iterations' (200 by default) random products per mode.
+    """
+    requests = iterations or 200
+    rng = random.Random(seed)
+    products = list(Product.objects.only("pk", "slug", "views")[:1000])
+    if not products:
+        raise ValueError("The benchmark needs a catalog, run 'generate_catalog' first.")
+    urls = [reverse("product_detail", args=[rng.choice(products).slug]) for _ in range(requests)]
+
+    try:
+        setup_test_environment()
+        teardown = True
+    except RuntimeError:
+        # already set up, f.e. when run from tests
+        teardown = False
+
+    results = {"requests": requests, "flush_interval": flush_interval}
+    try:
+        stats = dispatch.view_queue.stats.copy()
+        for mode in ["sync", "thread"]:
+            cache.clear()
+            with override_settings(
+                PRODUCTS_VIEW_DISPATCH=mode,
+                PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=flush_interval,
+                PRODUCTS_VIEW_COUNTS_FLUSH_IN_REQUEST=True,
+            ):
+                latency = browse(urls)
+                start = time.perf_counter()
+                dispatch.view_queue.flush(timeout=60)
+                results[mode] = {
+                    "latency_ms": summarize(latency),
+                    "flush_seconds": round(time.perf_counter() - start, 4),
+                }
+        results["thread"]["queue"] = dict(dispatch.view_queue.stats - stats)
+    finally:
+        counters.view_counter.drain()
+        Product.objects.bulk_update(products, ["views"])
+        if teardown:
+            teardown_test_environment()
+
+    return results
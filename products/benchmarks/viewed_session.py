@@ -0,0 +1,105 @@
+"""
+Compares the cost of recording a product view in a session with 500
+viewed products (see viewed.SessionBackend) with the previous
+implementation, which stored time stamps as strings and parsed all of
+them on every view. Reports calls per second, how many calls marked the
+session as modified and the size of the encoded session data.
+No database is needed.
+"""
+import datetime
+from importlib import import_module
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from products import viewed
+from products.benchmarks import measure
+from products.models import Product
+
+VIEWED = viewed.VIEWED
+
+
+def legacy_delete_redundant_data(session):
+    if not session.get(VIEWED):
+        return
+
+    current_time = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    session[VIEWED] = {
+        product_id: last_viewed for product_id, last_viewed in session[VIEWED].items()
+        if parse_datetime(current_time) - parse_datetime(last_viewed) < timezone.timedelta(hours=1)
+    }
+    session.modified = True
+
+
+def legacy_add_to_viewed(session, product):
+    legacy_delete_redundant_data(session)
+    if not session.get(VIEWED):
+        session[VIEWED] = {}
+
+    pk = str(product.pk)
+    if session[VIEWED].get(pk):
+        return False
+
+    session[VIEWED][pk] = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+    session.modified = True
+
+    return True
+
+
+def get_sessions(count, entries, expired, legacy):
+    """
+    Returns 'count' sessions with 'entries' viewed products (pks 1 to entries),
+    viewed in the last hour except for the first 'expired' ones.
+    """
+    store = import_module(settings.SESSION_ENGINE).SessionStore
+    now = timezone.now()
+    times = [
+        now - datetime.timedelta(seconds=3700 if i < expired else 3000 - i * 5)
+        for i in range(entries)
+    ]
+    if legacy:
+        values = [time.strftime('%Y-%m-%d %H:%M:%S') for time in times]
+    else:
+        values = [int(time.timestamp()) for time in times]
+
+    sessions = []
+    for _ in range(count):
+        session = store()
+        session[VIEWED] = {str(pk): value for pk, value in enumerate(values, start=1)}
+        session.modified = False
+        sessions.append(session)
+
+    return sessions
+
+
+def run(iterations=None, entries=500, **options):
+    """
+    Records 'iterations' (2000 by default) views of each scenario
+    per implementation.
+    """
+    iterations = iterations or 2000
+    backend = viewed.SessionBackend()
+    implementations = {
+        "legacy": (True, lambda session, product: legacy_add_to_viewed(session, product)),
+        "epochs": (False, lambda session, product: backend.add(None, session, product)),
+    }
+    scenarios = {
+        # a product viewed before, nothing expired
+        "revisit": (Product(pk=entries), 0),
+        "new_product": (Product(pk=entries + 1), 0),
+        "new_product_10_percent_expired": (Product(pk=entries + 1), entries // 10),
+    }
+
+    results = {"entries": entries}
+    for scenario, (product, expired) in scenarios.items():
+        results[scenario] = {}
+        for name, (legacy, add) in implementations.items():
+            sessions = get_sessions(iterations, entries, expired, legacy)
+            remaining = iter(sessions)
+            result = measure(lambda: add(next(remaining), product), iterations)
+            result["modified"] = sum(session.modified for session in sessions)
+            result["session_bytes"] = len(sessions[0].encode(sessions[0]._session))
+            results[scenario][name] = result
+
+    return results
@@ -0,0 +1,120 @@
+"""
+Drives ProductList, ProductByCategoryList and ProductDetail through
+the test client (rendering the project's templates) and reports latency,
+number of queries and memory allocated per request.
+Generate a catalog first, f.e.:
+
+    python manage.py generate_catalog --parents 10000 --clear
+    python manage.py run_benchmark views --output results.json
+"""
+import random
+import time
+import tracemalloc
+
+import django
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from products.models import Category, Product
+from products.stats import summarize
+
+
+def get_urls(requests, rng):
+    """
+    Returns URLs to request for each benchmarked view.
+    """
+    categories = list(Category.objects.all())
+    products = list(Product.objects.values_list("slug", flat=True))
+    if not categories or not products:
+        raise ValueError("The benchmark needs a catalog, run 'generate_catalog' first.")
+
+    list_params = ["", "?order_by=price_ascending", "?order_by=newest", "?page=2", "?disc_price=1"]
+
+    return {
+        "product_list": [
+            reverse("product_list") + rng.choice(list_params) for _ in range(requests)
+        ],
+        "product_by_category_list": [
+            rng.choice(categories).get_absolute_url() for _ in range(requests)
+        ],
+        "product_detail": [
+            reverse("product_detail", args=[rng.choice(products)]) for _ in range(requests)
+        ],
+    }
+
+
+def measure_request(client, url):
+    """
+    Returns latency in ms and number of queries of a request.
+    """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - start
+
+    if response.status_code != 200:
+        raise ValueError("%s returned %s" % (url, response.status_code))
+
+    return elapsed * 1000, len(queries)
+
+
+def measure_memory(client, url):
+    """
+    Returns peak memory in KB allocated during a request. Measured
+    separately, since tracing allocations slows the request down.
+    """
+    tracemalloc.start()
+    client.get(url)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak / 1024
+
+
+def run(iterations=None, seed=0, warmup=5, memory_samples=20, **options):
+    requests = iterations or 200
+    rng = random.Random(seed)
+    urls = get_urls(requests, rng)
+    client = Client()
+    results = {
+        "meta": {
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "products": Product.objects.count(),
+            "categories": Category.objects.count(),
+            "requests": requests,
+        },
+    }
+
+    # allows the test client's host and instruments template rendering
+    try:
+        setup_test_environment()
+        teardown = True
+    except RuntimeError:
+        # already set up, f.e. when run from tests
+        teardown = False
+
+    try:
+        for view, view_urls in urls.items():
+            for url in view_urls[:warmup]:
+                client.get(url)
+
+            latency, queries = [], []
+            for url in view_urls:
+                ms, query_count = measure_request(client, url)
+                latency.append(ms)
+                queries.append(query_count)
+            memory = [measure_memory(client, url) for url in view_urls[:memory_samples]]
+
+            results[view] = {
+                "latency_ms": summarize(latency),
+                "queries": summarize(queries, digits=1),
+                "peak_memory_kb": summarize(memory, digits=1),
+            }
+    finally:
+        if teardown:
+            teardown_test_environment()
+
+    return results
@@ -0,0 +1,107 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from products.instrumentation import record_cache_access
+
+CATALOG_VERSION_KEY = "products:catalog_version"
+CATEGORY_TREE_VERSION_KEY = "products:category_tree_version"
+AUTOCOMPLETE_VERSION_KEY = "products:autocomplete_version"
+
+
+def _initial_version():
+    # versions start from the current time, so that a version evicted
+    # from the cache never starts over from a value used before
+    # (processes keep data versioned in memory, see category_tree)
+    return int(time.time() * 1000)
+
+
+def get_catalog_version(key=CATALOG_VERSION_KEY):
+    version = cache.get(key)
+    if version is None:
+        initial = _initial_version()
+        cache.add(key, initial, None)
+        version = cache.get(key, initial)
+
+    return version
+
+
+def bump_catalog_version(key=CATALOG_VERSION_KEY):
+    """
+    Invalidates all data cached with get_or_set_versioned
+    (or other data versioned with the given key).
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+        return cache.incr(key)
+
+
+def bump_catalog_version_on_commit(key=CATALOG_VERSION_KEY, using=None):
+    """
+    Bumps the version once the current transaction commits (right away
+    outside of a transaction). Bumped earlier, concurrent readers could
+    cache rows read before the commit under the new version, where
+    they would be served until the next write.
+    """
+    transaction.on_commit(lambda: bump_catalog_version(key), using=using)
+
+
+def get_or_set_versioned(key, default, timeout=None):
+    """
+    Returns a value cached under key for the current catalog version.
+    If it is missing or was built for an older version, it's built
+    by calling default() and cached.
+    The value is stored together with the version it was built for,
+    so both are read with one cache round trip.
+    """
+    entries = cache.get_many([CATALOG_VERSION_KEY, key])
+    version = entries.get(CATALOG_VERSION_KEY) or get_catalog_version()
+
+    if key in entries:
+        cached_version, value = entries[key]
+        if cached_version == version:
+            record_cache_access(hit=True)
+            return value
+
+    record_cache_access(hit=False)
+    value = default()
+    cache.set(key, (version, value), timeout)
+
+    return value
+
+
+async def aget_catalog_version(key=CATALOG_VERSION_KEY):
+    """
+    The async variant of get_catalog_version().
+    """
+    version = await cache.aget(key)
+    if version is None:
+        initial = _initial_version()
+        await cache.aadd(key, initial, None)
+        version = await cache.aget(key, initial)
+
+    return version
+
+
+async def aget_or_set_versioned(key, default, timeout=None):
+    """
+    The async variant of get_or_set_versioned(),
+    default is an async function.
+    """
+    entries = await cache.aget_many([CATALOG_VERSION_KEY, key])
+    version = entries.get(CATALOG_VERSION_KEY) or await aget_catalog_version()
+
+    if key in entries:
+        cached_version, value = entries[key]
+        if cached_version == version:
+            record_cache_access(hit=True)
+            return value
+
+    record_cache_access(hit=False)
+    value = await default()
+    await cache.aset(key, (version, value), timeout)
+
+    return value
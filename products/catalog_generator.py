@@ -0,0 +1,155 @@
+import random
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from products import caching
+from products.models import (
+    Category, Color, Image, ParentProduct, Product, Size, SizeGroup, Stock
+)
+
+
+def build_category_tree(depth, children, tree_id=1, prefix="Category"):
+    """
+    Returns unsaved Category instances of a full tree with
+    the given depth and number of children of each node,
+    with paths and MPTT fields (tree_id, lft, rght, level) already set,
+    so that they can be bulk created in this order.
+    """
+    categories = []
+    counter = [0]
+
+    def add(parent, level, name):
+        path_crumb = slugify(name)
+        category = Category(
+            name=name,
+            path_crumb=path_crumb,
+            path="%s/%s" % (parent.path, path_crumb) if parent else path_crumb,
+            parent=parent,
+            tree_id=tree_id,
+            level=level,
+            lft=counter[0] + 1,
+        )
+        counter[0] += 1
+        categories.append(category)
+        if level + 1 < depth:
+            for i in range(children):
+                add(category, level + 1, "%s-%s" % (name, i + 1))
+        counter[0] += 1
+        category.rght = counter[0]
+
+    add(None, 0, "%s %s" % (prefix, tree_id))
+
+    return categories
+
+
+@transaction.atomic
+def generate_catalog(
+        parents=1000,
+        variants=3,
+        colors=12,
+        size_groups=2,
+        sizes_per_group=8,
+        root_categories=4,
+        category_depth=3,
+        category_children=4,
+        images=2,
+        out_of_stock_ratio=0.3,
+        seed=0,
+        batch_size=1000,
+):
+    """
+    Generates a synthetic catalog with bulk inserts. The same arguments
+    always generate the same catalog, so benchmark results can be compared.
+    Each ParentProduct gets 'variants' Products, each Product gets a Stock row
+    for every size of a random SizeGroup and 'images' Images (only paths,
+    no files are created). Products are assigned to leaf categories of
+    'root_categories' trees.
+    Returns numbers of created objects.
+    """
+    rng = random.Random(seed)
+
+    color_objs = Color.objects.bulk_create([
+        Color(name="Color %s" % i, hex_code="#%06x" % (i * 0xfff % 0xffffff))
+        for i in range(colors)
+    ])
+    group_objs = SizeGroup.objects.bulk_create([
+        SizeGroup(name="Size group %s" % i) for i in range(size_groups)
+    ])
+    size_objs = Size.objects.bulk_create([
+        Size(name="S%s-%s" % (g, i), group=group)
+        for g, group in enumerate(group_objs) for i in range(sizes_per_group)
+    ])
+    sizes_by_group = {}
+    for size in size_objs:
+        sizes_by_group.setdefault(size.group_id, []).append(size)
+
+    last_tree_id = Category.objects.order_by("-tree_id").values_list("tree_id", flat=True).first() or 0
+    category_objs = []
+    for i in range(root_categories):
+        category_objs += build_category_tree(
+            category_depth, category_children, tree_id=last_tree_id + i + 1
+        )
+    # parents have to be saved before their children
+    for level in range(category_depth):
+        Category.objects.bulk_create(
+            [category for category in category_objs if category.level == level],
+            batch_size=batch_size,
+        )
+    leaves = [category for category in category_objs if category.rght == category.lft + 1]
+    # bulk_create sends no signals, the category tree of this process
+    # is rebuilt right away (for search documents of the products),
+    # trees and cached data of other processes once it is committed
+    caching.bump_catalog_version(caching.CATEGORY_TREE_VERSION_KEY)
+    caching.bump_catalog_version_on_commit(caching.CATEGORY_TREE_VERSION_KEY)
+    caching.bump_catalog_version_on_commit()
+
+    parent_objs = ParentProduct.objects.bulk_create([
+        ParentProduct(
+            name="Product %s" % i,
+            category=rng.choice(leaves),
+            description="Description of product %s." % i,
+            fabric_info="100% cotton",
+        )
+        for i in range(parents)
+    ], batch_size=batch_size)
+
+    product_objs = []
+    for parent in parent_objs:
+        for i in range(variants):
+            style = "style %s" % i
+            price = rng.randint(20, 500)
+            product_objs.append(Product(
+                parent=parent,
+                style=style,
+                slug=slugify("%s %s" % (parent.name, style)),
+                color=rng.choice(color_objs),
+                price=price,
+                discounted_price=rng.choice([None, None, None, price * 4 // 5]),
+                views=rng.randint(0, 10000),
+                main_image_url="products/generated/%s-%s.jpg" % (parent.pk, i),
+            ))
+    product_objs = Product.objects.bulk_create(product_objs, batch_size=batch_size)
+
+    Image.objects.bulk_create([
+        Image(product=product, url="products/generated/%s-%s.jpg" % (product.slug, i))
+        for product in product_objs for i in range(images)
+    ], batch_size=batch_size)
+
+    stock_objs = []
+    for product in product_objs:
+        for size in sizes_by_group[rng.choice(group_objs).pk]:
+            quantity = 0 if rng.random() < out_of_stock_ratio else rng.randint(1, 20)
+            stock_objs.append(Stock(product=product, size=size, quantity=quantity))
+    Stock.objects.bulk_create(stock_objs, batch_size=batch_size)
+
+    return {
+        "colors": len(color_objs),
+        "size_groups": len(group_objs),
+        "sizes": len(size_objs),
+        "categories": len(category_objs),
+        "parent_products": len(parent_objs),
+        "products": len(product_objs),
+        "images": len(product_objs) * images,
+        "stock": len(stock_objs),
+    }
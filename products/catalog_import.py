@@ -0,0 +1,275 @@
+"""
+Bulk import of the catalog from a JSONL feed, one parent product per line:
+
+    {"name": "Linen dress", "category": "dresses/summer-dresses",
+     "description": "...", "fabric_info": "...", "sizes_info": "...",
+     "variants": [{"style": "Roses", "color": "red", "price": "109.00",
+                   "discounted_price": "69.00",
+                   "main_image_url": "products/linen-dress-roses.jpg",
+                   "images": ["products/linen-dress-roses-1.jpg"],
+                   "stock": {"36": 5, "38": 0}}]}
+
+Categories are referenced by path, colors and sizes by name, they have
+to exist. Parent products are matched by name and variants by parent
+and style, so re-running an import only writes what changed (images are
+only added). Lines are processed in chunks, each one in a transaction,
+with bulk queries only: slugs, effective prices, category ranges and search
+documents of new variants are computed in Python (see
+ProductQuerySet.bulk_create). No signals are sent, the cached catalog
+data is invalidated once at the end (also when a chunk failed, for the
+chunks written before), when the transaction of the caller commits.
+"""
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from products import caching
+from products.category_tree import get_category_tree
+from products.models import Color, Image, ParentProduct, Product, Size, Stock
+from products.stock_import import read_rows
+
+PARENT_FIELDS = ["category", "description", "fabric_info", "sizes_info"]
+VARIANT_FIELDS = ["color", "price", "discounted_price", "main_image_url"]
+
+
+class CatalogImportResult:
+    """
+    Numbers of created and updated objects and errors (line, message)
+    of skipped lines.
+    """
+    def __init__(self):
+        self.counts = dict.fromkeys([
+            "parents_created", "parents_updated", "products_created",
+            "products_updated", "stock_updated", "images_created",
+        ], 0)
+        self.errors = []
+
+    def as_dict(self):
+        return {**self.counts, "skipped": len(self.errors)}
+
+
+def clean(model, field, value):
+    return model._meta.get_field(field).clean(value, None)
+
+
+def parse_variant(variant, colors, sizes):
+    """
+    Returns style, field values, image urls and stock (size pk: quantity)
+    of a variant of the feed.
+    """
+    if not isinstance(variant, dict):
+        raise ValidationError("Malformed variant.")
+    color = variant.get("color")
+    if color is not None and color not in colors:
+        raise ValidationError("Unknown color: %s." % color)
+    stock = variant.get("stock") or {}
+    if not isinstance(stock, dict):
+        raise ValidationError("Malformed stock.")
+    unknown_sizes = set(stock) - set(sizes)
+    if unknown_sizes:
+        raise ValidationError("Unknown sizes: %s." % ", ".join(sorted(unknown_sizes)))
+
+    values = {
+        "color_id": colors.get(color),
+        "price": clean(Product, "price", variant.get("price")),
+        "discounted_price": clean(Product, "discounted_price", variant.get("discounted_price")),
+        "main_image_url": clean(Product, "main_image_url", variant.get("main_image_url")),
+    }
+
+    return (
+        clean(Product, "style", variant.get("style")),
+        values,
+        [clean(Image, "url", url) for url in variant.get("images") or []],
+        {sizes[size]: clean(Stock, "quantity", quantity) for size, quantity in stock.items()},
+    )
+
+
+def parse_parent(row, category_tree, colors, sizes):
+    """
+    Returns the name, field values and variants (by style, see parse_variant)
+    of a line of the feed. Raises ValidationError if it's invalid.
+    """
+    if row is None:
+        raise ValidationError("Malformed line.")
+    category = None
+    if row.get("category"):
+        category = category_tree.resolve(row["category"])
+        if category is None:
+            raise ValidationError("Unknown category: %s." % row["category"])
+
+    values = {
+        "category_id": category.pk if category else None,
+        "description": row.get("description"),
+        "fabric_info": row.get("fabric_info"),
+        "sizes_info": row.get("sizes_info"),
+    }
+    variants = {}
+    for i, variant in enumerate(row.get("variants") or [], start=1):
+        try:
+            style, *data = parse_variant(variant, colors, sizes)
+        except ValidationError as e:
+            raise ValidationError("Variant %s: %s" % (i, " ".join(e.messages)))
+        variants[style] = data
+
+    return clean(ParentProduct, "name", row.get("name")), values, variants
+
+
+def set_values(obj, values):
+    """
+    Sets the values on obj, returns True if any of them changed.
+    """
+    changed = False
+    for field, value in values.items():
+        if getattr(obj, field) != value:
+            setattr(obj, field, value)
+            changed = True
+
+    return changed
+
+
+def set_stock_summary(product, stock):
+    """
+    Sets the stock summary of a new Product
+    (see ProductQuerySet.refresh_stock_summary).
+    """
+    available = {size_id: quantity for size_id, quantity in stock.items() if quantity > 0}
+    product.in_stock = bool(available)
+    product.total_quantity = sum(available.values())
+    product.available_size_ids = sorted(available)
+
+
+def import_chunk(parents, result, using):
+    """
+    Writes parents (name: (values, variants), see parse_parent)
+    with bulk queries. Returns True if anything changed.
+    """
+    existing = ParentProduct.objects.using(using).in_bulk(parents, field_name="name")
+    new_parents, changed_parents = [], []
+    for name, (values, parent_variants) in parents.items():
+        parent = existing.get(name)
+        if parent is None:
+            new_parents.append(ParentProduct(name=name, **values))
+        elif set_values(parent, values):
+            changed_parents.append(parent)
+
+    ParentProduct.objects.using(using).bulk_create(new_parents)
+    if changed_parents:
+        ParentProduct.objects.using(using).bulk_update(changed_parents, PARENT_FIELDS)
+        # ParentProduct signals are not sent for bulk writes
+        products = Product.objects.using(using).filter(parent__in=changed_parents)
+        products.refresh_category_range()
+        products.refresh_search_document()
+    existing.update((parent.name, parent) for parent in new_parents)
+
+    products = {
+        (product.parent_id, product.style): product
+        for product in Product.objects.using(using).filter(parent__in=existing.values()).only(
+            "parent", "style", *VARIANT_FIELDS
+        )
+    }
+    new_products, changed_products = [], []
+    variants = []
+    for name, (parent_values, parent_variants) in parents.items():
+        parent = existing[name]
+        for style, (variant_values, images, stock) in parent_variants.items():
+            product = products.get((parent.pk, style))
+            if product is None:
+                product = Product(parent=parent, style=style, **variant_values)
+                # the whole stock of new products is known, so the stock
+                # summary is set here instead of being refreshed after
+                set_stock_summary(product, stock)
+                new_products.append(product)
+            elif set_values(product, variant_values):
+                changed_products.append(product)
+            variants.append((product, images, stock))
+
+    if new_products:
+        Product.objects.using(using).bulk_create(new_products)
+    if changed_products:
+        Product.objects.using(using).bulk_update(changed_products, VARIANT_FIELDS)
+
+    product_ids = [product.pk for product, images, stock in variants]
+    stored_stock = {
+        (product_id, size_id): quantity
+        for product_id, size_id, quantity in Stock.objects.using(using).filter(
+            product_id__in=product_ids
+        ).values_list("product_id", "size_id", "quantity")
+    }
+    stored_images = set(Image.objects.using(using).filter(
+        product_id__in=product_ids
+    ).values_list("product_id", "url"))
+    stock_objs, image_objs = [], []
+    for product, images, stock in variants:
+        for size_id, quantity in stock.items():
+            if stored_stock.get((product.pk, size_id)) != quantity:
+                stock_objs.append(Stock(product=product, size_id=size_id, quantity=quantity))
+        for url in images:
+            if (product.pk, url) not in stored_images:
+                stored_images.add((product.pk, url))
+                image_objs.append(Image(product=product, url=url))
+
+    Stock.objects.using(using).upsert_quantities(stock_objs)
+    Image.objects.using(using).bulk_create(image_objs)
+    changed_stock = {obj.product_id for obj in stock_objs} - {product.pk for product in new_products}
+    if changed_stock:
+        Product.objects.using(using).filter(pk__in=changed_stock).refresh_stock_summary()
+
+    for key, count in [
+        ("parents_created", len(new_parents)),
+        ("parents_updated", len(changed_parents)),
+        ("products_created", len(new_products)),
+        ("products_updated", len(changed_products)),
+        ("stock_updated", len(stock_objs)),
+        ("images_created", len(image_objs)),
+    ]:
+        result.counts[key] += count
+
+    return any([new_parents, changed_parents, new_products, changed_products, stock_objs, image_objs])
+
+
+def read_feed(file):
+    """
+    Yields (line number, row) of a JSONL feed, rows are None
+    for lines which could not be parsed.
+    """
+    return read_rows(file, "jsonl")
+
+
+def import_catalog(rows, batch_size=500, using=DEFAULT_DB_ALIAS):
+    """
+    Imports (line, row) pairs of a feed (see read_feed), 'batch_size'
+    parent products per transaction. Returns a CatalogImportResult.
+    """
+    result = CatalogImportResult()
+    category_tree = get_category_tree(using)
+    colors = dict(Color.objects.using(using).values_list("name", "pk"))
+    sizes = dict(Size.objects.using(using).values_list("name", "pk"))
+    changed = False
+
+    rows = iter(rows)
+    try:
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+
+            # the last line of a parent product wins
+            parents = {}
+            for line, row in chunk:
+                try:
+                    name, values, variants = parse_parent(row, category_tree, colors, sizes)
+                except ValidationError as e:
+                    result.errors.append((line, " ".join(e.messages)))
+                    continue
+                parents[name] = (values, variants)
+
+            with transaction.atomic(using=using):
+                chunk_changed = import_chunk(parents, result, using)
+            changed |= chunk_changed
+    finally:
+        # also when a later chunk failed, for the chunks written before
+        if changed:
+            caching.bump_catalog_version_on_commit(using=using)
+
+    return result
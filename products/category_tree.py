@@ -0,0 +1,96 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from products import caching
+from products.models import Category
+
+# {database alias: (version, CategoryTree)} of the current process
+_trees = {}
+
+
+class CategoryTree:
+    """
+    All categories held in memory, indexed by pk and by path,
+    so that categories can be resolved, listed and linked
+    without querying the database.
+    Categories are kept in tree order (tree_id, lft), so descendants
+    of a category are the categories directly following it.
+    """
+    def __init__(self, categories):
+        self.categories = sorted(categories, key=lambda category: (category.tree_id, category.lft))
+        self.by_pk = {category.pk: category for category in self.categories}
+        self.by_path = {category.path: category for category in self.categories}
+        self._positions = {category.pk: i for i, category in enumerate(self.categories)}
+        self._children = {}
+        for category in self.categories:
+            self._children.setdefault(category.parent_id, []).append(category)
+
+    def resolve(self, path):
+        """
+        Returns the category with the given full path
+        (f.e. "dresses/summer-dresses"), None if there is no such category.
+        """
+        return self.by_path.get(path.strip("/"))
+
+    def get_roots(self):
+        return self._children.get(None, [])
+
+    def get_children(self, category):
+        return self._children.get(category.pk, [])
+
+    def get_ancestors(self, category, include_self=False):
+        """
+        Returns ancestors of the category, starting from the root.
+        """
+        ancestors = [category] if include_self else []
+        parent = self.by_pk.get(category.parent_id)
+        while parent is not None:
+            ancestors.append(parent)
+            parent = self.by_pk.get(parent.parent_id)
+        ancestors.reverse()
+
+        return ancestors
+
+    def get_descendants(self, category, include_self=False):
+        start = self._positions[category.pk]
+        count = (category.rght - category.lft - 1) // 2
+
+        return self.categories[start if include_self else start + 1:start + 1 + count]
+
+    def get_descendant_ids(self, category, include_self=True):
+        return {descendant.pk for descendant in self.get_descendants(category, include_self)}
+
+    def get_url(self, pk):
+        """
+        Returns the URL of the category with the given pk,
+        f.e. for ParentProduct.category_id.
+        """
+        return self.by_pk[pk].get_absolute_url()
+
+
+def get_category_tree(using=DEFAULT_DB_ALIAS):
+    """
+    Returns the CategoryTree of the current process for the database
+    alias. It is built with one query and rebuilt only after categories
+    change, only the tree version is read from the cache
+    (see signals.bump_category_tree_version).
+    """
+    version = caching.get_catalog_version(caching.CATEGORY_TREE_VERSION_KEY)
+    tree = _trees.get(using)
+    if tree is None or tree[0] != version:
+        tree = (version, CategoryTree(Category.objects.using(using)))
+        _trees[using] = tree
+
+    return tree[1]
+
+
+async def aget_category_tree(using=DEFAULT_DB_ALIAS):
+    """
+    The async variant of get_category_tree().
+    """
+    version = await caching.aget_catalog_version(caching.CATEGORY_TREE_VERSION_KEY)
+    tree = _trees.get(using)
+    if tree is None or tree[0] != version:
+        tree = (version, CategoryTree([category async for category in Category.objects.using(using).aiterator()]))
+        _trees[using] = tree
+
+    return tree[1]
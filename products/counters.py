@@ -0,0 +1,177 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from products.models import Product
+
+
+class BufferedCounter:
+    """
+    Write-behind counter for model instances.
+
+    Increments are accumulated in the cache with atomic cache.incr calls,
+    so concurrent requests never overwrite each other's increments.
+    The first increment of a counter after it was drained appends its pk
+    to a journal (a sequence of numbered cache keys), which lets drain()
+    find all dirty counters without scanning the cache.
+    """
+    lock_timeout = 60
+    batch_size = 500
+
+    def __init__(self, namespace, timeout=None):
+        self.namespace = namespace
+        self.timeout = timeout
+
+    def key(self, *parts):
+        return ":".join((self.namespace, *map(str, parts)))
+
+    def _incr(self, key, delta=1):
+        try:
+            return cache.incr(key, delta)
+        except ValueError:
+            # the key does not exist yet, but another
+            # process might have just created it
+            if cache.add(key, delta, self.timeout):
+                return delta
+            return cache.incr(key, delta)
+
+    def _mark_dirty(self, pk):
+        position = self._incr(self.key("journal"))
+        cache.set(self.key("journal", position), pk, self.timeout)
+
+    def incr(self, pk, delta=1):
+        """
+        Increments the counter for pk, returns the number
+        of increments accumulated since the last drain.
+        """
+        value = self._incr(self.key("count", pk), delta)
+        if value == delta:
+            # the counter was empty, so it is not in the journal yet
+            self._mark_dirty(pk)
+
+        return value
+
+    def get(self, pk):
+        return cache.get(self.key("count", pk)) or 0
+
+    def _read_journal(self):
+        """
+        Returns pks from journal entries which were not drained yet
+        and the position of the last one.
+        """
+        head = cache.get(self.key("journal")) or 0
+        position = cache.get(self.key("journal", "drained")) or 0
+        pks = set()
+
+        while position < head:
+            positions = range(position + 1, min(position + self.batch_size, head) + 1)
+            entries = cache.get_many([self.key("journal", i) for i in positions])
+            for i in positions:
+                key = self.key("journal", i)
+                if key in entries:
+                    pks.add(entries[key])
+                elif i != cache.get(self.key("journal", "stalled")):
+                    # the position was reserved, but the pk was not written
+                    # yet, read it with the next drain. If it is still
+                    # missing by then, the entry is lost (f.e. evicted).
+                    cache.set(self.key("journal", "stalled"), i, self.timeout)
+                    return pks, position
+                position = i
+
+        return pks, position
+
+    def drain(self):
+        """
+        Resets all dirty counters and returns their values as a {pk: delta} dict.
+        Returns an empty dict if another drain is in progress.
+        """
+        lock_key = self.key("lock")
+        if not cache.add(lock_key, 1, self.lock_timeout):
+            return {}
+
+        try:
+            start = cache.get(self.key("journal", "drained")) or 0
+            pks, position = self._read_journal()
+            counts = cache.get_many([self.key("count", pk) for pk in pks])
+            deltas = {}
+
+            for pk in pks:
+                delta = counts.get(self.key("count", pk))
+                if not delta:
+                    continue
+                deltas[pk] = delta
+                remaining = cache.decr(self.key("count", pk), delta)
+                if remaining > 0:
+                    # incremented between get_many and decr, those
+                    # increments did not see an empty counter,
+                    # so they did not write to the journal
+                    self._mark_dirty(pk)
+
+            cache.set(self.key("journal", "drained"), position, self.timeout)
+            cache.delete_many([self.key("journal", i) for i in range(start + 1, position + 1)])
+        finally:
+            cache.delete(lock_key)
+
+        return deltas
+
+    def restore(self, deltas):
+        """
+        Puts drained values back, f.e. when they could not be persisted.
+        """
+        for pk, delta in deltas.items():
+            self.incr(pk, delta)
+
+
+view_counter = BufferedCounter("product_views")
+
+
+def flush_view_counts(batch_size=500):
+    """
+    Persists view counts accumulated in cache to Product.views,
+    using one UPDATE ... SET views = views + delta per batch.
+    Returns the number of flushed views.
+    """
+    deltas = view_counter.drain()
+    items = sorted(deltas.items())
+
+    try:
+        with transaction.atomic():
+            for i in range(0, len(items), batch_size):
+                batch = items[i:i + batch_size]
+                increments = Case(
+                    *[When(pk=pk, then=Value(delta)) for pk, delta in batch],
+                    default=Value(0),
+                )
+                Product.objects.filter(
+                    pk__in=[pk for pk, delta in batch]
+                ).update(views=F("views") + increments)
+    except Exception:
+        view_counter.restore(deltas)
+        raise
+
+    return sum(deltas.values())
+
+
+def maybe_flush_view_counts(in_request=False):
+    """
+    Flushes view counts if PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL
+    seconds (1 hour by default) passed since the last flush.
+    Set the interval to None to flush only with the
+    'flush_view_counts' management command.
+    Requests ('in_request') flush only with
+    PRODUCTS_VIEW_COUNTS_FLUSH_IN_REQUEST = True, by default views
+    are persisted off the request path, by the command or the thread
+    of products.dispatch.
+    """
+    if in_request and not getattr(settings, "PRODUCTS_VIEW_COUNTS_FLUSH_IN_REQUEST", False):
+        return 0
+
+    interval = getattr(settings, "PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL", 3600)
+    if interval is None:
+        return 0
+
+    if cache.add(view_counter.key("last_flush"), 1, interval):
+        return flush_view_counts()
+
+    return 0
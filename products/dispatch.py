@@ -0,0 +1,174 @@
+"""
+Counting product views off the request path.
+
+With PRODUCTS_VIEW_DISPATCH = "thread", views which should be counted
+(see signals.add_to_viewed) are put to a bounded in-process queue
+(PRODUCTS_VIEW_QUEUE_SIZE events) and counted by a daemon thread, which
+increments counters of all queued views at once and persists them
+(see counters.maybe_flush_view_counts) and folds trending scores
+(see trending.maybe_fold_trending_scores). The deduplication of views
+stays in the request, since it may change the session. The thread works
+under WSGI and ASGI alike, it is started on the first view of each
+process (f.e. after a server forked its workers).
+
+When the queue is full, PRODUCTS_VIEW_QUEUE_OVERFLOW decides what happens:
+"drop" (the default) drops the view, "block" waits up to a second for
+room (and drops it then) and "sync" counts it in the request. Queued views
+are counted before the process exits.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from products import counters, trending
+
+logger = logging.getLogger("products.dispatch")
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_OVERFLOW = "drop"
+OVERFLOW_POLICIES = ("drop", "block", "sync")
+
+
+def count_views(deltas, in_request=False):
+    """
+    Increments view counters by deltas ({product pk: views}).
+    """
+    for pk, delta in deltas.items():
+        counters.view_counter.incr(pk, delta)
+    trending.record_views(deltas)
+    counters.maybe_flush_view_counts(in_request=in_request)
+
+
+class ViewQueue:
+    """
+    A bounded queue of viewed product pks drained by a daemon thread.
+    """
+    batch_size = 500
+    # seconds
+    block_timeout = 1
+    linger = 0.05
+
+    def __init__(self, maxsize=None, overflow=None):
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.lock = threading.Lock()
+        self.queue = None
+        self.pid = None
+        self.stats = Counter()
+
+    def get_queue(self):
+        """
+        Returns the queue, starting the thread in a new process.
+        """
+        if self.pid != os.getpid():
+            with self.lock:
+                if self.pid != os.getpid():
+                    self.queue = queue.Queue(
+                        self.maxsize or getattr(settings, "PRODUCTS_VIEW_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)
+                    )
+                    threading.Thread(
+                        target=self.run,
+                        args=(self.queue,),
+                        name="product-views",
+                        daemon=True,
+                    ).start()
+                    self.pid = os.getpid()
+
+        return self.queue
+
+    def put(self, pk):
+        """
+        Queues a view of the product, or handles it
+        by the overflow policy if the queue is full.
+        """
+        overflow = self.overflow or getattr(settings, "PRODUCTS_VIEW_QUEUE_OVERFLOW", DEFAULT_OVERFLOW)
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                "Unknown overflow policy: %s, use one of: %s." % (overflow, ", ".join(OVERFLOW_POLICIES))
+            )
+
+        try:
+            self.get_queue().put(pk, block=overflow == "block", timeout=self.block_timeout)
+        except queue.Full:
+            if overflow == "sync":
+                count_views({pk: 1}, in_request=True)
+                self.record("counted_inline")
+            else:
+                self.record("dropped")
+        else:
+            self.record("queued")
+
+    def record(self, name, count=1):
+        """
+        Adds to the stats, which are updated by request threads
+        and the thread of the queue.
+        """
+        with self.lock:
+            self.stats[name] += count
+
+    def run(self, events):
+        """
+        Counts views of the queue, up to 'batch_size' at once.
+        """
+        while True:
+            deltas = Counter([events.get()])
+            # collects views for a moment, so that busy processes
+            # count (and persist) them in fewer batches
+            deadline = time.monotonic() + self.linger
+            try:
+                for _ in range(self.batch_size - 1):
+                    deltas[events.get(timeout=max(0, deadline - time.monotonic()))] += 1
+            except queue.Empty:
+                pass
+
+            count = sum(deltas.values())
+            # the thread's connection is not closed by request_finished,
+            # broken or expired ones (f.e. after a database restart)
+            # are replaced like in requests
+            close_old_connections()
+            try:
+                count_views(deltas)
+                self.record("counted", count)
+            except Exception:
+                logger.exception("Could not count %s product views.", count)
+                self.record("failed", count)
+            try:
+                # off the request path, since folding takes seconds
+                # for large catalogs
+                trending.maybe_fold_trending_scores()
+            except Exception:
+                logger.exception("Could not fold trending scores.")
+            finally:
+                close_old_connections()
+                for _ in range(count):
+                    events.task_done()
+
+    def flush(self, timeout=5):
+        """
+        Waits up to 'timeout' seconds until queued views are counted,
+        returns False if some of them are not counted yet.
+        """
+        if self.pid != os.getpid():
+            return True
+
+        deadline = time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+
+        return True
+
+
+view_queue = ViewQueue()
+atexit.register(view_queue.flush)
+
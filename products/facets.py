@@ -0,0 +1,177 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+
+from products import caching, search
+from products.models import Category, Color, Product, SizeGroup, Stock
+
+FILTER_OPTIONS_KEY = "products:filter_options"
+FACET_COUNTS_KEY = "products:facet_counts:%s"
+DEFAULT_PRICE_BUCKETS = ((0, 50), (50, 100), (100, 200), (200, None))
+
+# names of ProductFilter filters which narrow each facet
+FACET_FILTERS = {
+    "colors": ("color",),
+    "sizes": ("size",),
+    "prices": ("price_gte", "price_lte"),
+}
+
+
+async def _alist(queryset):
+    # aiterator() does not support prefetch_related() before Django 5.0
+    if queryset._prefetch_related_lookups:
+        return [obj async for obj in queryset]
+
+    return [obj async for obj in queryset.aiterator()]
+
+
+def build_filter_options():
+    """
+    Returns data for the filter sidebar of product lists.
+    """
+    return {
+        "categories": list(Category.objects.filter(parent__isnull=True)),
+        "colors": list(Color.objects.all()),
+        "size_groups": list(SizeGroup.objects.prefetch_related("sizes")),
+        "max_price": Product.objects.filter(
+            in_stock=True
+        ).aggregate(Max("effective_price"))["effective_price__max"] or 99999,
+    }
+
+
+async def abuild_filter_options():
+    """
+    The async variant of build_filter_options(). Async ORM calls run
+    one after another in the thread of sync code (sync_to_async with
+    thread_sensitive=True), so the queries are awaited in turn.
+    """
+    categories = await _alist(Category.objects.filter(parent__isnull=True))
+    colors = await _alist(Color.objects.all())
+    size_groups = await _alist(SizeGroup.objects.prefetch_related("sizes"))
+    max_price = await Product.objects.filter(in_stock=True).aaggregate(Max("effective_price"))
+
+    return {
+        "categories": categories,
+        "colors": colors,
+        "size_groups": size_groups,
+        "max_price": max_price["effective_price__max"] or 99999,
+    }
+
+
+def get_filter_options():
+    """
+    Returns cached data for the filter sidebar. The cache is invalidated
+    whenever any of the models it is built from changes
+    (see signals.bump_catalog_version).
+    """
+    return caching.get_or_set_versioned(FILTER_OPTIONS_KEY, build_filter_options)
+
+
+async def aget_filter_options():
+    return await caching.aget_or_set_versioned(FILTER_OPTIONS_KEY, abuild_filter_options)
+
+
+def get_price_buckets():
+    """
+    Returns (min, max) price ranges, min inclusive and max exclusive,
+    None for no upper limit. Configurable with PRODUCTS_PRICE_BUCKETS.
+    """
+    return getattr(settings, "PRODUCTS_PRICE_BUCKETS", DEFAULT_PRICE_BUCKETS)
+
+
+def get_facet_queries(product_filter, category=None, query=None):
+    """
+    Returns querysets of counts of colors and sizes, and the queryset
+    and aggregates of price buckets, see count_facets.
+    """
+    products = Product.objects.filter(in_stock=True)
+    if category is not None:
+        products = products.in_category(category)
+    if query is not None:
+        products = search.match(products, query)
+
+    def narrowed(facet):
+        return products.filter(product_filter.get_Q(exclude=FACET_FILTERS[facet]))
+
+    colors = narrowed("colors").exclude(
+        color__isnull=True
+    ).values("color").annotate(count=Count("pk")).order_by()
+
+    sizes = Stock.objects.filter(
+        quantity__gt=0,
+        product__in=narrowed("sizes"),
+    ).values("size").annotate(count=Count("product", distinct=True)).order_by()
+
+    prices = {
+        "bucket_%s" % i: Count("pk", filter=Q(
+            Q(effective_price__gte=price_min),
+            Q(effective_price__lt=price_max) if price_max is not None else Q(),
+        ))
+        for i, (price_min, price_max) in enumerate(get_price_buckets())
+    }
+
+    return colors, sizes, narrowed("prices"), prices
+
+
+def get_facets(colors, sizes, prices):
+    return {
+        "colors": {row["color"]: row["count"] for row in colors},
+        "sizes": {row["size"]: row["count"] for row in sizes},
+        "prices": [
+            {"min": price_min, "max": price_max, "count": prices["bucket_%s" % i]}
+            for i, (price_min, price_max) in enumerate(get_price_buckets())
+        ],
+    }
+
+
+def count_facets(product_filter, category=None, query=None):
+    """
+    Returns numbers of available Products per color, size and price bucket,
+    of the category and of products matching the search query, if given.
+    Counts of each facet take into account all applied filters except
+    for the facet's own ones, so f.e. selecting 'red' does not turn
+    the count of 'blue' to zero.
+    Runs one grouped query per facet.
+    """
+    colors, sizes, prices, aggregates = get_facet_queries(product_filter, category, query)
+
+    return get_facets(colors, sizes, prices.aggregate(**aggregates))
+
+
+async def acount_facets(product_filter, category=None, query=None):
+    """
+    The async variant of count_facets(), the queries are awaited in turn
+    (see abuild_filter_options).
+    """
+    colors, sizes, prices, aggregates = get_facet_queries(product_filter, category, query)
+
+    return get_facets(await _alist(colors), await _alist(sizes), await prices.aaggregate(**aggregates))
+
+
+def get_facet_counts_key(product_filter, category=None, query=None):
+    key = "%s:%s" % (getattr(category, "pk", ""), product_filter.get_key())
+    if query is not None:
+        # queries with the same words have the same results
+        key += ":" + " ".join(search.tokenize(query))
+    return FACET_COUNTS_KEY % hashlib.md5(key.encode()).hexdigest()
+
+
+def get_facet_counts(product_filter, category=None, query=None):
+    """
+    Returns cached facet counts (see count_facets) for the given
+    filter parameters, category and search query.
+    """
+    return caching.get_or_set_versioned(
+        get_facet_counts_key(product_filter, category, query),
+        lambda: count_facets(product_filter, category, query),
+        timeout=getattr(settings, "PRODUCTS_FACET_COUNTS_TIMEOUT", 3600),
+    )
+
+
+async def aget_facet_counts(product_filter, category=None, query=None):
+    return await caching.aget_or_set_versioned(
+        get_facet_counts_key(product_filter, category, query),
+        lambda: acount_facets(product_filter, category, query),
+        timeout=getattr(settings, "PRODUCTS_FACET_COUNTS_TIMEOUT", 3600),
+    )
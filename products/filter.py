@@ -1,14 +1,20 @@
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
+
+from products.models import Stock
 
 
 class ProductFilter:
     def __init__(self, **kwargs):
-        self._q = Q()
+        # Q objects of applied filters, by parameter name
+        self._filters = {}
+        self._params = {}
 
         for k, v in kwargs.items():
             v = self.validate(v)
             if hasattr(self, "set_%s_filter" % k) and v:
                 getattr(self, "set_%s_filter" % k)(v)
+                if k in self._filters:
+                    self._params[k] = sorted(v)
 
     @staticmethod
     def validate(param_values: list[str]):
@@ -18,33 +24,51 @@ class ProductFilter:
             return
 
     def set_price_gte_filter(self, price: list[int]):
-        self._q &= (
-                (Q(price__gte=price[0]) & Q(discounted_price__isnull=True)) |
-                Q(discounted_price__gte=price[0])
-        )
+        self._filters["price_gte"] = Q(effective_price__gte=price[0])
 
     def set_price_lte_filter(self, price: list[int]):
-        self._q &= (
-                (Q(price__lte=price[0]) & Q(discounted_price__isnull=True)) |
-                Q(discounted_price__lte=price[0])
-        )
+        self._filters["price_lte"] = Q(effective_price__lte=price[0])
 
     def set_disc_price_filter(self, disc_price: list[int]):
         if disc_price[0] == 1:
-            self._q &= Q(discounted_price__isnull=False)
+            self._filters["disc_price"] = Q(discounted_price__isnull=False)
 
     def set_color_filter(self, color: list[int]):
         if len(color) > 1:
-            self._q &= Q(color__in=color)
+            self._filters["color"] = Q(color__in=color)
         else:
-            self._q &= Q(color=color[0])
+            self._filters["color"] = Q(color=color[0])
 
     def set_size_filter(self, size: list[str]):
+        # filter through a correlated EXISTS instead of joining Stock,
+        # so that the result does not contain duplicates, and instead of
+        # an IN list of products, so that products are still read in the
+        # order of an ordering index (stock is looked up by product and size)
         if len(size) > 1:
-            q = Q(stock__size__in=size)
+            q = Q(size__in=size)
         else:
-            q = Q(stock__size=size[0])
-        self._q &= q & Q(stock__quantity__gt=0)
+            q = Q(size=size[0])
+        stock = Stock.objects.filter(q, product=OuterRef("pk"), quantity__gt=0)
+        self._filters["size"] = Exists(stock)
 
-    def get_Q(self):
-        return self._q
+    def get_Q(self, exclude=()):
+        """
+        Returns a Q object combining all applied filters,
+        except for filters with names listed in 'exclude'.
+        """
+        q = Q()
+        for name, filter_q in self._filters.items():
+            if name not in exclude:
+                q &= filter_q
+
+        return q
+
+    def get_key(self):
+        """
+        Returns a string which is the same for all
+        filters with the same applied parameters.
+        """
+        return "&".join(
+            "%s=%s" % (name, ",".join(map(str, values)))
+            for name, values in sorted(self._params.items())
+        )
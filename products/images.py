@@ -0,0 +1,245 @@
+"""
+Resized copies (renditions) of product images for responsive images.
+
+Every image (Product.main_image_url, Image.url) gets a rendition in each
+of PRODUCTS_IMAGE_FORMATS (WebP and JPEG by default) for each width of
+PRODUCTS_IMAGE_WIDTHS narrower than the image (or one in the original
+width, if the image is narrower than all of them). Renditions are stored
+next to the image ("products/renditions/dress.jpg-320.webp"), their paths
+and sizes in a JSON field of the model:
+
+    {"source": "products/dress.jpg",
+     "renditions": [{"format": "webp", "width": 320, "height": 400,
+                     "path": "products/renditions/dress.jpg-320.webp"}, ...]}
+
+so that templates build srcset attributes without accessing the storage
+(see the product_images template tags). Uploaded images are queued
+(see products.jobs) and processed by the 'process_image_jobs' worker,
+existing images are processed with the 'generate_renditions' management
+command. Both resize images in a pool of processes.
+"""
+import io
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+from products.models import Image, Product
+
+DEFAULT_WIDTHS = [320, 640, 960, 1280]
+DEFAULT_FORMATS = ["webp", "jpeg"]
+DEFAULT_QUALITY = 80
+
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+CONTENT_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+# model: (image field, renditions field)
+IMAGE_FIELDS = {
+    Product: ("main_image_url", "main_image_renditions"),
+    Image: ("url", "renditions"),
+}
+
+
+def get_options():
+    """
+    Returns widths, formats and quality of renditions from settings.
+    """
+    return (
+        sorted(getattr(settings, "PRODUCTS_IMAGE_WIDTHS", DEFAULT_WIDTHS)),
+        list(getattr(settings, "PRODUCTS_IMAGE_FORMATS", DEFAULT_FORMATS)),
+        getattr(settings, "PRODUCTS_IMAGE_QUALITY", DEFAULT_QUALITY),
+    )
+
+
+def render(data, widths, formats, quality):
+    """
+    Returns (format, width, height, bytes) of renditions of the image data.
+    It does not use Django, so that it runs in worker processes.
+    """
+    with PILImage.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        image.load()
+
+    renditions = []
+    for width in [width for width in widths if width < image.width] or [image.width]:
+        height = max(1, round(image.height * width / image.width))
+        # reducing_gap downscales with a fast reduce() first
+        resized = image.resize((width, height), PILImage.LANCZOS, reducing_gap=3.0)
+        for format in formats:
+            mode = "RGB" if format == "jpeg" or "A" not in resized.getbands() else "RGBA"
+            output = io.BytesIO()
+            resized.convert(mode).save(output, format.upper(), quality=quality)
+            renditions.append((format, width, height, output.getvalue()))
+
+    return renditions
+
+
+def safe_render(args):
+    """
+    Calls render() with the args, returns None if the image can't be decoded.
+    """
+    try:
+        return render(*args)
+    except (OSError, ValueError, PILImage.DecompressionBombError):
+        return None
+
+
+def rendition_path(name, width, format):
+    # the extension of the image is kept, so that f.e. dress.jpg
+    # and dress.png next to it don't share renditions
+    directory, filename = posixpath.split(name)
+
+    return posixpath.join(directory, "renditions", "%s-%s.%s" % (filename, width, EXTENSIONS[format]))
+
+
+def save_renditions(name, rendered, storage=None):
+    """
+    Saves rendered renditions (see render) of the image with the given
+    name, replacing existing files. Returns the data of its JSON field.
+    """
+    storage = storage or default_storage
+    renditions = []
+    for format, width, height, data in rendered:
+        path = rendition_path(name, width, format)
+        if storage.exists(path):
+            storage.delete(path)
+        renditions.append({
+            "format": format,
+            "width": width,
+            "height": height,
+            "path": storage.save(path, ContentFile(data)),
+        })
+
+    return {"source": name, "renditions": renditions}
+
+
+def read(name, storage):
+    try:
+        with storage.open(name, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def render_many(files, executor=None, storage=None):
+    """
+    Generates renditions of (name, data) pairs of image files, resizing them
+    with the executor (f.e. a ProcessPoolExecutor) or in this process,
+    renditions are saved in this process. Yields (name, data of the JSON field
+    or None if the data is None or the image could not be decoded).
+    """
+    storage = storage or default_storage
+    widths, formats, quality = get_options()
+    args = [(data, widths, formats, quality) for name, data in files if data is not None]
+    rendered = executor.map(safe_render, args) if executor else map(safe_render, args)
+    for name, data in files:
+        result = next(rendered) if data is not None else None
+        yield name, save_renditions(name, result, storage) if result is not None else None
+
+
+def generate_many(names, executor=None, storage=None, chunk_size=16):
+    """
+    Generates renditions of images with the given names (see render_many),
+    'chunk_size' files are read at a time.
+    """
+    storage = storage or default_storage
+    names = list(names)
+    for i in range(0, len(names), chunk_size):
+        files = [(name, read(name, storage)) for name in names[i:i + chunk_size]]
+        yield from render_many(files, executor, storage)
+
+
+def get_executor(workers):
+    """
+    Returns a pool of 'workers' processes for generate_many(),
+    or a context manager with None if it's 1.
+    """
+    if workers > 1:
+        return ProcessPoolExecutor(max_workers=workers)
+
+    return nullcontext()
+
+
+def is_current(obj):
+    """
+    Returns True if renditions of obj (a Product or an Image)
+    were generated from its current image.
+    """
+    image_field, renditions_field = IMAGE_FIELDS[type(obj)]
+    source = (getattr(obj, renditions_field) or {}).get("source")
+
+    return source is not None and source == getattr(obj, image_field).name
+
+
+def update_renditions(objs, executor=None, storage=None):
+    """
+    Generates renditions of objs (Products or Images, not mixed)
+    and saves them with one bulk update, an image shared by more
+    objects is resized once. Returns the number of updated objects.
+    """
+    objs = [obj for obj in objs if getattr(obj, IMAGE_FIELDS[type(obj)][0]).name]
+    if not objs:
+        return 0
+
+    model = type(objs[0])
+    image_field, renditions_field = IMAGE_FIELDS[model]
+    results = dict(generate_many(
+        {getattr(obj, image_field).name for obj in objs},
+        executor=executor,
+        storage=storage,
+    ))
+    updated = []
+    for obj in objs:
+        renditions = results[getattr(obj, image_field).name]
+        if renditions is not None:
+            setattr(obj, renditions_field, renditions)
+            updated.append(obj)
+    model.objects.bulk_update(updated, [renditions_field])
+
+    return len(updated)
+
+
+def set_renditions(results):
+    """
+    Stores renditions (image name: data of the JSON field) on all
+    Products and Images with these images. Returns the number
+    of updated objects.
+    """
+    updated = 0
+    for model, (image_field, renditions_field) in IMAGE_FIELDS.items():
+        objs = list(model.objects.filter(**{"%s__in" % image_field: results}).only("pk", image_field))
+        for obj in objs:
+            setattr(obj, renditions_field, results[getattr(obj, image_field).name])
+        model.objects.bulk_update(objs, [renditions_field])
+        updated += len(objs)
+
+    return updated
+
+
+def get_renditions(obj, format=None):
+    """
+    Returns renditions of the current image of obj (a Product or an Image),
+    of the given format or all of them, ordered by width.
+    """
+    if not is_current(obj):
+        return []
+    renditions = getattr(obj, IMAGE_FIELDS[type(obj)][1])["renditions"]
+
+    return [rendition for rendition in renditions if format in (None, rendition["format"])]
+
+
+def srcset(obj, format="jpeg", storage=None):
+    """
+    Returns the srcset attribute value with renditions of obj in the format.
+    """
+    storage = storage or default_storage
+
+    return ", ".join(
+        "%s %sw" % (storage.url(rendition["path"]), rendition["width"])
+        for rendition in get_renditions(obj, format)
+    )
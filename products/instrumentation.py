@@ -0,0 +1,166 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ContextDecorator, ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger("products.instrumentation")
+
+METRICS_HEADER = "X-Products-Metrics"
+
+_current_metrics = ContextVar("products_request_metrics", default=None)
+
+
+def fingerprint(sql):
+    """
+    Returns the SQL with literal values replaced with placeholders,
+    so that queries differing only in parameters look the same.
+    """
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)", "(...)", sql)
+
+    return sql
+
+
+class RequestMetrics:
+    """
+    Database and cache usage recorded while handling a request.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.fingerprints = Counter()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def duplicates(self):
+        """
+        Returns {fingerprint: count} of queries executed more than once,
+        which usually means an N+1 problem.
+        """
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+    def as_dict(self):
+        return {
+            "queries": self.queries,
+            "sql_ms": round(self.sql_time * 1000, 2),
+            "duplicates": sum(count - 1 for count in self.duplicates().values()),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+        }
+
+    def as_header(self):
+        return "; ".join("%s=%s" % item for item in self.as_dict().items())
+
+    def __call__(self, execute, sql, params, many, context):
+        # a database execute wrapper, see connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+def get_current_metrics():
+    return _current_metrics.get()
+
+
+def record_cache_access(hit):
+    """
+    Records a cache hit or miss in metrics of the current request, if any.
+    """
+    metrics = _current_metrics.get()
+    if metrics is None:
+        return
+    if hit:
+        metrics.cache_hits += 1
+    else:
+        metrics.cache_misses += 1
+
+
+@contextmanager
+def collect_metrics():
+    """
+    Records queries of all database connections and cache accesses
+    (see record_cache_access) within the block.
+    """
+    metrics = RequestMetrics()
+    token = _current_metrics.set(metrics)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+class InstrumentedViewMixin:
+    """
+    Records RequestMetrics of the view when PRODUCTS_INSTRUMENTATION
+    is enabled, adds them to the response as a header and logs them.
+    Template responses are rendered within the view, so that queries
+    made by templates are recorded as well.
+    Async views are not instrumented, their queries run in other threads.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if not getattr(settings, "PRODUCTS_INSTRUMENTATION", False) or self.view_is_async:
+            return super().dispatch(request, *args, **kwargs)
+
+        with collect_metrics() as metrics:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render") and not response.is_rendered:
+                response.render()
+
+        response[METRICS_HEADER] = metrics.as_header()
+        logger.info(
+            "%s %s: %s", request.method, request.path, metrics.as_header(),
+            extra={
+                "view": self.__class__.__name__,
+                "path": request.path,
+                "metrics": metrics.as_dict(),
+                "duplicated_queries": metrics.duplicates(),
+            },
+        )
+
+        return response
+
+
+class query_budget(ContextDecorator):
+    """
+    Fails with AssertionError when the block (or the decorated function)
+    executes more than max_queries queries, listing duplicated ones.
+    Meant for tests, f.e.:
+
+        with query_budget(5):
+            self.client.get(url)
+    """
+    def __init__(self, max_queries):
+        self.max_queries = max_queries
+        self._collector = None
+        self.metrics = None
+
+    def __enter__(self):
+        self._collector = collect_metrics()
+        self.metrics = self._collector.__enter__()
+        return self.metrics
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._collector.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None and self.metrics.queries > self.max_queries:
+            duplicates = "\n".join(
+                "%sx %s" % (count, sql) for sql, count in self.metrics.duplicates().items()
+            )
+            raise AssertionError(
+                "%s queries executed, the budget is %s.\nDuplicated queries:\n%s"
+                % (self.metrics.queries, self.max_queries, duplicates or "none")
+            )
+
+        return False
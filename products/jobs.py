@@ -0,0 +1,257 @@
+"""
+Queue of image processing jobs.
+
+Uploading an image only queues generating its renditions (see
+signals.generate_uploaded_renditions), so saving an admin page with several
+images does not resize them inline. The queue is set with PRODUCTS_IMAGE_QUEUE
+(a dotted path of an ImageQueue subclass):
+
+- "products.jobs.DatabaseQueue" (the default) stores ImageJob rows in the
+  transaction of the upload, no broker is needed. They are processed by the
+  'process_image_jobs' worker (see process_jobs).
+- "products.jobs.ImmediateQueue" generates renditions right away,
+  f.e. in development.
+
+Workers claim due jobs in batches (skipping jobs locked by other workers
+where the database supports it), resize images in a process pool and store
+renditions on all products and images with the file. A file with the same
+content (and rendition options) as an already processed one reuses its
+renditions. Failed jobs are retried PRODUCTS_IMAGE_JOB_MAX_ATTEMPTS times
+in total, waiting PRODUCTS_IMAGE_JOB_BACKOFF seconds doubled after every
+attempt. Jobs running for more than PRODUCTS_IMAGE_JOB_TIMEOUT seconds
+(f.e. of a killed worker) are claimed again.
+"""
+import hashlib
+import json
+import logging
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from products import caching, images
+from products.models import ImageJob
+from products.stats import summarize
+
+logger = logging.getLogger("products.jobs")
+
+DEFAULT_QUEUE = "products.jobs.DatabaseQueue"
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BACKOFF = 30
+MAX_BACKOFF = 3600
+DEFAULT_TIMEOUT = 600
+
+STATUS_NAMES = {
+    ImageJob.PENDING: "pending",
+    ImageJob.RUNNING: "running",
+    ImageJob.DONE: "done",
+    ImageJob.FAILED: "failed",
+}
+
+
+class ImageQueue:
+    """
+    A queue of image files to generate renditions of.
+    """
+    def enqueue(self, names):
+        raise NotImplementedError
+
+
+class DatabaseQueue(ImageQueue):
+    def enqueue(self, names):
+        # files which are already pending or running are skipped
+        # (see the imagejob_active_source_unique constraint)
+        ImageJob.objects.bulk_create(
+            [ImageJob(source=name) for name in sorted(set(names))],
+            ignore_conflicts=True,
+        )
+
+
+class ImmediateQueue(ImageQueue):
+    def enqueue(self, names):
+        results = {name: data for name, data in images.generate_many(set(names)) if data is not None}
+        if images.set_renditions(results):
+            caching.bump_catalog_version_on_commit()
+
+
+def get_queue():
+    return import_string(getattr(settings, "PRODUCTS_IMAGE_QUEUE", DEFAULT_QUEUE))()
+
+
+def get_content_hash(data):
+    """
+    Returns the hash of the file data and the rendition options,
+    renditions of files with the same hash are the same.
+    """
+    content_hash = hashlib.sha256(data)
+    content_hash.update(json.dumps(images.get_options()).encode())
+
+    return content_hash.hexdigest()
+
+
+def get_backoff(attempts):
+    """
+    Returns the delay before the next attempt of a job
+    which failed 'attempts' times.
+    """
+    backoff = getattr(settings, "PRODUCTS_IMAGE_JOB_BACKOFF", DEFAULT_BACKOFF)
+
+    return timedelta(seconds=min(backoff * 2 ** (attempts - 1), MAX_BACKOFF))
+
+
+def claim_jobs(batch_size):
+    """
+    Marks up to 'batch_size' due jobs as running, returns them.
+    """
+    now = timezone.now()
+    timeout = getattr(settings, "PRODUCTS_IMAGE_JOB_TIMEOUT", DEFAULT_TIMEOUT)
+    due = (
+        Q(status=ImageJob.PENDING, run_after__lte=now)
+        | Q(status=ImageJob.RUNNING, started_at__lt=now - timedelta(seconds=timeout))
+    )
+    with transaction.atomic():
+        jobs = ImageJob.objects.filter(due).order_by("run_after", "pk")
+        if connection.features.has_select_for_update_skip_locked:
+            jobs = jobs.select_for_update(skip_locked=True)
+        pks = list(jobs.values_list("pk", flat=True)[:batch_size])
+        ImageJob.objects.filter(due, pk__in=pks).update(
+            status=ImageJob.RUNNING,
+            started_at=now,
+            attempts=F("attempts") + 1,
+        )
+
+    # without row locks another worker may have claimed some of them first
+    return list(ImageJob.objects.filter(pk__in=pks, status=ImageJob.RUNNING, started_at=now))
+
+
+def fail(job, error, now):
+    """
+    Schedules the next attempt of the job, or marks it as failed
+    after PRODUCTS_IMAGE_JOB_MAX_ATTEMPTS attempts.
+    """
+    job.error = error
+    if job.attempts >= getattr(settings, "PRODUCTS_IMAGE_JOB_MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS):
+        job.status = ImageJob.FAILED
+        job.finished_at = now
+    else:
+        job.status = ImageJob.PENDING
+        job.run_after = now + get_backoff(job.attempts)
+
+
+def process_jobs(executor=None, batch_size=50, storage=None):
+    """
+    Claims up to 'batch_size' due jobs and generates their renditions,
+    resizing images with the executor (see images.render_many).
+    Returns the processed jobs. If resizing fails, only jobs whose images
+    were not resized fail. BrokenProcessPool is raised once the jobs are
+    saved.
+    """
+    jobs = claim_jobs(batch_size)
+    if not jobs:
+        return []
+
+    storage = storage or default_storage
+    files = {job.pk: images.read(job.source, storage) for job in jobs}
+    for job in jobs:
+        job.content_hash = get_content_hash(files[job.pk]) if files[job.pk] is not None else ""
+
+    # renditions by content hash, of files processed before
+    # and of the first job of every other hash
+    renditions = dict(ImageJob.objects.filter(
+        status=ImageJob.DONE,
+        content_hash__in={job.content_hash for job in jobs},
+        result__isnull=False,
+    ).values_list("content_hash", "result"))
+    first_jobs = {}
+    for job in jobs:
+        if files[job.pk] is not None and job.content_hash not in renditions:
+            first_jobs.setdefault(job.content_hash, job)
+
+    # renditions saved before an error are kept
+    rendered = {}
+    error = None
+    try:
+        for name, data in images.render_many(
+            [(job.source, files[job.pk]) for job in first_jobs.values()],
+            executor,
+            storage,
+        ):
+            rendered[name] = data
+    except Exception as e:
+        logger.exception("Rendering images of jobs %s failed.", [job.pk for job in first_jobs.values()])
+        error = e
+    for content_hash, job in first_jobs.items():
+        if rendered.get(job.source) is not None:
+            renditions[content_hash] = rendered[job.source]
+
+    now = timezone.now()
+    for job in jobs:
+        if files[job.pk] is None:
+            fail(job, "The file could not be read.", now)
+        elif job.content_hash in renditions:
+            job.status = ImageJob.DONE
+            job.result = {**renditions[job.content_hash], "source": job.source}
+            job.error = ""
+            job.finished_at = now
+        elif first_jobs[job.content_hash].source not in rendered:
+            fail(job, repr(error), now)
+        else:
+            fail(job, "The image could not be decoded.", now)
+
+    results = {job.source: job.result for job in jobs if job.status == ImageJob.DONE}
+    with transaction.atomic():
+        updated = images.set_renditions(results)
+        ImageJob.objects.bulk_update(
+            jobs,
+            ["status", "content_hash", "result", "error", "run_after", "finished_at"],
+        )
+    if updated:
+        caching.bump_catalog_version()
+
+    for job in jobs:
+        logger.info(
+            "Image job %s %s: %s, attempt %s, %.3fs after it was queued.",
+            job.pk,
+            STATUS_NAMES[job.status],
+            job.source,
+            job.attempts,
+            (now - job.created_at).total_seconds(),
+        )
+
+    # the pool can't be used anymore (f.e. a worker was killed by the OOM
+    # killer), the caller creates a new one
+    if isinstance(error, BrokenProcessPool):
+        raise error
+
+    return jobs
+
+
+def get_stats(latency_jobs=1000):
+    """
+    Returns the queue depth (numbers of jobs by status, of due jobs and the age
+    of the oldest due job in seconds) and latencies of the last 'latency_jobs'
+    done jobs: from queueing to finishing and of processing alone, in seconds.
+    """
+    now = timezone.now()
+    counts = dict(ImageJob.objects.order_by().values_list("status").annotate(Count("pk")))
+    stats = {name: counts.get(status, 0) for status, name in STATUS_NAMES.items()}
+
+    due = ImageJob.objects.filter(status=ImageJob.PENDING, run_after__lte=now).aggregate(
+        count=Count("pk"),
+        oldest=Min("created_at"),
+    )
+    stats["due"] = due["count"]
+    stats["oldest_due_seconds"] = round((now - due["oldest"]).total_seconds(), 3) if due["oldest"] else None
+
+    done = ImageJob.objects.filter(status=ImageJob.DONE).order_by("-finished_at").values_list(
+        "created_at", "started_at", "finished_at"
+    )[:latency_jobs]
+    stats["latency"] = summarize([(finished - created).total_seconds() for created, started, finished in done])
+    stats["processing"] = summarize([(finished - started).total_seconds() for created, started, finished in done])
+
+    return stats
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from products import counters
+
+
+class Command(BaseCommand):
+    help = "Persists Product view counts accumulated in cache to the database. " \
+           "Meant to be run periodically, f.e. from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of Products updated with a single query.",
+        )
+
+    def handle(self, *args, **options):
+        views = counters.flush_view_counts(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS("Flushed %s views." % views))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from products import trending
+
+
+class Command(BaseCommand):
+    help = "Folds hourly Product view counts accumulated in cache into trending scores. " \
+           "Meant to be run hourly, f.e. from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of Products updated with a single query.",
+        )
+
+    def handle(self, *args, **options):
+        views = trending.fold_trending_scores(batch_size=options["batch_size"])
+        if views is None:
+            self.stdout.write("Nothing to fold, scores are up to date or being folded.")
+        else:
+            self.stdout.write(self.style.SUCCESS("Folded %s views." % views))
@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+
+from products.catalog_generator import generate_catalog
+from products.models import Category, Color, ParentProduct, SizeGroup, Stock
+
+
+class Command(BaseCommand):
+    help = "Generates a synthetic catalog for benchmarking. " \
+           "The same options always generate the same catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--parents", type=int, default=1000, help="Number of ParentProducts.")
+        parser.add_argument("--variants", type=int, default=3, help="Products per ParentProduct.")
+        parser.add_argument("--colors", type=int, default=12)
+        parser.add_argument("--size-groups", type=int, default=2)
+        parser.add_argument("--sizes-per-group", type=int, default=8)
+        parser.add_argument("--root-categories", type=int, default=4)
+        parser.add_argument("--category-depth", type=int, default=3)
+        parser.add_argument("--category-children", type=int, default=4)
+        parser.add_argument("--images", type=int, default=2, help="Images per Product.")
+        parser.add_argument("--out-of-stock-ratio", type=float, default=0.3)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--clear",
+            action="store_true",
+            help="Delete the existing catalog first.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options["clear"]:
+                # products and sizes are deleted with their parents and groups
+                for model in (Stock, ParentProduct, Category, Color, SizeGroup):
+                    model.objects.all().delete()
+
+            try:
+                counts = generate_catalog(
+                    parents=options["parents"],
+                    variants=options["variants"],
+                    colors=options["colors"],
+                    size_groups=options["size_groups"],
+                    sizes_per_group=options["sizes_per_group"],
+                    root_categories=options["root_categories"],
+                    category_depth=options["category_depth"],
+                    category_children=options["category_children"],
+                    images=options["images"],
+                    out_of_stock_ratio=options["out_of_stock_ratio"],
+                    seed=options["seed"],
+                )
+            except IntegrityError as e:
+                raise CommandError(
+                    "The catalog could not be generated (%s), "
+                    "use --clear to delete the existing one first." % e
+                )
+
+        self.stdout.write(json.dumps(counts, indent=2))
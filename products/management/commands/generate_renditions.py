@@ -0,0 +1,65 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand
+
+from products import caching, images
+from products.models import Image, Product
+
+
+class Command(BaseCommand):
+    help = "Generates resized WebP/JPEG renditions of product images " \
+           "(see products.images) which don't have them yet, " \
+           "resizing images in a pool of processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes, defaults to the number of CPUs.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=200,
+            help="Number of objects updated per batch.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Regenerate renditions of all images, f.e. after changing "
+                 "PRODUCTS_IMAGE_WIDTHS.",
+        )
+
+    def handle(self, *args, **options):
+        counts = {}
+        with images.get_executor(options["workers"]) as executor:
+            for model in (Product, Image):
+                name = model._meta.model_name
+                counts[name], counts["%s_failed" % name] = self.generate(model, executor, **options)
+
+        if counts["product"] or counts["image"]:
+            caching.bump_catalog_version()
+        self.stdout.write(json.dumps(counts, indent=2))
+
+    def generate(self, model, executor, batch_size, **options):
+        """
+        Generates renditions of objects of the model which don't have
+        current ones. Returns numbers of updated and failed objects.
+        """
+        image_field, renditions_field = images.IMAGE_FIELDS[model]
+        objs = model.objects.only("pk", image_field, renditions_field).order_by("pk")
+        updated = failed = 0
+
+        batch = []
+        for obj in objs.iterator(chunk_size=batch_size):
+            if options["all"] or not images.is_current(obj):
+                batch.append(obj)
+            if len(batch) == batch_size:
+                count = images.update_renditions(batch, executor)
+                updated, failed = updated + count, failed + len(batch) - count
+                batch = []
+        count = images.update_renditions(batch, executor)
+
+        return updated + count, failed + len(batch) - count
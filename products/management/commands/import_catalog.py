@@ -0,0 +1,44 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from products import catalog_import
+
+
+class Command(BaseCommand):
+    help = "Imports parent products with their variants, stock and images " \
+           "from a JSONL feed (see products.catalog_import). Re-running " \
+           "an import only writes what changed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="JSONL file, '-' for stdin.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of parent products imported per transaction.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="The database to import to.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            file = sys.stdin if path == "-" else open(path, encoding="utf-8")
+        except OSError as e:
+            raise CommandError(str(e))
+        with file:
+            result = catalog_import.import_catalog(
+                catalog_import.read_feed(file),
+                batch_size=options["batch_size"],
+                using=options["database"],
+            )
+
+        for line, message in result.errors:
+            self.stderr.write("Line %s: %s" % (line, message))
+        self.stdout.write(json.dumps(result.as_dict(), indent=2))
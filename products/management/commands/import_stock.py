@@ -0,0 +1,62 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from products import stock_import
+
+
+class Command(BaseCommand):
+    help = "Imports stock quantities (slug, size, quantity) from a CSV or JSONL file, " \
+           "creating missing Stock rows and updating changed ones in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV file with a header row or JSONL file, '-' for stdin.")
+        parser.add_argument(
+            "--format",
+            choices=stock_import.FORMATS,
+            help="Defaults to the extension of the file, required for stdin.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows processed per transaction.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="The database to import to.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report changes, do not write them.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        try:
+            format = options["format"] or stock_import.get_format(path)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        try:
+            file = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        except OSError as e:
+            raise CommandError(str(e))
+        with file:
+            result = stock_import.import_stock(
+                stock_import.read_rows(file, format),
+                batch_size=options["batch_size"],
+                using=options["database"],
+                dry_run=options["dry_run"],
+            )
+
+        if options["verbosity"] > 1:
+            for slug, size, old_quantity, quantity in result.changes:
+                self.stdout.write("%s %s: %s -> %s" % (slug, size, old_quantity, quantity))
+        for line, message in result.errors:
+            self.stderr.write("Line %s: %s" % (line, message))
+        self.stdout.write(json.dumps(result.as_dict(), indent=2))
@@ -0,0 +1,79 @@
+import json
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+
+from products import images, jobs
+
+
+class Command(BaseCommand):
+    help = "Processes queued image jobs (see products.jobs), " \
+           "resizing images in a pool of processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes, defaults to the number of CPUs.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=50,
+            help="Number of jobs claimed at a time.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Seconds to wait when no job is due.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when no job is due instead of waiting for new ones.",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Only print the queue depth and job latencies.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["stats"]:
+            try:
+                while not self.run_executor(**options):
+                    pass
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(json.dumps(jobs.get_stats(), indent=2))
+
+    def run_executor(self, workers, **options):
+        """
+        Processes jobs in a new pool of processes, returns False if the pool
+        broke (f.e. a worker was killed by the OOM killer) and has to be
+        replaced.
+        """
+        with images.get_executor(workers) as executor:
+            try:
+                self.work(executor, **options)
+            except BrokenProcessPool:
+                self.stderr.write("The process pool broke, starting a new one.")
+                return False
+
+        return True
+
+    def work(self, executor, batch_size, sleep, once, verbosity, **options):
+        while True:
+            processed = jobs.process_jobs(executor, batch_size=batch_size)
+            if verbosity > 1:
+                for job in processed:
+                    self.stdout.write("%s: %s" % (job, job.error or "ok"))
+            if not processed:
+                if once:
+                    return
+                time.sleep(sleep)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the denormalized stock summary (in_stock, total_quantity, " \
+           "available_size_ids) of all Products from their Stock rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of Products refreshed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        count = Product.objects.all().refresh_stock_summary(
+            batch_size=options["batch_size"]
+        )
+        self.stdout.write(self.style.SUCCESS("Refreshed %s products." % count))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from products import search
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Rebuilds search documents of all Products and the full-text search index."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of Products refreshed per batch.",
+        )
+        parser.add_argument(
+            "--database",
+            default=DEFAULT_DB_ALIAS,
+            help="The database to reindex.",
+        )
+
+    def handle(self, *args, **options):
+        count = Product.objects.using(options["database"]).refresh_search_document(
+            batch_size=options["batch_size"]
+        )
+        search.rebuild_index(using=options["database"])
+        self.stdout.write(self.style.SUCCESS("Reindexed %s products." % count))
@@ -0,0 +1,32 @@
+import json
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Runs a benchmark from the products.benchmarks package " \
+           "and prints its results as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", help="Name of a module in products.benchmarks, f.e. 'view_counter'.")
+        parser.add_argument("--iterations", type=int, help="Defaults to the benchmark's own default.")
+        parser.add_argument("--threads", type=int, default=4)
+        parser.add_argument("--output", help="Write the results to this file as well.")
+
+    def handle(self, *args, **options):
+        try:
+            benchmark = import_module("products.benchmarks.%s" % options["name"])
+        except ImportError:
+            raise CommandError("Unknown benchmark: %s" % options["name"])
+
+        try:
+            results = benchmark.run(**options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
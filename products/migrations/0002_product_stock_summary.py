@@ -0,0 +1,59 @@
+# Generated by Django 5.0.14 on 2026-10-17 20:35
+
+from django.db import migrations, models
+
+
+def populate_stock_summary(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    Stock = apps.get_model("products", "Stock")
+    db_alias = schema_editor.connection.alias
+
+    summary = {}
+    stock = Stock.objects.using(db_alias).filter(
+        quantity__gt=0
+    ).order_by("size_id").values_list("product_id", "size_id", "quantity")
+    for product_id, size_id, quantity in stock.iterator():
+        total_quantity, size_ids = summary.get(product_id, (0, []))
+        size_ids.append(size_id)
+        summary[product_id] = (total_quantity + quantity, size_ids)
+
+    products = [
+        Product(
+            pk=pk,
+            in_stock=total_quantity > 0,
+            total_quantity=total_quantity,
+            available_size_ids=size_ids,
+        )
+        for pk, (total_quantity, size_ids) in summary.items()
+    ]
+    Product.objects.using(db_alias).bulk_update(
+        products,
+        ["in_stock", "total_quantity", "available_size_ids"],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='available_size_ids',
+            field=models.JSONField(default=list, editable=False, verbose_name='Available sizes'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='in_stock',
+            field=models.BooleanField(db_index=True, default=False, editable=False, verbose_name='In stock'),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='total_quantity',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Total quantity'),
+        ),
+        migrations.RunPython(populate_stock_summary, migrations.RunPython.noop),
+    ]
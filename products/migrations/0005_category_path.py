@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+def populate_category_paths(apps, schema_editor):
+    Category = apps.get_model("products", "Category")
+    categories = Category.objects.using(schema_editor.connection.alias)
+    paths = {}
+    # parents come before their children in tree order
+    for category in categories.order_by("tree_id", "lft"):
+        if category.parent_id is None:
+            category.path = category.path_crumb
+        else:
+            category.path = "%s/%s" % (paths[category.parent_id], category.path_crumb)
+        paths[category.pk] = category.path
+        categories.filter(pk=category.pk).update(path=category.path)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_catalog_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_category_paths, migrations.RunPython.noop),
+    ]
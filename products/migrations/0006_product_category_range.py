@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-17 20:56
+
+from django.db import migrations, models
+
+
+def populate_category_range(apps, schema_editor):
+    Product = apps.get_model("products", "Product")
+    ParentProduct = apps.get_model("products", "ParentProduct")
+    parents = ParentProduct.objects.filter(pk=models.OuterRef("parent_id"))
+    Product.objects.using(schema_editor.connection.alias).update(
+        category_tree_id=models.Subquery(parents.values("category__tree_id")[:1]),
+        category_lft=models.Subquery(parents.values("category__lft")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_category_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='category_lft',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category_tree_id',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category_tree_id', 'category_lft'], name='product_category_range_idx'),
+        ),
+        migrations.RunPython(populate_category_range, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,109 @@
+# Generated by Django 5.0.14 on 2026-10-17 20:59
+
+from django.db import migrations, models
+
+# the search index as of this migration, a frozen copy of products.search,
+# so that the migration does not change with it. Later migrations which
+# rebuild products_product drop the SQLite triggers, they are created
+# again after migrate (see search.ensure_sqlite_triggers)
+SEARCH_CONFIG = "simple"
+SEARCH_INDEX_NAME = "product_search_idx"
+FTS_TABLE = "products_product_fts"
+SQLITE_FTS_TABLE = (
+    "CREATE VIRTUAL TABLE products_product_fts USING fts5("
+    "search_document, content='products_product', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER products_product_fts_insert AFTER INSERT ON products_product BEGIN "
+    "INSERT INTO products_product_fts(rowid, search_document) "
+    "VALUES (new.id, new.search_document); END",
+    "CREATE TRIGGER products_product_fts_delete AFTER DELETE ON products_product BEGIN "
+    "INSERT INTO products_product_fts(products_product_fts, rowid, search_document) "
+    "VALUES ('delete', old.id, old.search_document); END",
+    "CREATE TRIGGER products_product_fts_update AFTER UPDATE OF search_document "
+    "ON products_product BEGIN "
+    "INSERT INTO products_product_fts(products_product_fts, rowid, search_document) "
+    "VALUES ('delete', old.id, old.search_document); "
+    "INSERT INTO products_product_fts(rowid, search_document) "
+    "VALUES (new.id, new.search_document); END",
+]
+
+
+def populate_search_documents(apps, schema_editor):
+    Category = apps.get_model("products", "Category")
+    Product = apps.get_model("products", "Product")
+    db = schema_editor.connection.alias
+    categories = {
+        pk: (name, parent_id)
+        for pk, name, parent_id in Category.objects.using(db).values_list("pk", "name", "parent_id")
+    }
+
+    def category_names(category_id):
+        names = []
+        while category_id is not None:
+            name, category_id = categories[category_id]
+            names.insert(0, name)
+        return names
+
+    batch = []
+    products = Product.objects.using(db).select_related("parent", "color")
+    for product in products.iterator(chunk_size=1000):
+        product.search_document = " ".join(filter(None, [
+            product.parent.name,
+            product.style,
+            product.color.name if product.color else None,
+            *category_names(product.parent.category_id),
+            product.parent.description,
+            product.parent.fabric_info,
+        ]))
+        batch.append(product)
+        if len(batch) == 1000:
+            Product.objects.using(db).bulk_update(batch, ["search_document"])
+            batch = []
+    Product.objects.using(db).bulk_update(batch, ["search_document"])
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        schema_editor.add_index(apps.get_model("products", "Product"), GinIndex(
+            SearchVector("search_document", config=SEARCH_CONFIG),
+            name=SEARCH_INDEX_NAME,
+        ))
+    elif vendor == "sqlite":
+        schema_editor.execute(SQLITE_FTS_TABLE)
+        for statement in SQLITE_TRIGGERS:
+            schema_editor.execute(statement)
+        schema_editor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (FTS_TABLE, FTS_TABLE))
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS %s" % SEARCH_INDEX_NAME)
+    elif vendor == "sqlite":
+        for name in ("insert", "delete", "update"):
+            schema_editor.execute("DROP TRIGGER IF EXISTS products_product_fts_%s" % name)
+        schema_editor.execute("DROP TABLE IF EXISTS %s" % FTS_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_product_category_range'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+        # PostgreSQL: GIN index, SQLite: FTS5 table, other backends: none
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
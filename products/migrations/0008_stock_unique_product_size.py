@@ -0,0 +1,39 @@
+# Generated by Django 5.0.14 on 2026-10-17 21:16
+
+from django.db import migrations, models
+
+
+def merge_duplicate_stock(apps, schema_editor):
+    """
+    Merges Stock rows of the same product and size into the first one,
+    summing their quantities, so that the stock summary does not change.
+    """
+    Stock = apps.get_model("products", "Stock")
+    db_alias = schema_editor.connection.alias
+
+    duplicates = Stock.objects.using(db_alias).values("product", "size").annotate(
+        count=models.Count("pk"),
+        total=models.Sum("quantity"),
+        first=models.Min("pk"),
+    ).filter(count__gt=1)
+    for row in duplicates.iterator():
+        Stock.objects.using(db_alias).filter(pk=row["first"]).update(quantity=row["total"])
+        Stock.objects.using(db_alias).filter(
+            product=row["product"],
+            size=row["size"],
+        ).exclude(pk=row["first"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0007_product_search_document'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_stock, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='stock',
+            constraint=models.UniqueConstraint(fields=('product', 'size'), name='stock_product_size_unique'),
+        ),
+    ]
@@ -1,15 +1,19 @@
 import re
 
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
+from django.db.models.functions import Coalesce, Concat, Length, Substr
 from django.shortcuts import get_object_or_404
 from django.urls import reverse
+from django.utils import timezone
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from mptt.fields import TreeForeignKey
 from mptt.managers import TreeManager
 from mptt.models import MPTTModel
 
+from products import caching, search
+
 
 class ParentProduct(models.Model):
     """
@@ -55,7 +59,279 @@ class ParentProduct(models.Model):
         verbose_name_plural = _('Parent Products')
 
 
-class PrefetchedProductManager(models.Manager):
+# slugs looked up with one query by ProductQuerySet.allocate_slugs
+SLUG_PREFIXES_PER_QUERY = 200
+
+# fields of Product search_document is built from
+SEARCH_DOCUMENT_FIELDS = {"parent", "parent_id", "style", "color", "color_id"}
+
+
+def get_category_tree(using=DEFAULT_DB_ALIAS):
+    from products.category_tree import get_category_tree
+
+    return get_category_tree(using)
+
+
+def invalidate_autocomplete_index(using):
+    from products.autocomplete import invalidate_index_on_commit
+
+    invalidate_index_on_commit(using)
+
+
+class ProductQuerySet(models.QuerySet):
+    """
+    Keeps Product.effective_price, the category range and
+    the search document up to date on bulk writes,
+    which do not call Product.save().
+    """
+    def in_category(self, category):
+        """
+        Returns Products assigned to the given Category
+        or any of its descendants, with a range condition
+        on the category range copied onto Product.
+        """
+        return self.filter(
+            category_tree_id=category.tree_id,
+            category_lft__gte=category.lft,
+            category_lft__lt=category.rght,
+        )
+
+    def search(self, query):
+        """
+        Returns Products matching all words of the query (as prefixes)
+        in their search_document, annotated with search_rank
+        (higher is better). See products.search for the backends.
+        """
+        return search.search(self, query)
+
+    def refresh_category_range(self):
+        """
+        Copies tree_id and lft of the category of each product's parent
+        onto the product with one UPDATE. Needed after the category tree
+        changes (see signals.update_category_ranges).
+        """
+        return self.update(**self._category_range(models.OuterRef("parent_id")))
+
+    @staticmethod
+    def _category_range(parent):
+        # parent may be a ParentProduct, a pk or an expression
+        parents = ParentProduct.objects.filter(pk=getattr(parent, "pk", parent))
+
+        return {
+            "category_tree_id": models.Subquery(parents.values("category__tree_id")[:1]),
+            "category_lft": models.Subquery(parents.values("category__lft")[:1]),
+        }
+
+    def with_variants(self):
+        """
+        Prefetches all color variants of the products' ParentProduct
+        (the product itself included) into product.parent.variants,
+        with one query for all products.
+        """
+        return self.select_related("parent").prefetch_related(
+            models.Prefetch(
+                "parent__product_set",
+                queryset=Product.objects.select_related("color"),
+                to_attr="variants",
+            )
+        )
+
+    def refresh_stock_summary(self, batch_size=1000):
+        """
+        Recomputes the denormalized stock summary (in_stock,
+        total_quantity, available_size_ids) of Products
+        in the queryset from their Stock rows.
+        """
+        product_ids = list(self.values_list("pk", flat=True))
+        available = Stock.objects.using(self.db).filter(
+            product=models.OuterRef("pk"),
+            quantity__gt=0
+        ).order_by()
+        total_quantity = available.values("product").annotate(
+            total=models.Sum("quantity")
+        ).values("total")
+
+        with transaction.atomic(using=self.db):
+            for i in range(0, len(product_ids), batch_size):
+                batch = product_ids[i:i + batch_size]
+                products = Product.objects.using(self.db).filter(pk__in=batch)
+                products.update(
+                    in_stock=models.Exists(available),
+                    total_quantity=Coalesce(models.Subquery(total_quantity), 0),
+                    available_size_ids=[],
+                )
+
+                # update products with the same available sizes together
+                size_ids = {}
+                stock = Stock.objects.using(self.db).filter(
+                    product_id__in=batch,
+                    quantity__gt=0
+                ).order_by("size_id").values_list("product_id", "size_id")
+                for product_id, size_id in stock:
+                    size_ids.setdefault(product_id, []).append(size_id)
+
+                groups = {}
+                for product_id, sizes in size_ids.items():
+                    groups.setdefault(tuple(sizes), []).append(product_id)
+                for sizes, group in groups.items():
+                    Product.objects.using(self.db).filter(
+                        pk__in=group
+                    ).update(available_size_ids=list(sizes))
+
+        return len(product_ids)
+
+    def update(self, **kwargs):
+        if "price" in kwargs or "discounted_price" in kwargs:
+            # SET expressions are evaluated against the old values of
+            # the row, so compute the new effective price from the new
+            # values in the same query
+            prices = [
+                kwargs.get(field, models.F(field))
+                for field in ("discounted_price", "price")
+            ]
+            kwargs["effective_price"] = Coalesce(
+                *[price if hasattr(price, "resolve_expression") else models.Value(price)
+                  for price in prices],
+                output_field=models.DecimalField(),
+            )
+        for field in ("parent", "parent_id"):
+            if field in kwargs:
+                kwargs.update(self._category_range(kwargs[field]))
+
+        if not SEARCH_DOCUMENT_FIELDS & set(kwargs):
+            return super().update(**kwargs)
+
+        with transaction.atomic(using=self.db):
+            product_ids = list(self.values_list("pk", flat=True))
+            count = super().update(**kwargs)
+            Product.objects.using(self.db).filter(pk__in=product_ids).refresh_search_document()
+        # labels of products changed, the autocomplete index is rebuilt
+        invalidate_autocomplete_index(self.db)
+
+        return count
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        parents = ParentProduct.objects.using(self.db).select_related("category").in_bulk(
+            {obj.parent_id for obj in objs}
+        )
+        colors = Color.objects.using(self.db).in_bulk({obj.color_id for obj in objs if obj.color_id})
+        category_tree = get_category_tree(self.db)
+        for obj in objs:
+            obj.parent = parents[obj.parent_id]
+            obj.color = colors.get(obj.color_id)
+            obj.update_effective_price()
+            category = obj.parent.category
+            obj.category_tree_id = category.tree_id if category else None
+            obj.category_lft = category.lft if category else None
+            obj.update_search_document(category_tree)
+        self.allocate_slugs([obj for obj in objs if not obj.slug])
+
+        objs = super().bulk_create(objs, *args, **kwargs)
+        invalidate_autocomplete_index(self.db)
+
+        return objs
+
+    def with_slug_prefixes(self, slugs):
+        """
+        Returns Products with any of the slugs or with a slug starting
+        with one of them followed by "-". SQLite compares text bytewise,
+        so prefixes are matched with range conditions on the unique index
+        (its LIKE can't use the index). Elsewhere ranges miss suffixed
+        slugs under locale collations, which ignore punctuation
+        (f.e. en_US.UTF-8 on PostgreSQL), so prefixes are matched with
+        LIKE, served on PostgreSQL by the varchar_pattern_ops index
+        Django creates for the unique slug.
+        """
+        bytewise = connections[self.db].vendor == "sqlite"
+        q = models.Q()
+        for slug in slugs:
+            if bytewise:
+                # "." follows "-" in ASCII
+                q |= models.Q(slug=slug) | models.Q(slug__gte=slug + "-", slug__lt=slug + ".")
+            else:
+                q |= models.Q(slug=slug) | models.Q(slug__startswith=slug + "-")
+
+        return self.filter(q)
+
+    def allocate_slugs(self, objs):
+        """
+        Sets slugs of new Products built from the name of their parent
+        and style (see Product.build_slug). Slugs which are taken get
+        the next numeric suffix ("coat-a-b-2"). Existing slugs and their
+        suffixes are read with a single query (see with_slug_prefixes)
+        for all products.
+        """
+        bases = {}
+        for obj in objs:
+            bases.setdefault(obj.build_slug(), []).append(obj)
+        if not bases:
+            return
+
+        existing = set()
+        base_list = list(bases)
+        # SQLite limits the depth of expressions (the chain of ORs)
+        for i in range(0, len(base_list), SLUG_PREFIXES_PER_QUERY):
+            existing.update(Product.objects.using(self.db).with_slug_prefixes(
+                base_list[i:i + SLUG_PREFIXES_PER_QUERY]
+            ).values_list("slug", flat=True))
+        last_suffixes = {}
+        for slug in existing:
+            base, _, suffix = slug.rpartition("-")
+            if base in bases and suffix.isdigit():
+                last_suffixes[base] = max(last_suffixes.get(base, 1), int(suffix))
+
+        allocated = set()
+        for base, group in bases.items():
+            suffix = last_suffixes.get(base, 1)
+            for obj in group:
+                slug = base
+                # slugs of other new products are left for them
+                while slug in existing or slug in allocated or (slug != base and slug in bases):
+                    suffix += 1
+                    slug = "%s-%s" % (base, suffix)
+                obj.slug = slug
+                allocated.add(slug)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if "price" in fields or "discounted_price" in fields:
+            for obj in objs:
+                obj.update_effective_price()
+            fields = [*fields, "effective_price"]
+
+        result = super().bulk_update(objs, fields, *args, **kwargs)
+        if SEARCH_DOCUMENT_FIELDS & set(fields):
+            Product.objects.using(self.db).filter(
+                pk__in=[obj.pk for obj in objs]
+            ).refresh_search_document()
+            invalidate_autocomplete_index(self.db)
+
+        return result
+
+    def refresh_search_document(self, batch_size=1000):
+        """
+        Rebuilds Product.search_document of Products in the queryset
+        from their parent product, color and categories.
+        Returns the number of refreshed products.
+        """
+        product_ids = list(self.values_list("pk", flat=True))
+        category_tree = get_category_tree(self.db)
+        products = Product.objects.using(self.db).select_related("parent", "color").only(
+            "search_document", "style", "color__name", "parent__name",
+            "parent__description", "parent__fabric_info", "parent__category_id",
+        )
+
+        for i in range(0, len(product_ids), batch_size):
+            batch = list(products.filter(pk__in=product_ids[i:i + batch_size]))
+            for product in batch:
+                product.update_search_document(category_tree)
+            products.bulk_update(batch, ["search_document"])
+
+        return len(product_ids)
+
+
+class PrefetchedProductManager(models.Manager.from_queryset(ProductQuerySet)):
     def get_queryset(self):
         """
         Returns a queryset with all Product models
@@ -75,10 +351,10 @@ class PrefetchedProductManager(models.Manager):
         """
         Returns a queryset with Products which are available
         to buy in at least one size.
+        Uses the denormalized Product.in_stock flag, so no join
+        with Stock (and no DISTINCT) is needed.
         """
-        return self.get_queryset().filter(
-            stock__quantity__gt=0
-        ).distinct()
+        return self.get_queryset().filter(in_stock=True)
 
     def get_queryset_for_category(self, crumb, available_only=True):
         """
@@ -86,16 +362,13 @@ class PrefetchedProductManager(models.Manager):
         Category or any of its descendants.
         """
         category = get_object_or_404(Category, path_crumb=crumb)
-        categories = category.get_descendants(include_self=True)
 
         if available_only:
             queryset = self.get_available_products()
         else:
             queryset = self.get_queryset()
 
-        return queryset.filter(
-            parent__category__in=categories
-        )
+        return queryset.in_category(category)
 
     def get(self, *args, **kwargs):
         """
@@ -122,6 +395,31 @@ class Product(models.Model):
     views: PositiveIntegerField
         Number of times the product was viewed by the users. It is used in sorting
          as a 'popularity' parameter.
+    trending_score: FloatField
+        Views weighted by their age, halving every PRODUCTS_TRENDING_HALF_LIFE
+        hours, used in sorting as a 'trending' parameter. Updated in bulk
+        from hourly view counts, see products.trending.
+    effective_price: DecimalField
+        Discounted price if set, price otherwise. Maintained on save,
+        indexed and used for filtering and sorting by price.
+    category_tree_id, category_lft: tree_id and lft of the category
+        of the parent product, denormalized so that products of a category
+        subtree are filtered with an indexed range condition
+        (see ProductQuerySet.in_category). Maintained on save and
+        whenever categories or parent products change.
+    search_document: Text of the parent product (name, description,
+        fabric info), style, color name and names of categories, indexed
+        for full-text search (see products.search). Maintained on save
+        and whenever any of the related objects change, it can be rebuilt
+        with the 'reindex_products' management command.
+    main_image_renditions: Resized WebP/JPEG copies of the main image
+        (paths, widths and heights), generated on upload or with the
+        'generate_renditions' management command, see products.images.
+    in_stock, total_quantity, available_size_ids:
+        A summary of related Stock rows, denormalized to avoid joining Stock
+        on product lists. It is maintained on every Stock write
+        (see ProductQuerySet.refresh_stock_summary), it can be rebuilt
+        with the 'rebuild_stock_summary' management command.
     """
     parent = models.ForeignKey(
         ParentProduct,
@@ -148,14 +446,33 @@ class Product(models.Model):
         blank=True,
         null=True
     )
+    effective_price = models.DecimalField(
+        _("Effective price"),
+        max_digits=8,
+        decimal_places=2,
+        db_index=True,
+        editable=False
+    )
     slug = models.SlugField(max_length=192, unique=True, blank=True, editable=False)
     main_image_url = models.ImageField(_("Main image"), upload_to="products/")
     views = models.PositiveIntegerField(_("Number of views"), default=0, editable=False)
+    trending_score = models.FloatField(_("Trending score"), default=0, editable=False)
     sizes = models.ManyToManyField("Size", verbose_name=_("Sizes"), through="Stock")
-
-    objects = models.Manager()
+    in_stock = models.BooleanField(_("In stock"), default=False, db_index=True, editable=False)
+    total_quantity = models.PositiveIntegerField(_("Total quantity"), default=0, editable=False)
+    available_size_ids = models.JSONField(_("Available sizes"), default=list, editable=False)
+    category_tree_id = models.PositiveIntegerField(null=True, editable=False)
+    category_lft = models.PositiveIntegerField(null=True, editable=False)
+    search_document = models.TextField(blank=True, default="", editable=False)
+    main_image_renditions = models.JSONField(default=dict, blank=True, editable=False)
+
+    objects = ProductQuerySet.as_manager()
     prefetched = PrefetchedProductManager()
 
+    # (parent_id, style, color_id) as of loading or the last save,
+    # see save
+    _saved_search_fields = None
+
     @property
     def name(self):
         return self.__str__()
@@ -167,17 +484,131 @@ class Product(models.Model):
                 fields=["parent", "style"],
             ),
         ]
-        ordering = ('views',)
+        # partial indexes over available products (the only ones listed),
+        # for ordering by views, trending score and price, with or without
+        # filtering by color (ordering by pk uses the primary key)
+        indexes = [
+            models.Index(
+                name="product_available_views_idx",
+                fields=["views", "id"],
+                condition=models.Q(in_stock=True),
+            ),
+            models.Index(
+                name="product_available_trending_idx",
+                fields=["trending_score", "id"],
+                condition=models.Q(in_stock=True),
+            ),
+            models.Index(
+                name="product_available_price_idx",
+                fields=["effective_price", "id"],
+                condition=models.Q(in_stock=True),
+            ),
+            models.Index(
+                name="product_color_views_idx",
+                fields=["color", "views", "id"],
+                condition=models.Q(in_stock=True),
+            ),
+            models.Index(
+                name="product_color_trending_idx",
+                fields=["color", "trending_score", "id"],
+                condition=models.Q(in_stock=True),
+            ),
+            models.Index(
+                name="product_color_price_idx",
+                fields=["color", "effective_price", "id"],
+                condition=models.Q(in_stock=True),
+            ),
+            # products of a category subtree
+            models.Index(
+                name="product_category_range_idx",
+                fields=["category_tree_id", "category_lft"],
+            ),
+        ]
+        # the most popular first
+        ordering = ('-views',)
 
     def get_absolute_url(self):
         return reverse('product_detail', args=[self.slug])
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_search_fields = instance.get_search_fields()
+        return instance
+
+    def get_search_fields(self):
+        # deferred fields are not loaded
+        return tuple(self.__dict__.get(field) for field in ("parent_id", "style", "color_id"))
+
     def save(self, *args, **kwargs):
-        """ Generates slug at object creation."""
-        if not self.pk:
-            self.slug = slugify("%s %s" % (self.parent.name, self.style))
+        """
+        Generates slug at object creation, it does not change afterwards,
+        so that URLs of products stay the same.
+        Updates effective price, and the category range and the search
+        document when the product is created or its parent, style or color
+        changed (or is in update_fields), other saves don't query them.
+        """
+        if not self.pk and not self.slug:
+            Product.objects.db_manager(kwargs.get("using")).allocate_slugs([self])
+
+        saved, current = self._saved_search_fields, self.get_search_fields()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            # unsaved products and products not loaded from the db
+            # have no saved fields
+            update_category_range = saved is None or saved[0] != current[0]
+            update_search_document = saved != current
+        else:
+            update_fields = set(update_fields)
+            update_category_range = bool({"parent", "parent_id"} & update_fields)
+            update_search_document = bool(SEARCH_DOCUMENT_FIELDS & update_fields)
+
+        self.update_effective_price()
+        if update_category_range:
+            self.update_category_range()
+        if update_search_document:
+            self.update_search_document()
+
+        if update_fields is not None:
+            if {"price", "discounted_price"} & update_fields:
+                update_fields.add("effective_price")
+            if update_category_range:
+                update_fields.update(["category_tree_id", "category_lft"])
+            if update_search_document:
+                update_fields.add("search_document")
+            kwargs["update_fields"] = update_fields
 
         super().save(*args, **kwargs)
+        self._saved_search_fields = current
+
+    def build_slug(self):
+        return slugify("%s %s" % (self.parent.name, self.style))
+
+    def update_category_range(self):
+        # read from the db, tree fields of loaded categories
+        # may be outdated after other categories were inserted
+        self.category_tree_id, self.category_lft = ParentProduct.objects.filter(
+            pk=self.parent_id
+        ).values_list("category__tree_id", "category__lft").get()
+
+    def update_search_document(self, category_tree=None):
+        category_tree = category_tree or get_category_tree()
+        category = category_tree.by_pk.get(self.parent.category_id)
+        categories = category_tree.get_ancestors(category, include_self=True) if category else []
+        self.search_document = " ".join(filter(None, [
+            self.parent.name,
+            self.style,
+            self.color.name if self.color else None,
+            *[category.name for category in categories],
+            self.parent.description,
+            self.parent.fabric_info,
+        ]))
+
+    def update_effective_price(self):
+        if self.discounted_price is not None:
+            self.effective_price = self.discounted_price
+        else:
+            self.effective_price = self.price
 
     def clean(self):
         if self.discounted_price and self.discounted_price >= self.price:
@@ -220,6 +651,9 @@ class Category(MPTTModel):
     The path for a category contains 'path_crumbs' of all its ancestors, f.e.
     the path for a category named "Floral dresses" could be:
     dresses/summer-dresses/floral-dresses/
+    path: The full path (without the trailing slash), stored to build URLs
+    and resolve categories without querying ancestors.
+    It is maintained on save, including paths of descendants.
     """
     name = models.CharField(_("Name"), max_length=32, unique=True)
     parent = TreeForeignKey(
@@ -231,20 +665,99 @@ class Category(MPTTModel):
         related_name="children",
     )
     path_crumb = models.CharField(max_length=64, blank=True, unique=True, editable=False)
+    path = models.CharField(max_length=255, blank=True, db_index=True, editable=False)
 
     objects = CategoryManager()
 
+    # (parent_id, tree_id, lft, rght) as of loading or the last save,
+    # see signals.update_category_ranges
+    _saved_tree = None
+
     class Meta:
         verbose_name_plural = _('Categories')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_tree = instance.get_tree_fields()
+        return instance
+
+    def get_tree_fields(self):
+        # deferred fields are not loaded
+        return tuple(self.__dict__.get(field) for field in ("parent_id", "tree_id", "lft", "rght"))
+
+    def clean(self):
+        self.path_crumb = slugify(self.name)
+        self.validate_path(self.build_path())
+
     def save(self, *args, **kwargs):
+        """
+        Updates path_crumb and path. When the path changes
+        (the category was renamed or moved, also with
+        DraggableMPTTAdmin, which saves moved nodes),
+        paths of all descendants are updated as well.
+        Raises ValidationError if any of the paths would not fit
+        the path column.
+        """
         self.path_crumb = slugify(self.name)
+        path = self.build_path()
+        old_path = self.validate_path(path)
+        self.path = path
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "path_crumb", "path"}
+
+        if old_path and old_path != self.path:
+            # replace the old path prefix of all descendants with one query,
+            # before post_save receivers (f.e. the category tree) read them
+            Category.objects.filter(path__startswith=old_path + "/").update(
+                path=Concat(models.Value(self.path), Substr("path", len(old_path) + 1))
+            )
+
         super().save(*args, **kwargs)
 
-    def get_absolute_url(self):
-        path = "/".join(ancestor.path_crumb for ancestor in self.get_ancestors(include_self=True))
+    def validate_path(self, path):
+        """
+        Checks that the new path of the category and paths of its
+        descendants (which start with it) fit the path column,
+        so that deep trees fail with a validation error instead of
+        a database error. Returns the current (old) path.
+        """
+        old_path = None
+        longest = len(path)
+        if self.pk:
+            old_path = Category.objects.filter(pk=self.pk).values_list("path", flat=True).first()
+        if old_path and old_path != path:
+            longest_descendant = Category.objects.filter(
+                path__startswith=old_path + "/"
+            ).aggregate(longest=models.Max(Length("path")))["longest"]
+            if longest_descendant:
+                longest = max(longest, longest_descendant - len(old_path) + len(path))
+
+        max_length = Category._meta.get_field("path").max_length
+        if longest > max_length:
+            raise ValidationError(
+                _("The category path (%(path)s) is too long, paths of the category "
+                  "and its subcategories can have at most %(max_length)s characters."),
+                code="path_too_long",
+                params={"path": path, "max_length": max_length},
+            )
+
+        return old_path
 
-        return reverse('product_by_category_list', args=[path])
+    def build_path(self):
+        """
+        Returns the full path of the category, based
+        on the stored path of its parent.
+        """
+        if self.parent_id is None:
+            return self.path_crumb
+
+        parent_path = Category.objects.filter(pk=self.parent_id).values_list("path", flat=True).get()
+        return "%s/%s" % (parent_path, self.path_crumb)
+
+    def get_absolute_url(self):
+        return reverse('product_by_category_list', args=[self.path])
 
     def __str__(self):
         return str(self.name)
@@ -289,6 +802,8 @@ class Image(models.Model):
         related_name="images"
     )
     url = models.ImageField(_("Image url"), upload_to="products/")
+    # resized copies of the image, see products.images
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return str(self.product)
@@ -329,10 +844,71 @@ class Size(models.Model):
         return str(self.name)
 
 
+class StockQuerySet(models.QuerySet):
+    """
+    Keeps the stock summary of related Products and the cached catalog
+    data up to date on bulk writes, which do not call Stock.save().
+    """
+    def _stock_changed(self, product_ids):
+        Product.objects.using(self.db).filter(pk__in=product_ids).refresh_stock_summary()
+        caching.bump_catalog_version_on_commit(using=self.db)
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            product_ids = set(self.values_list("product_id", flat=True))
+            rows = super().update(**kwargs)
+            product = kwargs.get("product", kwargs.get("product_id"))
+            if product is not None:
+                product_ids.add(getattr(product, "pk", product))
+            self._stock_changed(product_ids)
+
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            self._stock_changed({obj.product_id for obj in objs})
+
+        return objs
+
+    def upsert_quantities(self, objs, batch_size=None):
+        """
+        Inserts Stock rows or updates quantities of existing ones
+        (matched by product and size) with a single statement per batch.
+        Unlike bulk_create() it does not refresh the stock summary,
+        the caller refreshes it for all batches (see stock_import).
+        """
+        return super().bulk_create(
+            objs,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=["product", "size"],
+            update_fields=["quantity"],
+        )
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        with transaction.atomic(using=self.db):
+            product_ids = {obj.product_id for obj in objs}
+            if "product" in fields or "product_id" in fields:
+                # products the rows are moved from need a refresh as well
+                product_ids.update(
+                    Stock.objects.using(self.db).filter(
+                        pk__in=[obj.pk for obj in objs]
+                    ).values_list("product_id", flat=True)
+                )
+            rows = super().bulk_update(objs, fields, *args, **kwargs)
+            self._stock_changed(product_ids)
+
+        return rows
+
+
 class Stock(models.Model):
     """
     An intermediate model with an additional attribute
     quantity.
+    Every write refreshes the stock summary of the related Product
+    within the same transaction (see signals.update_stock_summary).
     """
     product = models.ForeignKey(
         Product,
@@ -348,6 +924,76 @@ class Stock(models.Model):
     )
     quantity = models.PositiveIntegerField(default=0)
 
+    objects = StockQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(name="stock_product_size_unique", fields=["product", "size"]),
+        ]
+        indexes = [
+            # stock of a product (prefetching, stock summary)
+            models.Index(name="stock_product_size_qty_idx", fields=["product", "size", "quantity"]),
+            # products available in a size (size filter)
+            models.Index(name="stock_size_qty_product_idx", fields=["size", "quantity", "product"]),
+        ]
+
+    def save(self, *args, **kwargs):
+        # post_save receivers refresh the product's stock summary,
+        # run them within the same transaction as the write itself
+        with transaction.atomic(using=kwargs.get("using")):
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return "%s, quantity: %s" % (self.product, self.quantity)
 
+
+class ImageJobStatus(models.IntegerChoices):
+    PENDING = 0, _("Pending")
+    RUNNING = 1, _("Running")
+    DONE = 2, _("Done")
+    FAILED = 3, _("Failed")
+
+
+class ImageJob(models.Model):
+    """
+    A job generating renditions of an image file (see products.jobs),
+    queued when an image is uploaded and processed by the
+    'process_image_jobs' worker. There is at most one pending or running
+    job per file, done jobs are kept to reuse their renditions
+    for files with the same content.
+    """
+    PENDING = ImageJobStatus.PENDING
+    RUNNING = ImageJobStatus.RUNNING
+    DONE = ImageJobStatus.DONE
+    FAILED = ImageJobStatus.FAILED
+    STATUS_CHOICES = ImageJobStatus.choices
+
+    source = models.CharField(_("Image"), max_length=255)
+    status = models.PositiveSmallIntegerField(_("Status"), choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(_("Attempts"), default=0)
+    run_after = models.DateTimeField(_("Run after"), default=timezone.now)
+    # sha256 of the file and the rendition options
+    content_hash = models.CharField(_("Content hash"), max_length=64, blank=True, db_index=True)
+    result = models.JSONField(_("Renditions"), null=True, blank=True)
+    error = models.TextField(_("Error"), blank=True)
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+    started_at = models.DateTimeField(_("Started at"), null=True, blank=True)
+    finished_at = models.DateTimeField(_("Finished at"), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _("Image job")
+        verbose_name_plural = _("Image jobs")
+        constraints = [
+            models.UniqueConstraint(
+                name="imagejob_active_source_unique",
+                fields=["source"],
+                condition=models.Q(status__in=[ImageJobStatus.PENDING, ImageJobStatus.RUNNING]),
+            ),
+        ]
+        indexes = [
+            # claiming jobs which are due
+            models.Index(name="imagejob_status_run_after_idx", fields=["status", "run_after"]),
+        ]
+
+    def __str__(self):
+        return "%s (%s)" % (self.source, self.get_status_display())
@@ -0,0 +1,164 @@
+import base64
+import json
+from decimal import Decimal
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    """
+    A page of results of CursorPaginator.
+    Mimics the parts of django.core.paginator.Page interface,
+    which do not require counting all results.
+    """
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset pagination: instead of OFFSET, a page is selected with
+    a condition on the ordering fields of the last (or first) object of the
+    neighbouring page, f.e. (views > 10) OR (views = 10 AND pk > 25),
+    so fetching deep pages costs the same as the first one
+    and no COUNT query is needed.
+    The pk is appended to the ordering as a tiebreaker, in the direction
+    of the last ordering field, so that indexes on (field, id) are read
+    in one direction without sorting. Ordering fields must not contain
+    NULL values.
+    """
+    def __init__(self, queryset, ordering, per_page):
+        ordering = list(ordering)
+        if ordering[-1].lstrip("-") != "pk":
+            ordering.append("-pk" if ordering[-1].startswith("-") else "pk")
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+
+    @property
+    def fields(self):
+        return [field.lstrip("-") for field in self.ordering]
+
+    def encode_cursor(self, obj, direction):
+        values = [getattr(obj, field) for field in self.fields]
+        values = [str(value) if isinstance(value, Decimal) else value for value in values]
+        data = json.dumps({"v": values, "d": direction}, separators=(",", ":"))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            values, direction = data["v"], data["d"]
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor("Invalid cursor: %s" % cursor)
+        if (not isinstance(values, list) or len(values) != len(self.ordering)
+                or direction not in ("next", "previous")):
+            raise InvalidCursor("Invalid cursor: %s" % cursor)
+
+        # values of a tampered cursor may have other types than the fields
+        try:
+            values = [self._get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except (ValidationError, TypeError, ValueError):
+            raise InvalidCursor("Invalid cursor: %s" % cursor)
+        if None in values:
+            raise InvalidCursor("Invalid cursor: %s" % cursor)
+
+        return values, direction
+
+    def _get_field(self, name):
+        """
+        Returns the model field (or the output field of an annotation)
+        of an ordering field.
+        """
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            if name == "pk":
+                return self.queryset.model._meta.pk
+            return self.queryset.query.annotations[name].output_field
+
+    @staticmethod
+    def _keyset_q(ordering, values):
+        """
+        Returns a Q object selecting rows placed after the given values
+        of the ordering fields.
+        """
+        q = Q()
+        equal = Q()
+        for field, value in zip(ordering, values):
+            name = field.lstrip("-")
+            lookup = "%s__lt" if field.startswith("-") else "%s__gt"
+            q |= equal & Q(**{lookup % name: value})
+            equal &= Q(**{name: value})
+
+        return q
+
+    def get_page_queryset(self, cursor=None):
+        """
+        Returns the queryset of the page selected by the cursor,
+        with one more object telling whether there are more pages,
+        and the direction of the cursor (None for the first page).
+        """
+        if not cursor:
+            return self.queryset.order_by(*self.ordering)[:self.per_page + 1], None
+
+        values, direction = self.decode_cursor(cursor)
+        if direction == "next":
+            ordering = self.ordering
+        else:
+            # walk backwards and reverse the results afterwards
+            ordering = [field[1:] if field.startswith("-") else "-" + field for field in self.ordering]
+
+        queryset = self.queryset.filter(self._keyset_q(ordering, values)).order_by(*ordering)
+
+        return queryset[:self.per_page + 1], direction
+
+    def get_page(self, objects, direction=None):
+        has_more = len(objects) > self.per_page
+        objects = objects[:self.per_page]
+
+        if direction is None:
+            has_next, has_previous = has_more, False
+        elif direction == "previous":
+            objects.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, True
+
+        return CursorPage(
+            objects,
+            self,
+            next_cursor=self.encode_cursor(objects[-1], "next") if objects and has_next else None,
+            previous_cursor=self.encode_cursor(objects[0], "previous") if objects and has_previous else None,
+        )
+
+    def page(self, cursor=None):
+        queryset, direction = self.get_page_queryset(cursor)
+        return self.get_page(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        queryset, direction = self.get_page_queryset(cursor)
+        return self.get_page([obj async for obj in queryset], direction)
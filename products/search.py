@@ -0,0 +1,172 @@
+"""
+Full-text search of products over Product.search_document.
+
+The index depends on the database backend:
+- PostgreSQL: a GIN index over to_tsvector('simple', search_document),
+  maintained by the database,
+- SQLite: an FTS5 table with external content (products_product),
+  kept in sync by triggers,
+- other backends: no index, words are matched with icontains.
+The index is created by migration 0007_product_search_document,
+missing SQLite triggers are created after migrations (ensure_sqlite_triggers).
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = "simple"
+SEARCH_INDEX_NAME = "product_search_idx"
+FTS_TABLE = "products_product_fts"
+
+SQLITE_FTS_TABLE = (
+    "CREATE VIRTUAL TABLE products_product_fts USING fts5("
+    "search_document, content='products_product', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')"
+)
+SQLITE_TRIGGERS = [
+    "CREATE TRIGGER products_product_fts_insert AFTER INSERT ON products_product BEGIN "
+    "INSERT INTO products_product_fts(rowid, search_document) "
+    "VALUES (new.id, new.search_document); END",
+    "CREATE TRIGGER products_product_fts_delete AFTER DELETE ON products_product BEGIN "
+    "INSERT INTO products_product_fts(products_product_fts, rowid, search_document) "
+    "VALUES ('delete', old.id, old.search_document); END",
+    "CREATE TRIGGER products_product_fts_update AFTER UPDATE OF search_document "
+    "ON products_product BEGIN "
+    "INSERT INTO products_product_fts(products_product_fts, rowid, search_document) "
+    "VALUES ('delete', old.id, old.search_document); "
+    "INSERT INTO products_product_fts(rowid, search_document) "
+    "VALUES (new.id, new.search_document); END",
+]
+
+
+def tokenize(query):
+    """
+    Returns words of the query, so that no operators of the search
+    query syntax of the backend get to the database.
+    """
+    return re.findall(r"\w+", query.lower())
+
+
+def search(queryset, query):
+    """
+    Filters the Product queryset to products matching all words
+    of the query as prefixes and annotates them with search_rank.
+    """
+    words = tokenize(query)
+    if not words:
+        return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+    vendor = connections[queryset.db].vendor
+    if vendor == "postgresql":
+        return _search_postgresql(queryset, words)
+    if vendor == "sqlite":
+        return _search_sqlite(queryset, words)
+
+    q = Q()
+    for word in words:
+        q &= Q(search_document__icontains=word)
+
+    return queryset.filter(q).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def match(queryset, query):
+    """
+    Filters the Product queryset like search(), without ranking,
+    so that it can be used in subqueries (f.e. of facet counts),
+    where the SQLite join of search() would not resolve.
+    """
+    words = tokenize(query)
+    if not words:
+        return queryset.none()
+
+    if connections[queryset.db].vendor == "sqlite":
+        return queryset.filter(pk__in=RawSQL(
+            "SELECT rowid FROM %s WHERE %s MATCH %%s" % (FTS_TABLE, FTS_TABLE),
+            [_sqlite_match(words)],
+        ))
+
+    return search(queryset, query)
+
+
+def _search_postgresql(queryset, words):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    # the same expression as the one of the index
+    vector = SearchVector("search_document", config=SEARCH_CONFIG)
+    search_query = SearchQuery(
+        " & ".join("'%s':*" % word for word in words),
+        config=SEARCH_CONFIG,
+        search_type="raw",
+    )
+
+    return queryset.annotate(search_vector=vector).filter(
+        search_vector=search_query
+    ).annotate(search_rank=SearchRank(vector, search_query))
+
+
+def _sqlite_match(words):
+    return " ".join('"%s"*' % word for word in words)
+
+
+def _search_sqlite(queryset, words):
+    match = _sqlite_match(words)
+    table = connections[queryset.db].ops.quote_name(queryset.model._meta.db_table)
+
+    # a join with the FTS5 table, so that rank is read
+    # from the match itself (there is no ORM API for joining it)
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=["%s MATCH %%s" % FTS_TABLE, "%s.rowid = %s.id" % (FTS_TABLE, table)],
+        params=[match],
+    ).annotate(
+        # bm25 rank of FTS5 is lower for better matches
+        search_rank=RawSQL("-%s.rank" % FTS_TABLE, [], output_field=FloatField())
+    )
+
+
+def ensure_sqlite_triggers(using="default"):
+    """
+    Creates triggers of the FTS5 table if any of them are missing
+    and rebuilds the index, since products may have been written
+    without them. SQLite drops the triggers whenever a migration
+    rebuilds the products table (f.e. to add a column), this runs
+    after every migrate (see signals.create_search_triggers), so that
+    such migrations don't have to create them again.
+    Returns True if triggers were created.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return False
+
+    triggers = {"%s_%s" % (FTS_TABLE, name) for name in ("insert", "delete", "update")}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE name IN (%s)" % ", ".join(["%s"] * 4),
+            [FTS_TABLE, *sorted(triggers)],
+        )
+        names = {row[0] for row in cursor.fetchall()}
+        if FTS_TABLE not in names or triggers <= names:
+            return False
+
+        for name in triggers:
+            cursor.execute("DROP TRIGGER IF EXISTS %s" % name)
+        for statement in SQLITE_TRIGGERS:
+            cursor.execute(statement)
+
+    rebuild_index(using)
+
+    return True
+
+
+def rebuild_index(using="default"):
+    """
+    Rebuilds the search index from search documents stored in
+    the database, only needed for SQLite after writing to the
+    products table with triggers disabled (f.e. a raw restore).
+    """
+    connection = connections[using]
+    if connection.vendor == "sqlite":
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO %s(%s) VALUES ('rebuild')" % (FTS_TABLE, FTS_TABLE))
@@ -1,73 +1,186 @@
-from django.core.cache import cache
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import Signal
-from django.utils import timezone
-from django.utils.dateparse import parse_datetime
 
-VIEWED = "viewed"
+from products import (
+    autocomplete, caching, counters, dispatch, images, jobs, search, trending,
+    viewed
+)
+from products.models import (
+    Category, Color, Image, ParentProduct, Product, Size, SizeGroup, Stock
+)
 
 product_viewed = Signal()
 
 
 def increment_product_views(product):
     """
-    Increments Product.views.
-    The counter is primarily saved in cache.
-    The db is updated once per hour.
+    Increments Product.views and views of the current hour
+    (see products.trending, scores are not folded in requests).
+    The counter is primarily kept in cache (see counters.BufferedCounter),
+    the db is updated in bulk by counters.flush_view_counts,
+    not in requests unless PRODUCTS_VIEW_COUNTS_FLUSH_IN_REQUEST is set.
     """
-    cache_view_count_key = f"{product.pk}_view_count"
-    cache_last_saved_key = f"{product.pk}_view_count_last_saved"
+    counters.view_counter.incr(product.pk)
+    trending.record_views({product.pk: 1})
+    counters.maybe_flush_view_counts(in_request=True)
 
-    current_time = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-    last_saved = cache.get(cache_last_saved_key) or '1900-01-01 00:00:00'
-    view_count = cache.get(cache_view_count_key) or product.views
-    view_count += 1
-    cache.set(cache_view_count_key, view_count, 60000)
-    if parse_datetime(current_time) - parse_datetime(last_saved) > timezone.timedelta(hours=1):
-        product.views = view_count
-        product.save()
-        cache.set(cache_last_saved_key, current_time, 60000)
+
+def add_to_viewed(sender, session, product, request=None, **kwargs):
+    """
+    Counts a view of 'product' unless the visitor already viewed it
+    within the last hour (see products.viewed for the backends).
+    """
+    if not viewed.get_backend().add(request, session, product):
+        return
+
+    # since it was a 'valid' view, increment the counter for product,
+    # in a background thread with PRODUCTS_VIEW_DISPATCH = "thread"
+    if getattr(settings, "PRODUCTS_VIEW_DISPATCH", "sync") == "thread":
+        dispatch.view_queue.put(product.pk)
+    else:
+        increment_product_views(product=product)
 
 
-def add_to_viewed(sender, session, product, **kwargs):
+def update_stock_summary(sender, instance, using, **kwargs):
     """
-    Under key VIEWED in django session instance we keep track of primary keys
-    of all ProductVariants viewed by a particular user within the last hour.
-    This function checks whether the key for 'product' already exists
-    in the VIEWED dict and if not, it appends it as a key with a value of
-    the current time stamp.
+    Refreshes the denormalized stock summary of the Product
+    whose Stock row was saved or deleted.
     """
-    if not session.get(VIEWED):
-        session[VIEWED] = {}
+    Product.objects.using(using).filter(pk=instance.product_id).refresh_stock_summary()
 
-    # Django serializes session data using JSON, so convert
-    # the pk to str (since it will be stored as key)
-    pk = str(product.pk)
 
-    if session[VIEWED].get(pk):
-        return
+def update_category_ranges(sender, instance, using, signal, created=False, **kwargs):
+    """
+    Copies category ranges onto products after the category tree changed.
+    Inserting, moving or deleting a category shifts lft values of other
+    categories of its tree as well, so ranges of all products of the tree
+    (or of both trees, when it was moved to another one) are refreshed.
+    Saves which don't change the tree (f.e. renames) are skipped.
+    Moving a root node (or a node to the root) may renumber other trees,
+    as well as moving a node loaded before its tree fields were known,
+    then ranges of all products are refreshed.
+    """
+    old, new = instance._saved_tree, instance.get_tree_fields()
+    if signal is post_save:
+        instance._saved_tree = new
+        if old == new:
+            return
 
-    session[VIEWED][pk] = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-    session.modified = True
+    products = Product.objects.using(using)
+    if signal is post_delete or created:
+        products = products.filter(category_tree_id=instance.tree_id)
+    elif old is not None and None not in (*old, *new):
+        products = products.filter(category_tree_id__in={old[1], new[1]})
 
-    # since it was a 'valid' view, increment the counter for product
-    increment_product_views(product=product)
+    products.refresh_category_range()
 
 
-def delete_redundant_data(sender, session, **kwargs):
+def update_parent_category_range(sender, instance, using, **kwargs):
     """
-    Deletes data for Products viewed more than 1 hour ago (see description of
-    add_to_viewed function for reference).
+    Copies the category range onto products of the saved ParentProduct.
     """
-    if not session.get(VIEWED):
-        return
+    Product.objects.using(using).filter(parent=instance).refresh_category_range()
+
+
+def update_search_documents(sender, instance, using, signal, **kwargs):
+    """
+    Refreshes search documents of products which include text
+    of the saved (or deleted) ParentProduct, Color or Category.
+    """
+    products = Product.objects.using(using)
+    if signal is post_delete:
+        # products of the deleted color or category have none now
+        if sender is Color:
+            products = products.filter(color=None)
+        else:
+            products = products.filter(category_tree_id=None)
+    elif sender is ParentProduct:
+        products = products.filter(parent=instance)
+    elif sender is Color:
+        products = products.filter(color=instance)
+    else:
+        products = products.in_category(instance)
+
+    products.refresh_search_document()
+
+
+def invalidate_autocomplete_index(sender, using, **kwargs):
+    """
+    Rebuilds the autocomplete index once the write of a product,
+    parent product, color or category is committed
+    (see autocomplete.invalidate_index_on_commit).
+    """
+    autocomplete.invalidate_index_on_commit(using)
+
+
+def mark_uploaded_image(sender, instance, **kwargs):
+    """
+    Remembers whether a new file was assigned to the image field,
+    the field commits (uploads) it while the instance is saved.
+    """
+    image_field = images.IMAGE_FIELDS[sender][0]
+    instance._image_uploaded = not getattr(instance, image_field)._committed
+
 
-    current_time = timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-    session[VIEWED] = {
-        product_id: last_viewed for product_id, last_viewed in session[VIEWED].items()
-        if parse_datetime(current_time) - parse_datetime(last_viewed) < timezone.timedelta(hours=1)
-    }
-    session.modified = True
+def generate_uploaded_renditions(sender, instance, **kwargs):
+    """
+    Queues generating renditions of an uploaded image
+    (see products.images and products.jobs).
+    """
+    if getattr(instance, "_image_uploaded", False):
+        instance._image_uploaded = False
+        jobs.get_queue().enqueue([getattr(instance, images.IMAGE_FIELDS[sender][0]).name])
+
+
+def create_search_triggers(sender, using, **kwargs):
+    """
+    Creates triggers of the SQLite search index dropped by migrations
+    which rebuilt the products table (see search.ensure_sqlite_triggers).
+    """
+    search.ensure_sqlite_triggers(using)
+
+
+def bump_catalog_version(sender, using, **kwargs):
+    """
+    Invalidates cached catalog data (f.e. filter options of product lists)
+    once the write is committed.
+    """
+    caching.bump_catalog_version_on_commit(using=using)
+
+
+def bump_category_tree_version(sender, using, **kwargs):
+    """
+    Invalidates CategoryTree instances of all processes
+    (see category_tree.get_category_tree). The version is bumped right
+    away, so that later receivers of the same transaction read the new
+    tree, and again on commit, since other processes may have rebuilt
+    the tree from rows read before the commit in the meantime.
+    """
+    caching.bump_catalog_version(caching.CATEGORY_TREE_VERSION_KEY)
+    caching.bump_catalog_version_on_commit(caching.CATEGORY_TREE_VERSION_KEY, using)
 
 
-product_viewed.connect(delete_redundant_data)
 product_viewed.connect(add_to_viewed)
+post_save.connect(update_stock_summary, sender=Stock)
+post_delete.connect(update_stock_summary, sender=Stock)
+post_save.connect(update_category_ranges, sender=Category)
+post_delete.connect(update_category_ranges, sender=Category)
+post_save.connect(update_parent_category_range, sender=ParentProduct)
+post_save.connect(bump_category_tree_version, sender=Category)
+post_delete.connect(bump_category_tree_version, sender=Category)
+# after the category tree and category ranges are updated
+for model in (Category, Color, ParentProduct):
+    post_save.connect(update_search_documents, sender=model)
+for model in (Category, Color):
+    post_delete.connect(update_search_documents, sender=model)
+for model in (Category, Color, ParentProduct, Product):
+    post_save.connect(invalidate_autocomplete_index, sender=model)
+    post_delete.connect(invalidate_autocomplete_index, sender=model)
+for model in (Image, Product):
+    pre_save.connect(mark_uploaded_image, sender=model)
+    post_save.connect(generate_uploaded_renditions, sender=model)
+
+for model in (Category, Color, Image, ParentProduct, Product, Size, SizeGroup, Stock):
+    post_save.connect(bump_catalog_version, sender=model)
+    post_delete.connect(bump_catalog_version, sender=model)
@@ -0,0 +1,31 @@
+"""
+Summary statistics of measured values, shared by the benchmarks
+and the image job stats (see jobs.get_stats).
+"""
+
+
+def percentile(values, p):
+    """
+    Returns the p-th percentile of values (nearest-rank method).
+    """
+    values = sorted(values)
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * p // 100))
+
+    return values[int(rank) - 1]
+
+
+def summarize(values, digits=3):
+    """
+    Returns mean, p50, p95 and max of values.
+    """
+    if not values:
+        return {}
+
+    return {
+        "mean": round(sum(values) / len(values), digits),
+        "p50": round(percentile(values, 50), digits),
+        "p95": round(percentile(values, 95), digits),
+        "max": round(max(values), digits),
+    }
@@ -0,0 +1,181 @@
+"""
+Bulk import of stock levels, f.e. pushed by a warehouse system.
+
+Rows of slug, size (name) and quantity are read from a CSV file with
+a header row or from a JSONL file and processed in chunks, so files
+of any size are streamed. Slugs and size names are resolved through
+lookup maps loaded once, each chunk is compared with the stored
+quantities and only new and changed rows are written, with one upsert
+per batch (StockQuerySet.upsert_quantities) in a transaction per chunk.
+No signals are sent for the rows, the stock summary of changed products
+is refreshed in the transaction of their chunk, so chunks written before
+a failing one stay consistent, the catalog version is bumped once,
+after the last written chunk.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from products import caching
+from products.models import Product, Size, Stock
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("slug", "size", "quantity")
+
+
+class StockImportResult:
+    """
+    Numbers of created, updated and unchanged Stock rows, changes
+    (slug, size, old quantity or None, new quantity) and errors
+    (line, message) of skipped rows.
+    """
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.products = 0
+        self.changes = []
+        self.errors = []
+
+    def as_dict(self):
+        return {
+            "created": self.created,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "skipped": len(self.errors),
+            "products": self.products,
+        }
+
+
+def get_format(path):
+    extension = path.rsplit(".", 1)[-1].lower()
+    if extension not in FORMATS:
+        raise ValueError("Unknown format of %s, use one of: %s." % (path, ", ".join(FORMATS)))
+
+    return extension
+
+
+def read_rows(file, format="csv"):
+    """
+    Yields (line number, row) of the file, rows are dicts with FIELDS
+    or None if the line could not be parsed.
+    """
+    if format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == "jsonl":
+        for line, text in enumerate(file, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+    else:
+        raise ValueError("Unknown format: %s, use one of: %s." % (format, ", ".join(FORMATS)))
+
+
+def parse_quantity(value):
+    quantity = int(value)
+    if quantity < 0:
+        raise ValueError
+
+    return quantity
+
+
+def parse_chunk(chunk, product_ids, size_ids, result):
+    """
+    Returns {(product id, size id): (slug, size, quantity)} of valid rows
+    of the chunk, errors of the other ones are added to the result.
+    The last row of a product and size wins.
+    """
+    quantities = {}
+    for line, row in chunk:
+        if row is None or any(row.get(field) in (None, "") for field in FIELDS):
+            result.errors.append((line, "Malformed row."))
+            continue
+        slug, size = str(row["slug"]).strip(), str(row["size"]).strip()
+        if slug not in product_ids:
+            result.errors.append((line, "Unknown product: %s." % slug))
+            continue
+        if size not in size_ids:
+            result.errors.append((line, "Unknown size: %s." % size))
+            continue
+        try:
+            quantity = parse_quantity(row["quantity"])
+        except (TypeError, ValueError):
+            result.errors.append((line, "Invalid quantity: %s." % row["quantity"]))
+            continue
+        quantities[product_ids[slug], size_ids[size]] = (slug, size, quantity)
+
+    return quantities
+
+
+def write_chunk(quantities, result, batch_size, using, dry_run=False):
+    """
+    Writes new and changed quantities of a chunk and refreshes the stock
+    summary of their products, within the caller's transaction.
+    Returns ids of the changed products.
+    """
+    stored = {
+        (product_id, size_id): quantity
+        for product_id, size_id, quantity in Stock.objects.using(using).filter(
+            product_id__in={product_id for product_id, size_id in quantities}
+        ).values_list("product_id", "size_id", "quantity")
+    }
+    objs = []
+    for (product_id, size_id), (slug, size, quantity) in quantities.items():
+        old_quantity = stored.get((product_id, size_id))
+        if old_quantity == quantity:
+            result.unchanged += 1
+            continue
+        if old_quantity is None:
+            result.created += 1
+        else:
+            result.updated += 1
+        result.changes.append((slug, size, old_quantity, quantity))
+        objs.append(Stock(product_id=product_id, size_id=size_id, quantity=quantity))
+
+    product_ids = {obj.product_id for obj in objs}
+    if objs and not dry_run:
+        Stock.objects.using(using).upsert_quantities(objs, batch_size=batch_size)
+        Product.objects.using(using).filter(
+            pk__in=product_ids
+        ).refresh_stock_summary(batch_size=batch_size)
+
+    return product_ids
+
+
+def import_stock(rows, batch_size=1000, using=DEFAULT_DB_ALIAS, dry_run=False):
+    """
+    Sets quantities of (line, row) pairs (see read_rows), creating
+    missing Stock rows. With dry_run, changes are only reported.
+    Returns a StockImportResult.
+    """
+    result = StockImportResult()
+    product_ids = dict(Product.objects.using(using).values_list("slug", "pk"))
+    size_ids = dict(Size.objects.using(using).values_list("name", "pk"))
+    changed_product_ids = set()
+
+    rows = iter(rows)
+    try:
+        while True:
+            chunk = list(islice(rows, batch_size))
+            if not chunk:
+                break
+
+            quantities = parse_chunk(chunk, product_ids, size_ids, result)
+            with transaction.atomic(using=using):
+                chunk_product_ids = write_chunk(quantities, result, batch_size, using, dry_run)
+            changed_product_ids |= chunk_product_ids
+    finally:
+        # also when a later chunk failed, for the chunks written before
+        if changed_product_ids and not dry_run:
+            caching.bump_catalog_version_on_commit(using=using)
+        result.products = len(changed_product_ids)
+
+    return result
@@ -0,0 +1,54 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from products import images
+
+register = template.Library()
+
+
+@register.filter
+def srcset(obj, format="jpeg"):
+    """
+    {{ product|srcset:"webp" }} - the srcset attribute value with
+    renditions of a Product's main image or an Image in the format.
+    """
+    return images.srcset(obj, format)
+
+
+@register.simple_tag
+def picture(obj, sizes="100vw", alt="", loading="lazy"):
+    """
+    {% picture product sizes="(min-width: 768px) 25vw, 50vw" alt=product.name %}
+    Renders a <picture> with WebP and JPEG renditions of a Product's
+    main image or an Image, the original image is the fallback.
+    Renditions are read from the model, the storage is not accessed.
+    """
+    image_field = images.IMAGE_FIELDS[type(obj)][0]
+    src = getattr(obj, image_field).url
+    renditions = images.get_renditions(obj)
+    if not renditions:
+        return format_html('<img src="{}" alt="{}" loading="{}">', src, alt, loading)
+
+    # the widest rendition gives the browser the aspect ratio
+    widest = renditions[-1]
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        (
+            (images.CONTENT_TYPES[format], images.srcset(obj, format), sizes)
+            for format in dict.fromkeys(rendition["format"] for rendition in renditions)
+            if format != "jpeg"
+        ),
+    )
+    img = format_html(
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" loading="{}">',
+        src,
+        images.srcset(obj, "jpeg"),
+        sizes,
+        widest["width"],
+        widest["height"],
+        alt,
+        loading,
+    )
+
+    return format_html("<picture>{}{}</picture>", sources, img)
@@ -0,0 +1,164 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products import counters, models
+from products.async_views import AsyncProductList
+from products.benchmarks import async_views as async_views_benchmark
+from products.catalog_generator import generate_catalog
+from products.views import ProductList
+
+from .test_models import Stock
+
+
+@override_settings(PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=None)
+class AsyncViewsTestCase(TestCase, Stock):
+    """
+    Async views return the same context as the sync ones.
+    """
+    def setUp(self):
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def get(self, urlconf, name, *args, query=None):
+        with self.settings(ROOT_URLCONF=urlconf):
+            return async_to_sync(self.async_client.get)(reverse(name, args=args), query)
+
+    def get_contexts(self, name, *args, query=None):
+        """
+        Requests the view by the sync and the async URLs,
+        returns contexts of both responses.
+        """
+        contexts = []
+        for urlconf in ["products.urls", "products.async_urls"]:
+            cache.clear()
+            response = self.get(urlconf, name, *args, query=query)
+            self.assertEqual(response.status_code, 200)
+            contexts.append(response.context)
+
+        return contexts
+
+    def assertSameProducts(self, sync_context, async_context):
+        self.assertEqual(list(async_context["products"]), list(sync_context["products"]))
+        self.assertEqual(async_context["facet_counts"], sync_context["facet_counts"])
+        for key in ["categories", "colors", "size_groups"]:
+            self.assertEqual(list(async_context[key]), list(sync_context[key]))
+        self.assertEqual(async_context["max_price"], sync_context["max_price"])
+
+    def test_product_list(self):
+        for query in [{}, {"order_by": "price_ascending"}, {"color": self.color_blue.pk}]:
+            with self.subTest(query):
+                sync_context, async_context = self.get_contexts("product_list", query=query)
+                self.assertSameProducts(sync_context, async_context)
+                self.assertEqual(async_context["paginator"].count, sync_context["paginator"].count)
+                self.assertTrue(async_context["view"].view_is_async)
+
+    def test_offset_pagination(self):
+        view = async_to_sync(AsyncProductList.as_view(paginate_by=1))
+        sync_view = ProductList.as_view(paginate_by=1)
+        factory = RequestFactory()
+
+        for page in ["1", "2", "last"]:
+            with self.subTest(page):
+                response = view(factory.get("/", {"page": page}))
+                sync_response = sync_view(factory.get("/", {"page": page}))
+                self.assertIsInstance(response.context_data["page_obj"].object_list, list)
+                self.assertEqual(
+                    list(response.context_data["page_obj"]),
+                    list(sync_response.context_data["page_obj"]),
+                )
+                self.assertTrue(response.context_data["is_paginated"])
+
+        for page in ["100", "garbage"]:
+            with self.assertRaises(Http404):
+                view(factory.get("/", {"page": page}))
+
+    def test_cursor_pagination(self):
+        view = async_to_sync(AsyncProductList.as_view(pagination_mode="cursor", paginate_by=1))
+        factory = RequestFactory()
+
+        response = view(factory.get("/", {"order_by": "price_ascending"}))
+        page = response.context_data["page_obj"]
+        products = list(page)
+        while page.has_next():
+            response = view(factory.get("/", {"order_by": "price_ascending", "cursor": page.next_cursor}))
+            page = response.context_data["page_obj"]
+            products += list(page)
+
+        self.assertEqual(
+            products,
+            list(models.Product.objects.filter(in_stock=True).order_by("effective_price", "pk")),
+        )
+        with self.assertRaises(Http404):
+            view(factory.get("/", {"cursor": "garbage"}))
+
+    def test_product_by_category_list(self):
+        sync_context, async_context = self.get_contexts("product_by_category_list", "dresses")
+
+        self.assertSameProducts(sync_context, async_context)
+        for key in ["category", "ancestors", "categories"]:
+            self.assertEqual(async_context[key], sync_context[key])
+
+        response = self.get("products.async_urls", "product_by_category_list", "trousers/summer-dresses")
+        self.assertEqual(response.status_code, 404)
+
+    def test_product_detail(self):
+        product = self.linen_floral_dress_cornflower
+        response = self.get("products.async_urls", "product_detail", product.slug)
+
+        self.assertEqual(response.context["product"], product)
+        self.assertEqual(
+            sorted(variant.pk for variant in response.context["other_products"]),
+            sorted(models.Product.objects.filter(parent=product.parent_id).values_list("pk", flat=True)),
+        )
+        # the view is counted once per visitor
+        self.get("products.async_urls", "product_detail", product.slug)
+        self.assertEqual(counters.view_counter.get(product.pk), 1)
+
+        response = self.get("products.async_urls", "product_detail", "missing")
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PRODUCTS_DETAIL_CACHE_TIMEOUT=60)
+    def test_cached_product(self):
+        product = self.linen_floral_dress_cornflower
+        self.get("products.async_urls", "product_detail", product.slug)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get("products.async_urls", "product_detail", product.slug)
+
+        self.assertEqual(response.context["product"], product)
+        # session queries are omitted
+        self.assertFalse([query for query in queries if "products_" in query["sql"]])
+
+
+# detail views don't write to the database, concurrent writes
+# lock tables of the shared in-memory SQLite test database
+@override_settings(
+    PRODUCTS_VIEWED_BACKEND="products.viewed.BloomFilterBackend",
+    PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=None,
+)
+class AsyncViewsBenchmarkTestCase(TransactionTestCase):
+    # requests are handled in threads with their own database connections,
+    # which would not see data of a TestCase transaction
+    def test_run(self):
+        generate_catalog(parents=30, out_of_stock_ratio=0)
+
+        results = async_views_benchmark.run(iterations=4, concurrency=[1, 2])
+
+        for mode in ["sync", "async"]:
+            for view in ["product_list", "product_by_category_list", "product_detail"]:
+                self.assertEqual(list(results[mode][view]), ["1", "2"])
+                self.assertIn("requests_per_second", results[mode][view]["2"])
+        json.dumps(results)
@@ -0,0 +1,157 @@
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from products import autocomplete, models
+
+from .test_models import Stock
+
+
+class AutocompleteTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        cache.clear()
+        autocomplete._index = None
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def labels(self, query, limit=10):
+        return {suggestion["label"] for suggestion in autocomplete.suggest(query, limit)}
+
+    def test_prefix_search(self):
+        self.assertEqual(
+            self.labels("trou"),
+            {"Trousers", "Business trousers", "Business trousers - Navy blue"}
+        )
+        # the last word is a prefix, other words match prefixes of any label word
+        self.assertEqual(
+            self.labels("Dress lin"),
+            {"Linen floral dress - Cornflower", "Linen floral dress - Roses"}
+        )
+        self.assertEqual(self.labels("bl"), {"blue", "Business trousers - Navy blue"})
+        self.assertEqual(len(self.labels("dress", limit=2)), 2)
+        self.assertEqual(self.labels("missing"), set())
+        self.assertEqual(self.labels(" * "), set())
+
+    def test_suggestions(self):
+        suggestions = autocomplete.suggest("navy")
+        self.assertEqual(suggestions, [{
+            "type": autocomplete.PRODUCT,
+            "label": "Business trousers - Navy blue",
+            "url": self.business_trousers_navy_blue.get_absolute_url(),
+        }])
+
+        suggestion, = autocomplete.suggest("mini")
+        self.assertEqual(suggestion["type"], autocomplete.CATEGORY)
+        self.assertEqual(suggestion["url"], self.category_summer_dresses_mini.get_absolute_url())
+
+    def test_no_queries_once_built(self):
+        autocomplete.suggest("dress")
+
+        with self.assertNumQueries(0):
+            autocomplete.suggest("linen")
+
+        # other processes load the index from the cache
+        autocomplete._index = None
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels("navy"), {"Business trousers - Navy blue"})
+
+    def test_writes_rebuild_index(self):
+        autocomplete.suggest("dress")
+
+        with mock.patch.object(autocomplete, "build_index", wraps=autocomplete.build_index) as build_index, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.color_green.name = "olive"
+            self.color_green.save()
+            self.linen_floral_dress.name = "Silk gown"
+            self.linen_floral_dress.save()
+            self.category_summer_dresses.name = "Beach dresses"
+            self.category_summer_dresses.save()
+            self.business_trousers_navy_blue.style = "Charcoal"
+            self.business_trousers_navy_blue.save()
+            self.sleeveless_dress_green.delete()
+        # once for the transaction, when it is committed
+        self.assertEqual(build_index.call_count, 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels("olive"), {"olive"})
+        self.assertEqual(self.labels("silk"), {"Silk gown - Cornflower", "Silk gown - Roses"})
+        self.assertEqual(self.labels("beach"), {"Beach dresses"})
+        self.assertEqual(self.labels("navy"), set())
+        self.assertEqual(self.labels("sleeveless"), {"Sleeveless dress - Red"})
+
+        # the rebuilt index is shared through the cache
+        autocomplete._index = None
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels("charcoal"), {"Business trousers - Charcoal"})
+
+    def test_index_is_invalidated_on_commit(self):
+        autocomplete.suggest("dress")
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.color_green.name = "olive"
+            self.color_green.save()
+        # the index is not rebuilt from uncommitted rows (nor stored)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels("olive"), set())
+
+        for callback in callbacks:
+            callback()
+        # rebuilt by the writer
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels("olive"), {"olive"})
+
+    def test_previous_index_is_served_while_rebuilding(self):
+        autocomplete.suggest("dress")
+        # another process is rebuilding the index
+        cache.add(autocomplete.AUTOCOMPLETE_LOCK_KEY, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.color_green.name = "olive"
+            self.color_green.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.labels("green"), {"green", "Sleeveless dress - Green"})
+
+        # a missed rebuild is done by the next request
+        cache.delete(autocomplete.AUTOCOMPLETE_LOCK_KEY)
+        self.assertEqual(self.labels("olive"), {"olive"})
+
+    def test_bulk_writes_rebuild_index(self):
+        autocomplete.suggest("dress")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Product.objects.filter(pk=self.business_trousers_navy_blue.pk).update(style="Khaki")
+        self.assertEqual(self.labels("khaki"), {"Business trousers - Khaki"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Product.objects.bulk_create([
+                models.Product(
+                    parent=self.business_trousers,
+                    style="Charcoal",
+                    slug="business-trousers-charcoal",
+                    price=199,
+                    main_image_url="products/business_trousers_charcoal.jpg"
+                )
+            ])
+        self.assertEqual(self.labels("charcoal"), {"Business trousers - Charcoal"})
+
+    def test_autocomplete_view(self):
+        url = reverse("product_autocomplete")
+
+        response = self.client.get(url, {"q": "navy"})
+        self.assertEqual(response.json(), {
+            "query": "navy",
+            "suggestions": autocomplete.suggest("navy"),
+        })
+
+        response = self.client.get(url, {"q": "dress", "limit": "1"})
+        self.assertEqual(len(response.json()["suggestions"]), 1)
+
+        response = self.client.get(url, {"limit": "x"})
+        self.assertEqual(response.json(), {"query": "", "suggestions": []})
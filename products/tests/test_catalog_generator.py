@@ -0,0 +1,78 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from products import caching, models
+from products.benchmarks import views as views_benchmark
+from products.catalog_generator import generate_catalog
+from products.category_tree import get_category_tree
+from products.stats import percentile
+
+
+class GenerateCatalogTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_generate_catalog(self):
+        counts = generate_catalog(
+            parents=20, variants=2, root_categories=2, category_depth=3, category_children=2
+        )
+
+        self.assertEqual(counts["products"], 40)
+        self.assertEqual(models.Product.objects.count(), 40)
+        self.assertEqual(models.Image.objects.count(), 80)
+        self.assertEqual(models.Category.objects.count(), 14)
+        self.assertEqual(models.Stock.objects.count(), counts["stock"])
+
+        root = models.Category.objects.get(name="Category 1")
+        self.assertEqual(root.get_descendants().count(), 6)
+        self.assertEqual(
+            models.Product.objects.filter(in_stock=True).count(),
+            models.Stock.objects.filter(quantity__gt=0).values("product").distinct().count()
+        )
+        product = models.Product.objects.get(slug="product-0-style-1")
+        self.assertEqual(product.style, "style 1")
+
+    def test_category_tree_is_invalidated(self):
+        # built by this process before
+        get_category_tree()
+        version = caching.get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            generate_catalog(parents=5, root_categories=1, category_depth=2)
+
+        category = get_category_tree().resolve("category-1/category-1-1")
+        self.assertIsNotNone(category)
+        self.assertEqual(self.client.get(category.get_absolute_url()).status_code, 200)
+        product = models.Product.objects.filter(parent__category=category).first()
+        self.assertIn("category 1-1", product.search_document.lower())
+        self.assertGreater(caching.get_catalog_version(), version)
+
+    def test_generate_catalog_is_deterministic(self):
+        generate_catalog(parents=5, seed=1)
+        first = list(models.Product.objects.values_list("slug", "price", "views"))
+
+        call_command("generate_catalog", parents=5, seed=1, clear=True, stdout=StringIO())
+        self.assertEqual(list(models.Product.objects.values_list("slug", "price", "views")), first)
+
+    def test_generate_catalog_twice(self):
+        generate_catalog(parents=5)
+        with self.assertRaises(CommandError):
+            call_command("generate_catalog", parents=5, stdout=StringIO())
+
+
+class ViewsBenchmarkTestCase(TestCase):
+    def test_percentile(self):
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(percentile(list(range(1, 101)), 95), 95)
+
+    def test_run(self):
+        generate_catalog(parents=30, out_of_stock_ratio=0)
+        results = views_benchmark.run(iterations=3, warmup=1, memory_samples=1)
+
+        for view in ["product_list", "product_by_category_list", "product_detail"]:
+            self.assertIn("p95", results[view]["latency_ms"])
+            self.assertIn("p50", results[view]["queries"])
+            self.assertIn("max", results[view]["peak_memory_kb"])
@@ -0,0 +1,197 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from products import caching, models
+from products.benchmarks import catalog_import as catalog_import_benchmark
+from products.catalog_generator import generate_catalog
+from products.catalog_import import import_catalog, read_feed
+
+from .test_models import Stock
+
+FEED = [
+    {
+        "name": "Wrap dress",
+        "category": "dresses/summer-dresses",
+        "description": "A wrap dress.",
+        "variants": [
+            {
+                "style": "Poppies",
+                "color": "red",
+                "price": "129.00",
+                "discounted_price": "99.00",
+                "main_image_url": "products/wrap-dress-poppies.jpg",
+                "images": ["products/wrap-dress-poppies-1.jpg", "products/wrap-dress-poppies-2.jpg"],
+                "stock": {"36": 3, "38": 0},
+            },
+            {
+                "style": "Navy",
+                "color": "blue",
+                "price": "129.00",
+                "main_image_url": "products/wrap-dress-navy.jpg",
+                "stock": {"40": 0},
+            },
+        ],
+    },
+    {
+        "name": "Linen floral dress",
+        "category": "dresses",
+        "variants": [
+            {
+                "style": "Roses",
+                "color": "red",
+                "price": "89.00",
+                "main_image_url": "products/linen-floral-dress-roses.jpg",
+                "stock": {"36": 2},
+            },
+        ],
+    },
+]
+
+
+class CatalogImportTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def import_feed(self, feed=FEED, **kwargs):
+        lines = "\n".join(line if isinstance(line, str) else json.dumps(line) for line in feed)
+        return import_catalog(read_feed(io.StringIO(lines)), **kwargs)
+
+    def test_import(self):
+        version = caching.get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.import_feed(batch_size=1)
+
+        self.assertEqual(result.as_dict(), {
+            "parents_created": 1,
+            "parents_updated": 0,
+            "products_created": 2,
+            "products_updated": 1,
+            "stock_updated": 4,
+            "images_created": 2,
+            "skipped": 0,
+        })
+        self.assertEqual(caching.get_catalog_version(), version + 1)
+
+        poppies = models.Product.objects.get(slug="wrap-dress-poppies")
+        self.assertEqual(poppies.parent.category, self.category_summer_dresses)
+        self.assertEqual(poppies.color, self.color_red)
+        self.assertEqual(poppies.effective_price, 99)
+        self.assertEqual(poppies.category_lft, self.category_summer_dresses.lft)
+        self.assertTrue(poppies.in_stock)
+        self.assertEqual(poppies.total_quantity, 3)
+        self.assertEqual(poppies.images.count(), 2)
+        self.assertEqual(set(models.Product.objects.search("wrap poppies")), {poppies})
+        navy = models.Product.objects.get(slug="wrap-dress-navy")
+        self.assertFalse(navy.in_stock)
+
+        # existing variants are updated
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertEqual(self.linen_floral_dress_roses.effective_price, 89)
+        self.assertTrue(self.linen_floral_dress_roses.in_stock)
+
+    def test_reimport_is_idempotent(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.import_feed()
+        version = caching.get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.import_feed()
+
+        self.assertEqual(result.as_dict(), dict.fromkeys(result.as_dict(), 0))
+        self.assertEqual(caching.get_catalog_version(), version)
+        self.assertEqual(models.Product.objects.filter(parent__name="Wrap dress").count(), 2)
+
+    def test_changes(self):
+        self.import_feed()
+        feed = json.loads(json.dumps(FEED))
+        feed[0]["category"] = "trousers"
+        feed[0]["variants"][1]["price"] = "119.00"
+        feed[0]["variants"][1]["stock"] = {"40": 1}
+        result = self.import_feed(feed)
+
+        self.assertEqual(result.counts["parents_updated"], 1)
+        self.assertEqual(result.counts["products_updated"], 1)
+        self.assertEqual(result.counts["stock_updated"], 1)
+        navy = models.Product.objects.get(slug="wrap-dress-navy")
+        self.assertEqual(navy.effective_price, 119)
+        self.assertTrue(navy.in_stock)
+        self.assertEqual(
+            set(models.Product.objects.in_category(self.category_trousers)),
+            {
+                navy,
+                models.Product.objects.get(slug="wrap-dress-poppies"),
+                self.business_trousers_navy_blue,
+            }
+        )
+        self.assertIn("Trousers", navy.search_document)
+
+    def test_failing_chunk(self):
+        def rows():
+            yield 1, FEED[0]
+            raise OSError("Connection reset.")
+
+        version = caching.get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(OSError):
+            import_catalog(rows(), batch_size=1)
+
+        # the written chunk is invalidated, once the transaction commits
+        self.assertTrue(models.Product.objects.filter(slug="wrap-dress-poppies").exists())
+        self.assertEqual(caching.get_catalog_version(), version + 1)
+
+    def test_errors(self):
+        variant = FEED[0]["variants"][1]
+        result = self.import_feed([
+            "not json",
+            {"name": "Missing category", "category": "shoes"},
+            {"name": "Missing color", "variants": [{**variant, "color": "pink"}]},
+            {"name": "Missing size", "variants": [{**variant, "stock": {"XXL": 1}}]},
+            {"name": "Invalid price", "variants": [variant, {**variant, "price": "abc"}]},
+            {"name": "x" * 31},
+            {"name": "Stock list", "variants": [{**variant, "stock": [["36", 1]]}]},
+            {"name": "Stock string", "variants": [{**variant, "stock": "36"}]},
+        ])
+
+        self.assertEqual([line for line, message in result.errors], [1, 2, 3, 4, 5, 6, 7, 8])
+        self.assertEqual(result.errors[1][1], "Unknown category: shoes.")
+        self.assertEqual(result.errors[2][1], "Variant 1: Unknown color: pink.")
+        self.assertEqual(result.errors[3][1], "Variant 1: Unknown sizes: XXL.")
+        self.assertTrue(result.errors[4][1].startswith("Variant 2: "))
+        self.assertEqual(result.errors[6][1], "Variant 1: Malformed stock.")
+        self.assertEqual(result.errors[7][1], "Variant 1: Malformed stock.")
+        self.assertFalse(models.ParentProduct.objects.filter(name__startswith="Missing").exists())
+        self.assertFalse(models.ParentProduct.objects.filter(name__startswith="Stock").exists())
+
+    def test_import_catalog_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as f:
+            f.write("\n".join(json.dumps(line) for line in FEED))
+        self.addCleanup(os.remove, f.name)
+
+        out = io.StringIO()
+        call_command("import_catalog", f.name, stdout=out)
+
+        self.assertEqual(json.loads(out.getvalue())["products_created"], 2)
+
+
+class CatalogImportBenchmarkTestCase(TestCase):
+    def test_run(self):
+        generate_catalog(parents=2)
+        results = catalog_import_benchmark.run(iterations=10)
+
+        self.assertEqual(results["import"]["products_created"], 10)
+        self.assertEqual(results["import"]["parents_created"], 4)
+        self.assertEqual(results["reimport"]["products_created"], 0)
+        self.assertIn("variants_per_second", results["import"])
+        # all writes are rolled back
+        self.assertEqual(models.Product.objects.count(), 6)
@@ -0,0 +1,155 @@
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+
+from products import models
+from products.category_tree import get_category_tree
+
+from .test_models import Category
+
+
+class CategoryPathTestCase(TestCase, Category):
+    def setUp(self):
+        Category.__init__(self)
+
+    def assertPaths(self, paths):
+        self.assertEqual(
+            dict(models.Category.objects.values_list("name", "path")),
+            paths
+        )
+
+    def test_path_on_create(self):
+        self.assertPaths({
+            "Dresses": "dresses",
+            "Summer dresses": "dresses/summer-dresses",
+            "Mini dresses": "dresses/summer-dresses/mini-dresses",
+            "Trousers": "trousers",
+            "Business trousers": "trousers/business-trousers",
+        })
+        self.assertEqual(
+            self.category_summer_dresses_mini.get_absolute_url(),
+            "/dresses/summer-dresses/mini-dresses/"
+        )
+
+    def test_rename_updates_descendants(self):
+        self.category_dresses.name = "Gowns"
+        self.category_dresses.save()
+
+        self.assertPaths({
+            "Gowns": "gowns",
+            "Summer dresses": "gowns/summer-dresses",
+            "Mini dresses": "gowns/summer-dresses/mini-dresses",
+            "Trousers": "trousers",
+            "Business trousers": "trousers/business-trousers",
+        })
+
+    def test_move_updates_descendants(self):
+        self.category_summer_dresses.parent = self.category_trousers
+        self.category_summer_dresses.save()
+
+        self.assertPaths({
+            "Dresses": "dresses",
+            "Summer dresses": "trousers/summer-dresses",
+            "Mini dresses": "trousers/summer-dresses/mini-dresses",
+            "Trousers": "trousers",
+            "Business trousers": "trousers/business-trousers",
+        })
+
+    def test_move_node_updates_descendants(self):
+        # DraggableMPTTAdmin moves nodes with move_node
+        models.Category.objects.move_node(
+            self.category_summer_dresses, self.category_business_trousers, "right"
+        )
+
+        self.assertPaths({
+            "Dresses": "dresses",
+            "Summer dresses": "trousers/summer-dresses",
+            "Mini dresses": "trousers/summer-dresses/mini-dresses",
+            "Trousers": "trousers",
+            "Business trousers": "trousers/business-trousers",
+        })
+
+        models.Category.objects.move_node(self.category_summer_dresses, None)
+
+        self.assertPaths({
+            "Dresses": "dresses",
+            "Summer dresses": "summer-dresses",
+            "Mini dresses": "summer-dresses/mini-dresses",
+            "Trousers": "trousers",
+            "Business trousers": "trousers/business-trousers",
+        })
+
+    def test_path_length_is_validated(self):
+        parent = self.category_summer_dresses_mini
+        for i in range(7):
+            parent = models.Category.objects.create(name="%s %s" % ("x" * 28, i), parent=parent)
+
+        category = models.Category(name="y" * 30, parent=parent)
+        with self.assertRaises(ValidationError):
+            category.full_clean()
+        with self.assertRaises(ValidationError):
+            category.save()
+        self.assertFalse(models.Category.objects.filter(name=category.name).exists())
+
+        # renaming an ancestor lengthens paths of all descendants
+        self.category_dresses.name = "x" * 32
+        with self.assertRaises(ValidationError):
+            self.category_dresses.save()
+        self.category_dresses.refresh_from_db()
+        self.assertEqual(self.category_dresses.path, "dresses")
+        self.assertTrue(models.Category.objects.get(pk=parent.pk).path.startswith("dresses/"))
+
+
+class CategoryTreeTestCase(TestCase, Category):
+    def setUp(self):
+        cache.clear()
+        Category.__init__(self)
+
+    def test_tree(self):
+        tree = get_category_tree()
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_category_tree(), tree)
+            category = tree.resolve("dresses/summer-dresses/")
+            self.assertEqual(category, self.category_summer_dresses)
+            self.assertIsNone(tree.resolve("trousers/summer-dresses"))
+            self.assertEqual(
+                tree.get_ancestors(category, include_self=True),
+                [self.category_dresses, self.category_summer_dresses]
+            )
+            self.assertEqual(
+                tree.get_descendant_ids(tree.resolve("dresses")),
+                {
+                    self.category_dresses.pk,
+                    self.category_summer_dresses.pk,
+                    self.category_summer_dresses_mini.pk,
+                }
+            )
+            self.assertEqual(
+                tree.get_descendant_ids(category, include_self=False),
+                {self.category_summer_dresses_mini.pk}
+            )
+            self.assertEqual(tree.get_roots(), [self.category_dresses, self.category_trousers])
+            self.assertEqual(tree.get_children(self.category_trousers), [self.category_business_trousers])
+            self.assertEqual(tree.get_url(self.category_business_trousers.pk), "/trousers/business-trousers/")
+
+    def test_tree_invalidation(self):
+        tree = get_category_tree()
+        self.category_summer_dresses.parent = self.category_trousers
+        self.category_summer_dresses.save()
+
+        new_tree = get_category_tree()
+        self.assertIsNot(new_tree, tree)
+        self.assertEqual(
+            new_tree.resolve("trousers/summer-dresses/mini-dresses"),
+            self.category_summer_dresses_mini
+        )
+        self.assertEqual(
+            new_tree.get_descendant_ids(new_tree.resolve("trousers")),
+            {
+                self.category_trousers.pk,
+                self.category_business_trousers.pk,
+                self.category_summer_dresses.pk,
+                self.category_summer_dresses_mini.pk,
+            }
+        )
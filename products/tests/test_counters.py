@@ -0,0 +1,149 @@
+import threading
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from products import counters
+from products.models import Product, ParentProduct
+
+
+class BufferedCounterTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.counter = counters.BufferedCounter("test_counter")
+
+    def test_incr_and_drain(self):
+        self.assertEqual(self.counter.incr(1), 1)
+        self.assertEqual(self.counter.incr(1), 2)
+        self.assertEqual(self.counter.incr(2, 5), 5)
+
+        self.assertEqual(self.counter.drain(), {1: 2, 2: 5})
+        self.assertEqual(self.counter.get(1), 0)
+        self.assertEqual(self.counter.drain(), {})
+
+        self.counter.incr(1)
+        self.assertEqual(self.counter.drain(), {1: 1})
+
+    def test_drain_is_locked(self):
+        self.counter.incr(1)
+        cache.add(self.counter.key("lock"), 1)
+        self.assertEqual(self.counter.drain(), {})
+
+        cache.delete(self.counter.key("lock"))
+        self.assertEqual(self.counter.drain(), {1: 1})
+
+    def test_journal_entry_not_written_yet(self):
+        self.counter.incr(1)
+        # a position reserved by a concurrent increment
+        cache.incr(self.counter.key("journal"))
+        self.counter.incr(2)
+
+        self.assertEqual(self.counter.drain(), {1: 1})
+        # the missing entry is skipped with the next drain
+        self.assertEqual(self.counter.drain(), {2: 1})
+
+    def test_concurrent_increments(self):
+        """
+        Test that no increments are lost when many threads
+        increment the counters while they are being drained.
+        """
+        threads_number, iterations = 8, 250
+        drained = {}
+
+        def increment():
+            for i in range(iterations):
+                self.counter.incr(i % 5)
+
+        threads = [threading.Thread(target=increment) for _ in range(threads_number)]
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            for pk, delta in self.counter.drain().items():
+                drained[pk] = drained.get(pk, 0) + delta
+        for thread in threads:
+            thread.join()
+        for pk, delta in self.counter.drain().items():
+            drained[pk] = drained.get(pk, 0) + delta
+
+        self.assertEqual(sum(drained.values()), threads_number * iterations)
+        self.assertEqual(drained, {pk: threads_number * iterations // 5 for pk in range(5)})
+
+
+class FlushViewCountsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        parent = ParentProduct.objects.create(name="Floral dress")
+        self.products = [
+            Product.objects.create(
+                parent=parent,
+                style=style,
+                price=99,
+                main_image_url="products/floral_dress.jpg",
+            )
+            for style in ["red", "blue", "green"]
+        ]
+
+    def test_flush_view_counts(self):
+        for i, product in enumerate(self.products):
+            for _ in range(i + 1):
+                counters.view_counter.incr(product.pk)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(counters.flush_view_counts(), 6)
+        self.assertEqual(self.count_updates(ctx), 1)
+
+        self.assertEqual(
+            [product.views for product in Product.objects.order_by("pk")],
+            [1, 2, 3]
+        )
+        self.assertEqual(counters.flush_view_counts(), 0)
+
+    def test_flush_view_counts_in_batches(self):
+        for product in self.products:
+            counters.view_counter.incr(product.pk)
+
+        with CaptureQueriesContext(connection) as ctx:
+            counters.flush_view_counts(batch_size=2)
+        self.assertEqual(self.count_updates(ctx), 2)
+
+    def test_concurrent_views(self):
+        product = self.products[0]
+
+        def view():
+            for _ in range(100):
+                counters.view_counter.incr(product.pk)
+
+        threads = [threading.Thread(target=view) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        counters.flush_view_counts()
+        product.refresh_from_db()
+        self.assertEqual(product.views, 800)
+
+    def test_failed_flush_restores_counters(self):
+        counters.view_counter.incr(self.products[0].pk)
+
+        with mock.patch.object(Product.objects, "filter", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                counters.flush_view_counts()
+
+        self.assertEqual(counters.view_counter.get(self.products[0].pk), 1)
+        self.assertEqual(counters.flush_view_counts(), 1)
+
+    @staticmethod
+    def count_updates(ctx):
+        return len([query for query in ctx.captured_queries if query["sql"].startswith("UPDATE")])
+
+    def test_flush_view_counts_command(self):
+        counters.view_counter.incr(self.products[0].pk)
+        call_command("flush_view_counts", stdout=StringIO())
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].views, 1)
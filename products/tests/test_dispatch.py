@@ -0,0 +1,124 @@
+import json
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from products import counters, dispatch, models, trending
+from products.benchmarks import view_dispatch as view_dispatch_benchmark
+from products.catalog_generator import generate_catalog
+
+from .test_models import Product
+
+
+class PausedViewQueue(dispatch.ViewQueue):
+    """
+    A queue whose thread starts counting views after release().
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.released = threading.Event()
+
+    def release(self):
+        self.released.set()
+
+    def run(self, events):
+        self.released.wait()
+        super().run(events)
+
+
+@override_settings(PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=None)
+class ViewQueueTestCase(TestCase, Product):
+    def setUp(self) -> None:
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+
+    def get_views(self, product):
+        return counters.view_counter.get(product.pk)
+
+    @override_settings(PRODUCTS_VIEW_DISPATCH="thread")
+    def test_detail_view(self):
+        product = self.sleeveless_dress_green
+        self.client.get(reverse("product_detail", args=[product.slug]))
+        self.client_class().get(reverse("product_detail", args=[product.slug]))
+
+        self.assertTrue(dispatch.view_queue.flush())
+        self.assertEqual(self.get_views(product), 2)
+
+    def test_batches(self):
+        view_queue = PausedViewQueue(maxsize=10)
+        for product in [self.sleeveless_dress_green] * 3 + [self.linen_floral_dress_roses]:
+            view_queue.put(product.pk)
+        self.assertEqual(self.get_views(self.sleeveless_dress_green), 0)
+        self.assertFalse(view_queue.flush(timeout=0.01))
+
+        view_queue.release()
+        self.assertTrue(view_queue.flush())
+        self.assertEqual(self.get_views(self.sleeveless_dress_green), 3)
+        self.assertEqual(self.get_views(self.linen_floral_dress_roses), 1)
+        self.assertEqual(view_queue.stats, {"queued": 4, "counted": 4})
+
+    def test_connections_are_checked_per_batch(self):
+        view_queue = PausedViewQueue(maxsize=10)
+        view_queue.put(self.sleeveless_dress_green.pk)
+        with mock.patch.object(dispatch, "close_old_connections") as close_old_connections:
+            view_queue.release()
+            self.assertTrue(view_queue.flush())
+
+        # before and after the batch
+        self.assertEqual(close_old_connections.call_count, 2)
+        self.assertEqual(view_queue.stats, {"queued": 1, "counted": 1})
+
+    def test_trending_scores_are_folded(self):
+        view_queue = PausedViewQueue(maxsize=10)
+        view_queue.put(self.sleeveless_dress_green.pk)
+        with mock.patch.object(trending, "maybe_fold_trending_scores") as maybe_fold_trending_scores:
+            view_queue.release()
+            self.assertTrue(view_queue.flush())
+
+        maybe_fold_trending_scores.assert_called_once_with()
+
+    def test_overflow(self):
+        product = self.sleeveless_dress_green
+        for overflow, stats, inline_views in [
+            ("drop", {"queued": 1, "dropped": 1}, 0),
+            ("block", {"queued": 1, "dropped": 1}, 0),
+            ("sync", {"queued": 1, "counted_inline": 1}, 1),
+        ]:
+            with self.subTest(overflow):
+                cache.clear()
+                view_queue = PausedViewQueue(maxsize=1, overflow=overflow)
+                view_queue.block_timeout = 0.01
+                view_queue.put(product.pk)
+                view_queue.put(product.pk)
+
+                self.assertEqual(view_queue.stats, stats)
+                self.assertEqual(self.get_views(product), inline_views)
+                view_queue.release()
+                self.assertTrue(view_queue.flush())
+                self.assertEqual(self.get_views(product), inline_views + 1)
+
+        with self.settings(PRODUCTS_VIEW_QUEUE_OVERFLOW="unknown"):
+            with self.assertRaises(ValueError):
+                dispatch.ViewQueue().put(product.pk)
+
+
+class ViewDispatchBenchmarkTestCase(TestCase):
+    def test_run(self):
+        generate_catalog(parents=3)
+        views = list(models.Product.objects.order_by("pk").values_list("views", flat=True))
+
+        results = view_dispatch_benchmark.run(iterations=4, flush_interval=None)
+
+        self.assertEqual(results["thread"]["queue"], {"queued": 4, "counted": 4})
+        self.assertIn("p95", results["sync"]["latency_ms"])
+        json.dumps(results)
+        # views are restored
+        self.assertEqual(list(models.Product.objects.order_by("pk").values_list("views", flat=True)), views)
@@ -0,0 +1,129 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from products import caching, facets, models
+from products.filter import ProductFilter
+from products.tests.test_models import Stock
+
+
+class FilterOptionsTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def test_build_filter_options(self):
+        options = facets.build_filter_options()
+        self.assertEqual(options["categories"], [self.category_dresses, self.category_trousers])
+        self.assertEqual(len(options["colors"]), 3)
+        self.assertEqual(options["max_price"], 199)
+
+    def test_filter_options_are_cached(self):
+        facets.get_filter_options()
+
+        with self.assertNumQueries(0):
+            options = facets.get_filter_options()
+            for size_group in options["size_groups"]:
+                self.assertEqual(len(size_group.sizes.all()), 3)
+
+    def test_cache_is_invalidated(self):
+        facets.get_filter_options()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Color.objects.create(name="black", hex_code="#000000")
+        self.assertEqual(len(facets.get_filter_options()["colors"]), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Stock.objects.filter(product=self.business_trousers_navy_blue).update(quantity=0)
+        self.assertEqual(facets.get_filter_options()["max_price"], 79)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.size_36.delete()
+        self.assertEqual(len(facets.get_filter_options()["size_groups"][0].sizes.all()), 2)
+
+    def test_version_is_bumped_on_commit(self):
+        facets.get_filter_options()
+        version = caching.get_catalog_version()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            models.Color.objects.create(name="black", hex_code="#000000")
+            models.Stock.objects.filter(product=self.business_trousers_navy_blue).update(quantity=0)
+        # until the writes are committed, concurrent readers don't see
+        # them, they must not cache what they read under a new version
+        self.assertEqual(caching.get_catalog_version(), version)
+        self.assertEqual(len(facets.get_filter_options()["colors"]), 3)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(caching.get_catalog_version(), version + 2)
+        self.assertEqual(len(facets.get_filter_options()["colors"]), 4)
+
+    def test_product_list_context(self):
+        response = self.client.get(reverse("product_list"))
+        self.assertEqual(response.context["max_price"], 199)
+        self.assertEqual(len(response.context["colors"]), 3)
+
+
+class FacetCountsTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+        # available products: cornflower dress (blue, 36, 79),
+        # roses dress (red, 40, 69) and navy blue trousers (blue, 36, 199)
+        self.stock_linen_floral_dress_roses_40.quantity = 1
+        self.stock_linen_floral_dress_roses_40.save()
+
+    def test_count_facets(self):
+        with self.assertNumQueries(3):
+            counts = facets.count_facets(ProductFilter())
+
+        self.assertEqual(counts["colors"], {self.color_blue.pk: 2, self.color_red.pk: 1})
+        self.assertEqual(counts["sizes"], {self.size_36.pk: 2, self.size_40.pk: 1})
+        self.assertEqual(
+            [bucket["count"] for bucket in counts["prices"]],
+            [0, 2, 1, 0]
+        )
+
+    def test_facet_excludes_its_own_filter(self):
+        product_filter = ProductFilter(color=[str(self.color_red.pk)], size=[str(self.size_36.pk)])
+        counts = facets.count_facets(product_filter)
+
+        # colors are narrowed by size only
+        self.assertEqual(counts["colors"], {self.color_blue.pk: 2})
+        # sizes are narrowed by color only
+        self.assertEqual(counts["sizes"], {self.size_40.pk: 1})
+        # prices are narrowed by color and size
+        self.assertEqual(sum(bucket["count"] for bucket in counts["prices"]), 0)
+
+    def test_count_facets_for_category(self):
+        counts = facets.count_facets(ProductFilter(), self.category_trousers)
+        self.assertEqual(counts["colors"], {self.color_blue.pk: 1})
+        self.assertEqual(counts["sizes"], {self.size_36.pk: 1})
+
+    @override_settings(PRODUCTS_PRICE_BUCKETS=((0, 75), (75, None)))
+    def test_configurable_price_buckets(self):
+        counts = facets.count_facets(ProductFilter(price_lte=["100"]))
+        self.assertEqual(counts["prices"], [
+            {"min": 0, "max": 75, "count": 1},
+            {"min": 75, "max": None, "count": 2},
+        ])
+
+    def test_facet_counts_are_cached_per_filter(self):
+        facets.get_facet_counts(ProductFilter(color=["1", "2"]))
+
+        with self.assertNumQueries(0):
+            facets.get_facet_counts(ProductFilter(color=["2", "1"]))
+        with self.assertNumQueries(3):
+            facets.get_facet_counts(ProductFilter(color=["1"]))
@@ -0,0 +1,219 @@
+import io
+import json
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image as PILImage
+
+from products import images, jobs, models
+from products.benchmarks import renditions as renditions_benchmark
+
+from .test_models import Stock
+
+
+def get_image_data(width, height, format="JPEG", mode="RGB"):
+    output = io.BytesIO()
+    PILImage.new(mode, (width, height), (255, 0, 0, 128)[:len(mode)]).save(output, format)
+
+    return output.getvalue()
+
+
+@override_settings(
+    MEDIA_URL="/media/",
+    PRODUCTS_IMAGE_WIDTHS=[640, 320],
+    PRODUCTS_IMAGE_FORMATS=["webp", "jpeg"],
+)
+class ImagesTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def save_image(self, name, data):
+        return default_storage.save(name, ContentFile(data))
+
+    def test_render(self):
+        rendered = images.render(get_image_data(800, 1000), [320, 640, 1280], ["webp", "jpeg"], 80)
+
+        self.assertEqual(
+            [(format, width, height) for format, width, height, data in rendered],
+            [("webp", 320, 400), ("jpeg", 320, 400), ("webp", 640, 800), ("jpeg", 640, 800)]
+        )
+        with PILImage.open(io.BytesIO(rendered[0][3])) as image:
+            self.assertEqual((image.format, image.size), ("WEBP", (320, 400)))
+
+        # an image narrower than all widths gets one rendition in its width,
+        # the alpha channel is kept in WebP only
+        rendered = images.render(get_image_data(200, 100, "PNG", "RGBA"), [320], ["webp", "jpeg"], 80)
+        self.assertEqual([(width, height) for format, width, height, data in rendered], [(200, 100)] * 2)
+        with PILImage.open(io.BytesIO(rendered[0][3])) as image:
+            self.assertEqual(image.mode, "RGBA")
+        with PILImage.open(io.BytesIO(rendered[1][3])) as image:
+            self.assertEqual(image.mode, "RGB")
+
+    def test_update_renditions(self):
+        product = self.linen_floral_dress_roses
+        product.main_image_url = self.save_image("products/roses.jpg", get_image_data(800, 600))
+        product.save()
+        self.assertFalse(images.is_current(product))
+        self.assertEqual(images.get_renditions(product), [])
+
+        self.assertEqual(images.update_renditions([product]), 1)
+        product.refresh_from_db()
+        self.assertTrue(images.is_current(product))
+        self.assertEqual(product.main_image_renditions, {
+            "source": "products/roses.jpg",
+            "renditions": [
+                {"format": "webp", "width": 320, "height": 240, "path": "products/renditions/roses.jpg-320.webp"},
+                {"format": "jpeg", "width": 320, "height": 240, "path": "products/renditions/roses.jpg-320.jpg"},
+                {"format": "webp", "width": 640, "height": 480, "path": "products/renditions/roses.jpg-640.webp"},
+                {"format": "jpeg", "width": 640, "height": 480, "path": "products/renditions/roses.jpg-640.jpg"},
+            ]
+        })
+        self.assertTrue(default_storage.exists("products/renditions/roses.jpg-640.webp"))
+        self.assertEqual(
+            images.srcset(product, "webp"),
+            "/media/products/renditions/roses.jpg-320.webp 320w, /media/products/renditions/roses.jpg-640.webp 640w"
+        )
+
+        # regenerating replaces the files
+        self.assertEqual(images.update_renditions([product]), 1)
+        self.assertEqual(len(default_storage.listdir("products/renditions")[1]), 4)
+
+        # renditions of a replaced image are not used
+        product.main_image_url = "products/other.jpg"
+        self.assertFalse(images.is_current(product))
+        self.assertEqual(images.srcset(product), "")
+
+        # a missing file is not updated
+        self.assertEqual(images.update_renditions([product]), 0)
+
+    def test_images_with_the_same_stem(self):
+        products = [self.linen_floral_dress_roses, self.business_trousers_navy_blue]
+        products[0].main_image_url = self.save_image("products/dress.jpg", get_image_data(800, 600))
+        products[1].main_image_url = self.save_image("products/dress.png", get_image_data(800, 400, "PNG"))
+        self.assertEqual(images.update_renditions(products), 2)
+
+        # each image keeps its own renditions
+        renditions = [images.get_renditions(product, "jpeg")[0] for product in products]
+        self.assertEqual(
+            [rendition["path"] for rendition in renditions],
+            ["products/renditions/dress.jpg-320.jpg", "products/renditions/dress.png-320.jpg"]
+        )
+        for rendition, height in zip(renditions, [240, 160]):
+            with default_storage.open(rendition["path"]) as f, PILImage.open(f) as image:
+                self.assertEqual(image.size, (320, height))
+
+    def test_uploaded_image(self):
+        image = models.Image.objects.create(
+            product=self.sleeveless_dress_green,
+            url=SimpleUploadedFile("green.png", get_image_data(1000, 500, "PNG")),
+        )
+        # renditions are generated by the worker (see test_jobs)
+        self.assertEqual(images.get_renditions(image), [])
+        jobs.process_jobs()
+        image.refresh_from_db()
+        self.assertTrue(images.is_current(image))
+        self.assertEqual(
+            [(rendition["format"], rendition["width"]) for rendition in images.get_renditions(image)],
+            [("webp", 320), ("jpeg", 320), ("webp", 640), ("jpeg", 640)]
+        )
+
+        # saving without a new upload keeps the renditions
+        with self.assertNumQueries(1):
+            image.save()
+
+        product = self.business_trousers_navy_blue
+        product.main_image_url = SimpleUploadedFile("navy-blue.jpg", get_image_data(400, 400))
+        product.save()
+        jobs.process_jobs()
+        product.refresh_from_db()
+        self.assertEqual(images.get_renditions(product, "jpeg")[0]["width"], 320)
+
+    def test_template_tags(self):
+        product = self.linen_floral_dress_roses
+        product.main_image_url = self.save_image("products/roses.jpg", get_image_data(800, 600))
+        images.update_renditions([product])
+        template = Template(
+            '{% load product_images %}{{ product|srcset:"webp" }}|'
+            '{% picture product sizes="50vw" alt=product.name %}'
+        )
+
+        with self.assertNumQueries(0):
+            output = template.render(Context({"product": product}))
+
+        srcset, picture = output.split("|")
+        self.assertEqual(srcset, images.srcset(product, "webp"))
+        self.assertHTMLEqual(
+            picture,
+            '<picture>'
+            '<source type="image/webp" srcset="/media/products/renditions/roses.jpg-320.webp 320w, '
+            '/media/products/renditions/roses.jpg-640.webp 640w" sizes="50vw">'
+            '<img src="/media/products/roses.jpg" srcset="/media/products/renditions/roses.jpg-320.jpg 320w, '
+            '/media/products/renditions/roses.jpg-640.jpg 640w" sizes="50vw" width="640" height="480" '
+            'alt="Linen floral dress - Roses" loading="lazy">'
+            '</picture>'
+        )
+
+        # without renditions the original image is rendered
+        product = self.sleeveless_dress_green
+        self.assertHTMLEqual(
+            template.render(Context({"product": product})).split("|")[1],
+            '<img src="/media/products/sleeveless-dress-green.jpg" alt="Sleeveless dress - Green" loading="lazy">'
+        )
+
+    def test_generate_renditions_command(self):
+        for product in [self.linen_floral_dress_roses, self.sleeveless_dress_green]:
+            product.main_image_url = self.save_image("products/%s.jpg" % product.slug, get_image_data(700, 700))
+            product.save()
+        models.Image.objects.create(
+            product=self.sleeveless_dress_green,
+            url=self.save_image("products/green-1.jpg", get_image_data(500, 700)),
+        )
+
+        out = io.StringIO()
+        call_command("generate_renditions", workers=2, batch_size=2, stdout=out)
+
+        # images of the other products do not exist
+        self.assertEqual(
+            json.loads(out.getvalue()),
+            {"product": 2, "product_failed": 3, "image": 1, "image_failed": 0}
+        )
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertTrue(images.is_current(self.linen_floral_dress_roses))
+
+        # current renditions are skipped
+        out = io.StringIO()
+        call_command("generate_renditions", workers=1, stdout=out)
+        self.assertEqual(
+            json.loads(out.getvalue()),
+            {"product": 0, "product_failed": 3, "image": 0, "image_failed": 0}
+        )
+
+
+class RenditionsBenchmarkTestCase(TestCase):
+    def test_run(self):
+        results = renditions_benchmark.run(iterations=2, width=700, height=500)
+
+        self.assertEqual(results["images"], 2)
+        self.assertIn("images_per_second", results["workers_1"])
+        self.assertIn("webp_bytes_ratio", results)
+        json.dumps(results)
@@ -0,0 +1,115 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from products import models
+from products.catalog_generator import generate_catalog
+from products.instrumentation import METRICS_HEADER, fingerprint, query_budget
+
+
+class InstrumentationTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        generate_catalog(parents=10, root_categories=1)
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" IN (1, 2, 3) AND "name" = \'it\'\'s\' LIMIT 21'),
+            'SELECT * FROM "t" WHERE "id" IN (...) AND "name" = ? LIMIT ?'
+        )
+        self.assertEqual(
+            fingerprint('SELECT * FROM "t" WHERE "id" = 1'),
+            fingerprint('SELECT * FROM "t" WHERE "id" = 25'),
+        )
+
+    @override_settings(PRODUCTS_INSTRUMENTATION=True)
+    def test_metrics_header_and_log(self):
+        with self.assertLogs("products.instrumentation", level="INFO") as logs:
+            response = self.client.get(reverse("product_list"))
+
+        self.assertIn("queries=", response[METRICS_HEADER])
+        self.assertIn("cache_misses=", response[METRICS_HEADER])
+        self.assertEqual(logs.records[0].view, "ProductList")
+        self.assertGreater(logs.records[0].metrics["queries"], 0)
+
+        # filter options are cached now
+        response = self.client.get(reverse("product_list"))
+        self.assertIn("cache_hits=2", response[METRICS_HEADER])
+
+    def test_metrics_disabled_by_default(self):
+        response = self.client.get(reverse("product_list"))
+        self.assertNotIn(METRICS_HEADER, response)
+
+    def test_query_budget(self):
+        with query_budget(1) as metrics:
+            models.Product.objects.count()
+        self.assertEqual(metrics.queries, 1)
+
+        with self.assertRaises(AssertionError) as cm:
+            with query_budget(1):
+                for product in models.Product.objects.all()[:3]:
+                    product.parent.name
+        self.assertIn("Duplicated queries:\n3x", str(cm.exception))
+
+        @query_budget(0)
+        def no_queries():
+            pass
+        no_queries()
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Makes sure the number of queries of the views does not grow
+    with the number of listed products. The views' context is accessed
+    the way a template would do it.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalog(parents=30, root_categories=2, out_of_stock_ratio=0.2)
+
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def access_product(product):
+        product.name
+        product.get_absolute_url()
+        product.color.name
+        for stock in product.stock.all():
+            stock.size.name
+        for image in product.images.all():
+            image.url
+
+    def access_list_context(self, context):
+        for product in context["products"]:
+            self.access_product(product)
+        for size_group in context["size_groups"]:
+            for size in size_group.sizes.all():
+                size.name
+
+    def test_product_list(self):
+        url = reverse("product_list")
+        with query_budget(13):
+            response = self.client.get(url)
+            self.access_list_context(response.context)
+
+        # filter options and facet counts are cached
+        with query_budget(5):
+            response = self.client.get(url + "?order_by=price_ascending&page=2")
+            self.access_list_context(response.context)
+
+    def test_product_by_category_list(self):
+        with query_budget(14):
+            response = self.client.get(reverse("product_by_category_list", args=["category-1"]))
+            self.access_list_context(response.context)
+
+    def test_product_detail(self):
+        product = models.Product.objects.filter(in_stock=True).first()
+        with query_budget(11):
+            response = self.client.get(product.get_absolute_url())
+            self.access_product(response.context["product"])
+            # color variants are displayed with their main image only
+            for other_product in response.context["other_products"]:
+                other_product.get_absolute_url()
+                other_product.main_image_url
+                other_product.color.name
@@ -0,0 +1,245 @@
+import io
+import json
+import shutil
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from freezegun import freeze_time
+
+from products import caching, images, jobs, models
+
+from .test_images import get_image_data
+from .test_models import Stock
+
+
+@override_settings(PRODUCTS_IMAGE_WIDTHS=[320], PRODUCTS_IMAGE_FORMATS=["webp", "jpeg"])
+class ImageJobsTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def upload(self, product, name, data):
+        product.main_image_url = SimpleUploadedFile(name, data)
+        product.save()
+
+        return product.main_image_url.name
+
+    def test_upload_queues_job(self):
+        product = self.linen_floral_dress_roses
+        name = self.upload(product, "roses.jpg", get_image_data(800, 600))
+        image = models.Image.objects.create(product=product, url=name)
+        product.save()
+
+        # only the upload queues a job
+        job = models.ImageJob.objects.get()
+        self.assertEqual((job.source, job.status), (name, models.ImageJob.PENDING))
+
+        version = caching.get_catalog_version()
+        processed = jobs.process_jobs()
+
+        self.assertEqual(processed, [job])
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.ImageJob.DONE)
+        self.assertEqual(job.attempts, 1)
+        self.assertEqual(len(job.content_hash), 64)
+        self.assertEqual([rendition["width"] for rendition in job.result["renditions"]], [320, 320])
+        # renditions are stored on all objects with the file
+        product.refresh_from_db()
+        image.refresh_from_db()
+        self.assertEqual(product.main_image_renditions, job.result)
+        self.assertEqual(image.renditions, job.result)
+        self.assertEqual(caching.get_catalog_version(), version + 1)
+
+        self.assertEqual(jobs.process_jobs(), [])
+
+    def test_enqueue_dedupe(self):
+        queue = jobs.DatabaseQueue()
+        queue.enqueue(["products/a.jpg", "products/a.jpg", "products/b.jpg"])
+        queue.enqueue(["products/a.jpg"])
+
+        self.assertEqual(
+            list(models.ImageJob.objects.order_by("source").values_list("source", flat=True)),
+            ["products/a.jpg", "products/b.jpg"]
+        )
+
+        # a processed file can be queued again
+        models.ImageJob.objects.update(status=models.ImageJob.DONE)
+        queue.enqueue(["products/a.jpg"])
+        self.assertEqual(models.ImageJob.objects.filter(status=models.ImageJob.PENDING).count(), 1)
+
+    def test_content_hash_dedupe(self):
+        data = get_image_data(500, 500)
+        first = self.upload(self.linen_floral_dress_roses, "first.jpg", data)
+        second = self.upload(self.sleeveless_dress_green, "second.jpg", data)
+        jobs.process_jobs()
+
+        # the same content is resized once
+        self.assertEqual(len(default_storage.listdir("products/renditions")[1]), 2)
+        self.sleeveless_dress_green.refresh_from_db()
+        self.assertTrue(images.is_current(self.sleeveless_dress_green))
+        first_job, second_job = models.ImageJob.objects.order_by("pk")
+        self.assertEqual(first_job.content_hash, second_job.content_hash)
+        self.assertEqual(second_job.result["source"], second)
+        self.assertEqual(second_job.result["renditions"], first_job.result["renditions"])
+
+        # renditions of processed files are reused by later jobs
+        third = self.upload(self.business_trousers_navy_blue, "third.jpg", data)
+        jobs.process_jobs()
+        self.assertEqual(len(default_storage.listdir("products/renditions")[1]), 2)
+        self.business_trousers_navy_blue.refresh_from_db()
+        self.assertEqual(self.business_trousers_navy_blue.main_image_renditions["source"], third)
+
+        # other rendition options give another hash
+        with self.settings(PRODUCTS_IMAGE_WIDTHS=[200]):
+            self.assertNotEqual(jobs.get_content_hash(data), first_job.content_hash)
+        self.assertNotEqual(first, second)
+
+    @override_settings(PRODUCTS_IMAGE_JOB_MAX_ATTEMPTS=3, PRODUCTS_IMAGE_JOB_BACKOFF=10)
+    def test_retry_with_backoff(self):
+        default_storage.save("products/broken.jpg", ContentFile(b"not an image"))
+        jobs.get_queue().enqueue(["products/missing.jpg", "products/broken.jpg"])
+
+        with freeze_time("2024-01-01 12:00:00") as frozen_time:
+            models.ImageJob.objects.update(run_after=timezone.now())
+            self.assertEqual(len(jobs.process_jobs()), 2)
+            broken, missing = models.ImageJob.objects.order_by("source")
+            self.assertEqual(missing.error, "The file could not be read.")
+            self.assertEqual(broken.error, "The image could not be decoded.")
+            self.assertEqual(missing.status, models.ImageJob.PENDING)
+            self.assertEqual(missing.run_after, timezone.now() + timedelta(seconds=10))
+
+            # not due yet
+            frozen_time.tick(timedelta(seconds=9))
+            self.assertEqual(jobs.process_jobs(), [])
+
+            frozen_time.tick(timedelta(seconds=1))
+            self.assertEqual(len(jobs.process_jobs()), 2)
+            missing.refresh_from_db()
+            self.assertEqual(missing.attempts, 2)
+            self.assertEqual(missing.run_after, timezone.now() + timedelta(seconds=20))
+
+            frozen_time.tick(timedelta(seconds=20))
+            self.assertEqual(len(jobs.process_jobs()), 2)
+            self.assertEqual(
+                set(models.ImageJob.objects.values_list("status", "attempts")),
+                {(models.ImageJob.FAILED, 3)}
+            )
+            frozen_time.tick(timedelta(hours=1))
+            self.assertEqual(jobs.process_jobs(), [])
+
+    def test_broken_process_pool(self):
+        class BrokenExecutor:
+            def map(self, function, args):
+                raise BrokenProcessPool
+                yield
+
+        data = get_image_data(500, 500)
+        self.upload(self.linen_floral_dress_roses, "first.jpg", data)
+        jobs.process_jobs()
+        second = self.upload(self.sleeveless_dress_green, "second.jpg", data)
+        third = self.upload(self.business_trousers_navy_blue, "third.jpg", get_image_data(400, 400))
+
+        with self.assertRaises(BrokenProcessPool), self.assertLogs("products.jobs", "ERROR"):
+            jobs.process_jobs(BrokenExecutor())
+
+        # renditions of the same content were found without resizing
+        second_job, third_job = models.ImageJob.objects.filter(source__in=[second, third]).order_by("source")
+        self.assertEqual(second_job.status, models.ImageJob.DONE)
+        self.assertEqual(third_job.status, models.ImageJob.PENDING)
+        self.assertIn("BrokenProcessPool", third_job.error)
+
+    def test_process_image_jobs_command_replaces_broken_pool(self):
+        with mock.patch.object(jobs, "process_jobs", side_effect=[BrokenProcessPool(), []]), \
+                mock.patch.object(images, "get_executor", wraps=images.get_executor) as get_executor:
+            err = io.StringIO()
+            call_command("process_image_jobs", workers=1, once=True, stdout=io.StringIO(), stderr=err)
+
+        self.assertEqual(get_executor.call_count, 2)
+        self.assertIn("The process pool broke", err.getvalue())
+
+    @override_settings(PRODUCTS_IMAGE_JOB_TIMEOUT=60)
+    def test_stale_running_job(self):
+        name = self.upload(self.linen_floral_dress_roses, "roses.jpg", get_image_data(400, 400))
+        models.ImageJob.objects.update(
+            status=models.ImageJob.RUNNING,
+            started_at=timezone.now() - timedelta(seconds=30),
+            attempts=1,
+        )
+        self.assertEqual(jobs.process_jobs(), [])
+
+        models.ImageJob.objects.update(started_at=timezone.now() - timedelta(seconds=61))
+        job, = jobs.process_jobs()
+        self.assertEqual((job.source, job.status, job.attempts), (name, models.ImageJob.DONE, 2))
+
+    @override_settings(PRODUCTS_IMAGE_QUEUE="products.jobs.ImmediateQueue")
+    def test_immediate_queue(self):
+        with mock.patch.object(caching, "bump_catalog_version") as bump_catalog_version:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.upload(self.linen_floral_dress_roses, "roses.jpg", get_image_data(400, 400))
+            # cached data is invalidated once the upload commits
+            bump_catalog_version.assert_not_called()
+            for callback in callbacks:
+                callback()
+            bump_catalog_version.assert_called_with(caching.CATALOG_VERSION_KEY)
+
+        self.assertFalse(models.ImageJob.objects.exists())
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertTrue(images.is_current(self.linen_floral_dress_roses))
+
+    def test_stats(self):
+        self.upload(self.linen_floral_dress_roses, "roses.jpg", get_image_data(400, 400))
+        jobs.get_queue().enqueue(["products/missing.jpg"])
+
+        stats = jobs.get_stats()
+        self.assertEqual(
+            {key: stats[key] for key in ["pending", "running", "done", "failed", "due"]},
+            {"pending": 2, "running": 0, "done": 0, "failed": 0, "due": 2}
+        )
+        self.assertGreaterEqual(stats["oldest_due_seconds"], 0)
+        self.assertEqual(stats["latency"], {})
+
+        jobs.process_jobs()
+        stats = jobs.get_stats()
+        self.assertEqual((stats["pending"], stats["done"], stats["due"]), (1, 1, 0))
+        self.assertIsNone(stats["oldest_due_seconds"])
+        self.assertEqual(set(stats["latency"]), {"mean", "p50", "p95", "max"})
+        self.assertLessEqual(stats["processing"]["max"], stats["latency"]["max"])
+
+    def test_process_image_jobs_command(self):
+        for i, product in enumerate([self.linen_floral_dress_roses, self.sleeveless_dress_green]):
+            self.upload(product, "%s.jpg" % product.slug, get_image_data(400 + i, 400))
+
+        out = io.StringIO()
+        call_command("process_image_jobs", workers=2, batch_size=1, once=True, verbosity=2, stdout=out)
+
+        output = out.getvalue()
+        self.assertIn("products/linen-floral-dress-roses.jpg (Done): ok", output)
+        stats = json.loads(output[output.index("{"):])
+        self.assertEqual((stats["pending"], stats["done"]), (0, 2))
+        self.sleeveless_dress_green.refresh_from_db()
+        self.assertTrue(images.is_current(self.sleeveless_dress_green))
+
+        out = io.StringIO()
+        call_command("process_image_jobs", stats=True, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())["done"], 2)
@@ -1,7 +1,12 @@
+from io import StringIO
+from unittest import mock
+
 from django.core.exceptions import ValidationError
-from django.db import IntegrityError
-from django.db.models import Q
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import F, Q
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
 from products import models
 from products.filter import ProductFilter
@@ -293,6 +298,88 @@ class ProductTestCase(TestCase, Product):
     def test_slug(self):
         self.assertEqual(self.linen_floral_dress_cornflower.slug, 'linen-floral-dress-cornflower')
 
+    def test_slug_after_bulk_create(self):
+        linen_floral = models.ParentProduct.objects.create(name="Linen floral")
+        products = models.Product.objects.bulk_create([
+            models.Product(parent=self.business_trousers, style="Black", price=99,
+                           main_image_url="products/business-trousers-black.jpg"),
+            # slugify("Linen floral dress Roses") is taken
+            models.Product(parent=linen_floral, style="dress Roses", price=99,
+                           main_image_url="products/linen-floral-dress-roses.jpg"),
+            models.Product(parent=linen_floral, style="Dress-roses", price=99,
+                           main_image_url="products/linen-floral-dress-roses.jpg"),
+        ])
+
+        self.assertEqual(
+            [product.slug for product in products],
+            ["business-trousers-black", "linen-floral-dress-roses-2", "linen-floral-dress-roses-3"]
+        )
+
+    def test_slug_collision_on_save(self):
+        coat_a = models.ParentProduct.objects.create(name="Coat A")
+        coat = models.ParentProduct.objects.create(name="Coat")
+        first = models.Product.objects.create(parent=coat_a, style="b", price=99,
+                                              main_image_url="products/coat-a-b.jpg")
+        second = models.Product.objects.create(parent=coat, style="A b", price=99,
+                                               main_image_url="products/coat-a-b.jpg")
+
+        self.assertEqual((first.slug, second.slug), ("coat-a-b", "coat-a-b-2"))
+
+        # the slug does not change with the style
+        second.style = "C"
+        second.save()
+        second.refresh_from_db()
+        self.assertEqual(second.slug, "coat-a-b-2")
+
+    def test_allocate_slugs(self):
+        coat = models.ParentProduct.objects.create(name="Coat")
+        coat_a = models.ParentProduct.objects.create(name="Coat A")
+        models.Product.objects.bulk_create([
+            models.Product(parent=coat, style=style, slug=slug, price=99,
+                           main_image_url="products/coat.jpg")
+            for style, slug in [("A", "coat-a"), ("A 7", "coat-a-7"), ("Ab", "coat-ab")]
+        ])
+        products = [
+            models.Product(parent=coat_a, style="2"),
+            models.Product(parent=coat, style="A-2"),
+            models.Product(parent=coat_a, style=""),
+            models.Product(parent=coat, style="Red"),
+        ]
+
+        with self.assertNumQueries(1):
+            models.Product.objects.allocate_slugs(products)
+
+        self.assertEqual(
+            [product.slug for product in products],
+            # "coat-a" continues after the last suffix, skipping
+            # "coat-a-2" which is left for another new product
+            ["coat-a-2", "coat-a-2-2", "coat-a-8", "coat-red"]
+        )
+
+        products = [models.Product(parent=coat, style="Style %s" % i) for i in range(450)]
+        with self.assertNumQueries(3):
+            models.Product.objects.allocate_slugs(products)
+        self.assertEqual(len({product.slug for product in products}), 450)
+
+    def test_slug_prefixes(self):
+        coat = models.ParentProduct.objects.create(name="Coat")
+        models.Product.objects.bulk_create([
+            models.Product(parent=coat, style=style, slug=slug, price=99,
+                           main_image_url="products/coat.jpg")
+            for style, slug in [("A", "coat"), ("B", "coat-2"), ("C", "coat-a-7"), ("D", "coatb")]
+        ])
+
+        # ranges are only used where text is compared bytewise, under
+        # locale collations (which ignore punctuation) they miss "coat-2"
+        for vendor, lookup in [("sqlite", "<"), ("postgresql", "LIKE")]:
+            with self.subTest(vendor), mock.patch.object(connection, "vendor", vendor):
+                products = models.Product.objects.with_slug_prefixes(["coat"])
+                self.assertIn(lookup, str(products.query))
+                self.assertEqual(
+                    set(products.values_list("slug", flat=True)),
+                    {"coat", "coat-2", "coat-a-7"}
+                )
+
     def test_str(self):
         self.assertEqual(str(self.linen_floral_dress_cornflower), "Linen floral dress - Cornflower")
 
@@ -306,17 +393,185 @@ class ProductTestCase(TestCase, Product):
         with self.assertRaises(ValidationError):
             self.dress_with_invalid_disc_price.full_clean()
 
+    def test_effective_price(self):
+        self.assertEqual(self.linen_floral_dress_cornflower.effective_price, 79)
+        self.assertEqual(self.sleeveless_dress_green.effective_price, 99)
+
+        self.sleeveless_dress_green.discounted_price = 59
+        self.sleeveless_dress_green.save(update_fields=["discounted_price"])
+        self.sleeveless_dress_green.refresh_from_db()
+        self.assertEqual(self.sleeveless_dress_green.effective_price, 59)
+
+    def test_save_queries(self):
+        product = models.Product.objects.get(pk=self.sleeveless_dress_green.pk)
+
+        # the category range and the search document are not recomputed
+        product.discounted_price = 59
+        with CaptureQueriesContext(connection) as queries:
+            product.save(update_fields=["discounted_price"])
+        self.assertEqual([query["sql"].split()[0] for query in queries], ["UPDATE"])
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        self.assertEqual([query["sql"].split()[0] for query in queries], ["UPDATE"])
+
+        # they are recomputed and saved when the style changes
+        product.style = "Moss"
+        product.save(update_fields=["style"])
+        product.refresh_from_db()
+        self.assertIn("Moss", product.search_document)
+        product.style = "Olive"
+        product.save()
+        product.refresh_from_db()
+        self.assertIn("Olive", product.search_document)
+
+        product.parent = self.business_trousers
+        product.save()
+        self.category_business_trousers.refresh_from_db()
+        self.assertIn(product, models.Product.objects.in_category(self.category_business_trousers))
+        self.assertIn("Business trousers", models.Product.objects.get(pk=product.pk).search_document)
+
+    def test_effective_price_after_bulk_writes(self):
+        models.Product.objects.filter(parent=self.linen_floral_dress).update(discounted_price=None)
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertEqual(self.linen_floral_dress_roses.effective_price, 109)
+
+        models.Product.objects.filter(parent=self.linen_floral_dress).update(price=F("price") - 10)
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertEqual(self.linen_floral_dress_roses.effective_price, 99)
+
+        self.business_trousers_navy_blue.discounted_price = 149
+        models.Product.objects.bulk_update([self.business_trousers_navy_blue], ["discounted_price"])
+        self.business_trousers_navy_blue.refresh_from_db()
+        self.assertEqual(self.business_trousers_navy_blue.effective_price, 149)
+
     def test_parent_style_unique_constraint(self):
         with self.assertRaises(IntegrityError) as cm:
             models.Product.objects.create(
                 parent=self.linen_floral_dress,
-                style="cornflower",
+                style="Cornflower",
                 price=59,
                 main_image_url="products/linen-cornflower.jpg"
             )
         self.assertIn("UNIQUE constraint failed", str(cm.exception))
 
 
+class CategoryRangeTestCase(TestCase, Product):
+    def setUp(self) -> None:
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+
+    def in_category(self, category):
+        category.refresh_from_db()
+        return set(models.Product.objects.in_category(category))
+
+    def test_in_category(self):
+        self.assertEqual(
+            self.in_category(self.category_dresses),
+            {
+                self.linen_floral_dress_cornflower,
+                self.linen_floral_dress_roses,
+                self.sleeveless_dress_green,
+                self.dress_with_invalid_disc_price,
+            }
+        )
+        self.assertEqual(
+            self.in_category(self.category_summer_dresses),
+            {self.sleeveless_dress_green, self.dress_with_invalid_disc_price}
+        )
+        self.assertEqual(self.in_category(self.category_summer_dresses_mini), set())
+
+    def test_range_after_category_changes(self):
+        # shifts lft values of categories after it
+        models.Category.objects.create(name="Evening dresses", parent=self.category_dresses)
+        self.assertEqual(
+            self.in_category(self.category_trousers),
+            {self.business_trousers_navy_blue}
+        )
+
+        models.Category.objects.move_node(self.category_summer_dresses, self.category_trousers)
+        self.assertEqual(
+            self.in_category(self.category_trousers),
+            {
+                self.business_trousers_navy_blue,
+                self.sleeveless_dress_green,
+                self.dress_with_invalid_disc_price,
+            }
+        )
+        self.assertEqual(
+            self.in_category(self.category_dresses),
+            {self.linen_floral_dress_cornflower, self.linen_floral_dress_roses}
+        )
+
+    def test_range_refresh_is_limited_to_changed_trees(self):
+        def range_updates():
+            return [
+                query for query in queries.captured_queries
+                if query["sql"].startswith('UPDATE "products_product" SET "category_tree_id"')
+            ]
+
+        category = models.Category.objects.get(pk=self.category_summer_dresses.pk)
+        with CaptureQueriesContext(connection) as queries:
+            category.name = "Holiday dresses"
+            category.save()
+        self.assertEqual(range_updates(), [])
+
+        trousers = models.Category.objects.get(pk=self.category_trousers.pk)
+        with CaptureQueriesContext(connection) as queries:
+            models.Category.objects.create(name="Evening dresses", parent=self.category_dresses)
+            trousers.name = "Pants"
+            trousers.save()
+        # only products of the tree the category was inserted into
+        update, = range_updates()
+        self.assertTrue(update["sql"].endswith(
+            'WHERE "products_product"."category_tree_id" = %s' % self.category_dresses.tree_id
+        ))
+        self.assertEqual(
+            self.in_category(self.category_dresses),
+            {
+                self.linen_floral_dress_cornflower,
+                self.linen_floral_dress_roses,
+                self.sleeveless_dress_green,
+                self.dress_with_invalid_disc_price,
+            }
+        )
+
+    def test_range_after_parent_changes(self):
+        self.linen_floral_dress.category = self.category_trousers
+        self.linen_floral_dress.save()
+        self.assertEqual(
+            self.in_category(self.category_trousers),
+            {
+                self.business_trousers_navy_blue,
+                self.linen_floral_dress_cornflower,
+                self.linen_floral_dress_roses,
+            }
+        )
+
+        models.Product.objects.filter(pk=self.business_trousers_navy_blue.pk).update(
+            parent=self.sleeveless_dress
+        )
+        self.assertEqual(
+            self.in_category(self.category_trousers),
+            {self.linen_floral_dress_cornflower, self.linen_floral_dress_roses}
+        )
+
+    def test_range_after_bulk_create(self):
+        product, = models.Product.objects.bulk_create([
+            models.Product(
+                parent=self.business_trousers,
+                style="Black",
+                slug="business-trousers-black",
+                price=199,
+                main_image_url="products/business_trousers_black.jpg"
+            )
+        ])
+        self.assertIn(product, self.in_category(self.category_business_trousers))
+
+
 class PrefetchedProductManagerTestCase(TestCase, Stock):
     def setUp(self) -> None:
         self.set_categories()
@@ -465,3 +720,68 @@ class ProductFilterTestCase(TestCase, Stock):
         self.assertIn(self.linen_floral_dress_cornflower, filtered_qs)
         self.assertIn(self.linen_floral_dress_roses, filtered_qs)
         self.assertNotIn(self.sleeveless_dress_green, filtered_qs)
+
+
+class StockSummaryTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def test_summary_after_create(self):
+        self.linen_floral_dress_cornflower.refresh_from_db()
+        self.assertTrue(self.linen_floral_dress_cornflower.in_stock)
+        self.assertEqual(self.linen_floral_dress_cornflower.total_quantity, 5)
+        self.assertEqual(self.linen_floral_dress_cornflower.available_size_ids, [self.size_36.pk])
+
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertFalse(self.linen_floral_dress_roses.in_stock)
+        self.assertEqual(self.linen_floral_dress_roses.total_quantity, 0)
+        self.assertEqual(self.linen_floral_dress_roses.available_size_ids, [])
+
+    def test_summary_after_save(self):
+        self.stock_linen_floral_dress_roses_40.quantity = 3
+        self.stock_linen_floral_dress_roses_40.save()
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertTrue(self.linen_floral_dress_roses.in_stock)
+        self.assertEqual(self.linen_floral_dress_roses.available_size_ids, [self.size_40.pk])
+
+    def test_summary_after_delete(self):
+        self.stock_linen_floral_dress_cornflower_36.delete()
+        self.linen_floral_dress_cornflower.refresh_from_db()
+        self.assertFalse(self.linen_floral_dress_cornflower.in_stock)
+
+        models.Stock.objects.filter(product=self.business_trousers_navy_blue).delete()
+        self.business_trousers_navy_blue.refresh_from_db()
+        self.assertFalse(self.business_trousers_navy_blue.in_stock)
+
+    def test_summary_after_bulk_writes(self):
+        models.Stock.objects.filter(product=self.linen_floral_dress_roses).update(quantity=2)
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertEqual(self.linen_floral_dress_roses.total_quantity, 4)
+        self.assertEqual(
+            self.linen_floral_dress_roses.available_size_ids,
+            [self.size_40.pk, self.size_36.pk]
+        )
+
+        self.stock_business_trousers_navy_blue_36.quantity = 0
+        models.Stock.objects.bulk_update([self.stock_business_trousers_navy_blue_36], ["quantity"])
+        self.business_trousers_navy_blue.refresh_from_db()
+        self.assertFalse(self.business_trousers_navy_blue.in_stock)
+
+        models.Stock.objects.bulk_create([
+            models.Stock(product=self.sleeveless_dress_green, size=self.size_38, quantity=1)
+        ])
+        self.sleeveless_dress_green.refresh_from_db()
+        self.assertTrue(self.sleeveless_dress_green.in_stock)
+
+    def test_rebuild_stock_summary_command(self):
+        models.Product.objects.update(in_stock=False, total_quantity=0)
+        call_command("rebuild_stock_summary", stdout=StringIO())
+        self.business_trousers_navy_blue.refresh_from_db()
+        self.assertTrue(self.business_trousers_navy_blue.in_stock)
+        self.assertEqual(self.business_trousers_navy_blue.total_quantity, 10)
@@ -0,0 +1,121 @@
+import base64
+import json
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+
+from products import models
+from products.pagination import CursorPaginator, InvalidCursor
+from products.views import ProductList
+
+
+class CursorPaginatorTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        size_group = models.SizeGroup.objects.create(name="Numerical")
+        size = models.Size.objects.create(name="36", group=size_group)
+        parent = models.ParentProduct.objects.create(name="Floral dress")
+        self.products = []
+        for i in range(7):
+            product = models.Product.objects.create(
+                parent=parent,
+                style="style %s" % i,
+                price=100 + i % 3,
+                discounted_price=90 if i % 2 else None,
+                main_image_url="products/floral_dress.jpg",
+            )
+            models.Stock.objects.create(product=product, size=size, quantity=1)
+            self.products.append(product)
+        self.queryset = models.Product.objects.all()
+
+    def collect_pages(self, paginator):
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return pages
+
+    def test_pages(self):
+        paginator = CursorPaginator(self.queryset, ["price"], per_page=3)
+        pages = self.collect_pages(paginator)
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(
+            [product for page in pages for product in page],
+            list(self.queryset.order_by("price", "pk"))
+        )
+        self.assertFalse(pages[0].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+    def test_descending_ordering(self):
+        paginator = CursorPaginator(self.queryset, ["-price"], per_page=2)
+        pages = self.collect_pages(paginator)
+        self.assertEqual(
+            [product for page in pages for product in page],
+            list(self.queryset.order_by("-price", "-pk"))
+        )
+        # the tiebreaker follows the direction of the last field,
+        # so that (price, id) indexes are read backwards without sorting
+        self.assertEqual(paginator.ordering, ["-price", "-pk"])
+
+    def test_previous_pages(self):
+        paginator = CursorPaginator(self.queryset, ["-pk"], per_page=3)
+        pages = self.collect_pages(paginator)
+
+        previous = paginator.page(pages[2].previous_cursor)
+        self.assertEqual(previous.object_list, pages[1].object_list)
+        self.assertTrue(previous.has_previous())
+
+        first = paginator.page(previous.previous_cursor)
+        self.assertEqual(first.object_list, pages[0].object_list)
+        self.assertFalse(first.has_previous())
+        self.assertTrue(first.has_next())
+
+    def test_no_count_query(self):
+        paginator = CursorPaginator(self.queryset, ["views"], per_page=3)
+        cursor = paginator.page().next_cursor
+        with self.assertNumQueries(1):
+            paginator.page(cursor)
+
+    def test_invalid_cursor(self):
+        paginator = CursorPaginator(self.queryset, ["views"], per_page=3)
+        for cursor in ["garbage", "e30", paginator.encode_cursor(self.products[0], "sideways")]:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+    def test_cursor_values_of_wrong_types(self):
+        paginator = CursorPaginator(self.queryset, ["-effective_price"], per_page=3)
+        for values in [["cheap", 1], [{}, 1], ["10.00", "x"], [None, 1], [[1], 1]]:
+            data = json.dumps({"v": values, "d": "next"}).encode()
+            cursor = base64.urlsafe_b64encode(data).decode()
+            with self.subTest(values), self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+        # values are converted to the types of the fields
+        page = paginator.page()
+        last = page.object_list[-1]
+        self.assertEqual(
+            paginator.decode_cursor(page.next_cursor),
+            ([Decimal(last.effective_price), last.pk], "next"),
+        )
+        self.assertIsInstance(paginator.decode_cursor(page.next_cursor)[0][0], Decimal)
+
+    def test_product_list_cursor_mode(self):
+        view = ProductList.as_view(pagination_mode="cursor", paginate_by=3)
+        factory = RequestFactory()
+
+        response = view(factory.get("/", {"order_by": "price_ascending"}))
+        page = response.context_data["page_obj"]
+        products = list(page)
+        while page.has_next():
+            response = view(factory.get("/", {"order_by": "price_ascending", "cursor": page.next_cursor}))
+            page = response.context_data["page_obj"]
+            products += list(page)
+
+        self.assertEqual(len(products), 7)
+        prices = [product.discounted_price or product.price for product in products]
+        self.assertEqual(prices, sorted(prices))
+
+        with self.assertRaises(Http404):
+            view(factory.get("/", {"cursor": "garbage"}))
@@ -0,0 +1,196 @@
+import random
+
+from django.db import connection
+from django.test import TestCase
+
+from products import models
+from products.catalog_generator import generate_catalog
+from products.filter import ProductFilter
+from products.pagination import CursorPaginator
+from products.views import ProductList
+
+
+class QueryPlanTestCase(TestCase):
+    """
+    Runs EXPLAIN on every query shape of the product list
+    (ProductFilter filters x ordering options) over a seeded catalog
+    and makes sure that no query reads whole product or stock tables
+    and that the common shapes read rows already in the requested order.
+    """
+    page_size = 24
+    # shapes which can't be served by a single index, the matched
+    # subset of products has to be sorted
+    sort_allowed = {
+        # an IN list of colors reads rows of every color from a color
+        # index in order, but rows of all colors have to be merged
+        ("colors", "popularity"),
+        ("colors", "trending"),
+        ("colors", "price_ascending"),
+        ("colors", "price_descending"),
+        ("colors", "newest"),
+        # a range of prices is read from the price index,
+        # which is not ordered by the other fields
+        ("price", "popularity"),
+        ("price", "trending"),
+        ("price", "newest"),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        cls.colors = models.Color.objects.bulk_create([
+            models.Color(name="color %s" % i, hex_code="#%06x" % i) for i in range(12)
+        ])
+        size_group = models.SizeGroup.objects.create(name="Numerical")
+        cls.sizes = models.Size.objects.bulk_create([
+            models.Size(name=str(34 + 2 * i), group=size_group) for i in range(6)
+        ])
+        parents = models.ParentProduct.objects.bulk_create([
+            models.ParentProduct(name="Product %s" % i) for i in range(1000)
+        ])
+        products = models.Product.objects.bulk_create([
+            models.Product(
+                parent=parent,
+                style="style %s" % i,
+                slug="product-%s-style-%s" % (parent.pk, i),
+                color=rng.choice(cls.colors),
+                price=rng.randint(20, 500),
+                discounted_price=rng.choice([None, None, 15]),
+                views=rng.randint(0, 10000),
+                main_image_url="products/product.jpg",
+            )
+            for parent in parents for i in range(4)
+        ])
+        models.Stock.objects.bulk_create([
+            models.Stock(product=product, size=size, quantity=rng.choice([0, 0, 0, 3]))
+            for product in products for size in cls.sizes
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def get_filters(self):
+        return {
+            "none": {},
+            "color": {"color": [str(self.colors[0].pk)]},
+            "colors": {"color": [str(self.colors[0].pk), str(self.colors[1].pk)]},
+            "size": {"size": [str(self.sizes[0].pk)]},
+            "price": {"price_gte": ["100"], "price_lte": ["200"]},
+            "disc_price": {"disc_price": ["1"]},
+        }
+
+    def explain(self, filters, ordering):
+        queryset = models.Product.prefetched.get_available_products().filter(
+            ProductFilter(**filters).get_Q()
+        ).order_by(*ordering)[:self.page_size]
+
+        return queryset.explain()
+
+    def assert_plan(self, plan, shape, ordering):
+        vendor = connection.vendor
+        if vendor == "sqlite":
+            sorted_in_memory = "USE TEMP B-TREE FOR ORDER BY" in plan
+            for line in plan.splitlines():
+                # SCAN without an index reads the whole table, unless it is
+                # the rowid table (the primary key) read in pk order up to
+                # LIMIT, SQLite prefers it to partial indexes on in_stock
+                if "SCAN products_" in line and "USING" not in line:
+                    self.assertTrue(
+                        line.strip().endswith("SCAN products_product") and ordering == ["-pk"]
+                        and not sorted_in_memory,
+                        "Sequential scan in %s: %s" % (shape, line)
+                    )
+        elif vendor == "postgresql":
+            self.assertNotIn("Seq Scan on products_", plan, "Sequential scan in %s" % (shape,))
+            sorted_in_memory = "Sort Key" in plan
+        else:
+            self.skipTest("EXPLAIN output of %s is not supported." % vendor)
+
+        if shape not in self.sort_allowed:
+            self.assertFalse(sorted_in_memory, "Sort in %s: %s" % (shape, plan))
+
+    def explain_cursor_pages(self, filters, ordering):
+        """
+        Returns plans of the pages after and before the second page
+        of keyset pagination.
+        """
+        paginator = CursorPaginator(
+            models.Product.prefetched.get_available_products().filter(ProductFilter(**filters).get_Q()),
+            ordering,
+            self.page_size,
+        )
+        second_page = paginator.page(paginator.page().next_cursor)
+
+        return [
+            paginator.get_page_queryset(cursor)[0].explain()
+            for cursor in [second_page.next_cursor, second_page.previous_cursor]
+        ]
+
+    def test_product_list_query_plans(self):
+        for filter_name, filters in self.get_filters().items():
+            for ordering_name, ordering in ProductList.ordering_options.items():
+                shape = (filter_name, ordering_name)
+                with self.subTest(shape=shape):
+                    self.assert_plan(self.explain(filters, ordering), shape, ordering)
+
+    def test_cursor_page_query_plans(self):
+        for filter_name, filters in self.get_filters().items():
+            for ordering_name, ordering in ProductList.ordering_options.items():
+                shape = (filter_name, ordering_name)
+                for plan in self.explain_cursor_pages(filters, ordering):
+                    with self.subTest(shape=shape):
+                        self.assert_plan(plan, shape, ordering)
+
+
+class CategoryQueryPlanTestCase(TestCase):
+    """
+    Makes sure products of a category subtree are read
+    with a range scan of the category range index.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalog(parents=500, root_categories=2, category_depth=4)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def test_category_query_plans(self):
+        for level in range(3):
+            category = models.Category.objects.filter(level=level).first()
+            with self.subTest(level=level):
+                plan = models.Product.prefetched.get_available_products().in_category(
+                    category
+                ).order_by("views")[:24].explain()
+                if connection.vendor == "sqlite":
+                    self.assertIn("USING INDEX product_category_range_idx", plan)
+                elif connection.vendor == "postgresql":
+                    self.assertNotIn("Seq Scan on products_product", plan)
+                else:
+                    self.skipTest("EXPLAIN output of %s is not supported." % connection.vendor)
+
+
+class SlugQueryPlanTestCase(TestCase):
+    """
+    Makes sure product detail lookups and slug allocation
+    read the unique index of Product.slug.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalog(parents=300)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def test_slug_query_plans(self):
+        product = models.Product.objects.first()
+
+        for plan in [
+            models.Product.objects.filter(slug=product.slug).explain(),
+            models.Product.objects.with_slug_prefixes(
+                [product.slug, "product-1"]
+            ).values_list("slug", flat=True).explain(),
+        ]:
+            if connection.vendor == "sqlite":
+                self.assertNotRegex(plan, r"SCAN products_product(?! USING)")
+                self.assertIn("USING INDEX sqlite_autoindex_products_product", plan)
+            elif connection.vendor == "postgresql":
+                self.assertNotIn("Seq Scan on products_product", plan)
+            else:
+                self.skipTest("EXPLAIN output of %s is not supported." % connection.vendor)
@@ -0,0 +1,184 @@
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from products import facets, models, search
+from products.benchmarks import search as search_benchmark
+from products.catalog_generator import generate_catalog
+from products.filter import ProductFilter
+from products.search import tokenize
+
+from .test_models import Stock
+
+
+class SearchTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.linen_floral_dress.description = "Airy summer dress with a floral print."
+        self.linen_floral_dress.fabric_info = "100% linen"
+        self.linen_floral_dress.save()
+        self.set_products()
+        self.set_stocks()
+
+    def search(self, query):
+        return set(models.Product.objects.search(query))
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Linen "dress" OR -mini*'), ["linen", "dress", "or", "mini"])
+
+    def test_search_document(self):
+        self.linen_floral_dress_roses.refresh_from_db()
+        self.assertEqual(
+            self.linen_floral_dress_roses.search_document,
+            "Linen floral dress Roses red Dresses Airy summer dress with a floral print. 100% linen"
+        )
+
+    def test_search(self):
+        self.assertEqual(
+            self.search("linen"),
+            {self.linen_floral_dress_cornflower, self.linen_floral_dress_roses}
+        )
+        # all words have to match, as prefixes, in any field
+        self.assertEqual(self.search("ROSES lin"), {self.linen_floral_dress_roses})
+        self.assertEqual(
+            self.search("summer dresses"),
+            {
+                self.linen_floral_dress_cornflower,
+                self.linen_floral_dress_roses,
+                self.sleeveless_dress_green,
+                self.dress_with_invalid_disc_price,
+            }
+        )
+        self.assertEqual(self.search("trousers navy"), {self.business_trousers_navy_blue})
+        self.assertEqual(self.search("linen trousers"), set())
+        self.assertEqual(self.search('" * OR'), set())
+        self.assertEqual(self.search(""), set())
+
+    def test_search_rank(self):
+        products = list(models.Product.objects.search("floral dress").order_by("-search_rank"))
+        self.assertEqual(
+            set(products[:2]),
+            {self.linen_floral_dress_cornflower, self.linen_floral_dress_roses}
+        )
+
+    def test_index_updates(self):
+        self.linen_floral_dress.name = "Silk gown"
+        self.linen_floral_dress.save()
+        self.assertEqual(
+            self.search("silk"),
+            {self.linen_floral_dress_cornflower, self.linen_floral_dress_roses}
+        )
+
+        self.color_green.name = "olive"
+        self.color_green.save()
+        self.assertEqual(self.search("olive"), {self.sleeveless_dress_green})
+
+        self.category_summer_dresses.name = "Beach dresses"
+        self.category_summer_dresses.save()
+        self.assertEqual(
+            self.search("beach"),
+            {self.sleeveless_dress_green, self.dress_with_invalid_disc_price}
+        )
+
+        models.Product.objects.filter(pk=self.business_trousers_navy_blue.pk).update(style="Charcoal")
+        self.assertEqual(self.search("charcoal"), {self.business_trousers_navy_blue})
+        self.assertEqual(self.search("navy"), set())
+
+        product, = models.Product.objects.bulk_create([
+            models.Product(
+                parent=self.business_trousers,
+                style="Khaki",
+                slug="business-trousers-khaki",
+                price=199,
+                main_image_url="products/business_trousers_khaki.jpg"
+            )
+        ])
+        self.assertEqual(self.search("khaki business"), {product})
+
+        self.business_trousers_navy_blue.delete()
+        self.assertEqual(self.search("charcoal"), set())
+
+    def test_reindex_products_command(self):
+        models.Product.objects.all().update(search_document="")
+        self.assertEqual(self.search("linen"), set())
+
+        out = StringIO()
+        call_command("reindex_products", stdout=out)
+        self.assertIn("Reindexed 5 products.", out.getvalue())
+        self.assertEqual(
+            self.search("linen"),
+            {self.linen_floral_dress_cornflower, self.linen_floral_dress_roses}
+        )
+
+    def test_search_view(self):
+        url = reverse("product_search")
+
+        response = self.client.get(url, {"q": "dress"})
+        # only available products
+        self.assertEqual(list(response.context["products"]), [self.linen_floral_dress_cornflower])
+        self.assertEqual(response.context["query"], "dress")
+
+        response = self.client.get(url, {"q": "trousers", "order_by": "price_ascending"})
+        self.assertEqual(list(response.context["products"]), [self.business_trousers_navy_blue])
+
+        # combined with filters
+        response = self.client.get(url, {"q": "trousers", "color": [self.color_red.pk]})
+        self.assertEqual(list(response.context["products"]), [])
+
+        response = self.client.get(url)
+        self.assertEqual(list(response.context["products"]), [])
+
+    def test_search_view_facet_counts(self):
+        url = reverse("product_search")
+
+        response = self.client.get(url, {"q": "trousers"})
+        # counts of the search results only
+        self.assertEqual(response.context["facet_counts"]["colors"], {self.color_blue.pk: 1})
+        self.assertEqual(sum(bucket["count"] for bucket in response.context["facet_counts"]["prices"]), 1)
+
+        response = self.client.get(url, {"q": "dress"})
+        self.assertEqual(
+            response.context["facet_counts"],
+            facets.count_facets(ProductFilter(), query="dress"),
+        )
+        self.assertNotEqual(
+            response.context["facet_counts"],
+            facets.count_facets(ProductFilter()),
+        )
+
+    def test_triggers_are_created_after_migrations(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("Only SQLite keeps the search index with triggers.")
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER products_product_fts_insert")
+        product = models.Product.objects.create(
+            parent=self.business_trousers,
+            style="Charcoal",
+            price=199,
+            main_image_url="products/business_trousers_charcoal.jpg"
+        )
+        self.assertNotIn(product, self.search("charcoal"))
+
+        # f.e. a migration rebuilt the products table
+        call_command("migrate", "products", verbosity=0)
+        self.assertIn(product, self.search("charcoal"))
+        self.assertFalse(search.ensure_sqlite_triggers())
+
+
+class SearchBenchmarkTestCase(TestCase):
+    def test_run(self):
+        generate_catalog(parents=10)
+        results = search_benchmark.run(iterations=3)
+
+        self.assertEqual(results["products"], 30)
+        for name in ["indexed_relevance", "indexed_popularity", "icontains_popularity"]:
+            self.assertIn("p95", results[name]["latency_ms"])
@@ -1,18 +1,27 @@
 import datetime
+import json
 
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
 from django.core.cache import cache
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
-from django.utils.dateparse import parse_datetime
 from freezegun import freeze_time
 
+from products import counters, viewed
+from products.benchmarks import view_dedup as view_dedup_benchmark
+from products.benchmarks import viewed_session as viewed_session_benchmark
+from products.catalog_generator import generate_catalog
 from products.models import Product, ParentProduct, Color, Category
 
 VIEWED = "viewed"
 
 
-class SignalTestCase(TestCase):
+class ViewedProducts:
     def setUp(self):
         self.category = Category.objects.create(name="Dresses")
         self.color = Color.objects.create(name='blue')
@@ -40,6 +49,8 @@ class SignalTestCase(TestCase):
 
         cache.clear()
 
+
+class SignalTestCase(ViewedProducts, TestCase):
     def test_add_to_viewed_VIEWED_is_empty(self):
         """
         Test that when the user views a Product for the first time,
@@ -51,13 +62,10 @@ class SignalTestCase(TestCase):
         self.client.get(self.product_1_url)
         self.assertIn(key, self.client.session.get(VIEWED))
 
-        current_time = parse_datetime(
-            timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-        )
-        viewed_at = parse_datetime(
-            self.client.session.get(VIEWED).get(key)
-        )
-        self.assertLess(current_time - viewed_at, timezone.timedelta(minutes=1))
+        # epoch seconds
+        viewed_at = self.client.session.get(VIEWED).get(key)
+        self.assertIsInstance(viewed_at, int)
+        self.assertLess(timezone.now().timestamp() - viewed_at, 60)
 
     @freeze_time("2023-12-31 12:00:00")
     def test_add_to_viewed_product_revisited_shortly(self):
@@ -102,9 +110,9 @@ class SignalTestCase(TestCase):
             viewed_at,
             self.client.session.get(VIEWED).get(key)
         )
-        self.assertAlmostEqual(
+        self.assertEqual(
             self.client.session.get(VIEWED).get(key),
-            datetime.datetime(2023, 12, 31, 13, 1).strftime('%Y-%m-%d %H:%M:%S')
+            datetime.datetime(2023, 12, 31, 13, 1, tzinfo=datetime.timezone.utc).timestamp()
         )
 
     @freeze_time("2023-12-31 12:00:00")
@@ -136,33 +144,185 @@ class SignalTestCase(TestCase):
             None
         )
 
+    @freeze_time("2023-12-31 12:00:00")
+    def test_session_modified_only_on_change(self):
+        backend = viewed.SessionBackend()
+        session = SessionStore()
+
+        self.assertTrue(backend.add(None, session, self.product_1))
+        self.assertTrue(session.modified)
+
+        session.modified = False
+        with freeze_time("2023-12-31 12:30:00"):
+            self.assertFalse(backend.add(None, session, self.product_1))
+            self.assertFalse(session.modified)
+            self.assertTrue(backend.add(None, session, self.product_2))
+        self.assertEqual(list(session[VIEWED]), [str(self.product_1.pk), str(self.product_2.pk)])
+
+        # the expired entry is deleted even if the product was viewed
+        session.modified = False
+        with freeze_time("2023-12-31 13:00:00"):
+            self.assertFalse(backend.add(None, session, self.product_2))
+        self.assertTrue(session.modified)
+        self.assertEqual(list(session[VIEWED]), [str(self.product_2.pk)])
+
+    @freeze_time("2023-12-31 12:30:00")
+    @override_settings(PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=None)
+    def test_old_session_format(self):
+        """
+        Sessions with time stamps stored as strings by previous versions
+        are converted to epoch seconds.
+        """
+        session = self.client.session
+        session[VIEWED] = {
+            str(self.product_1.pk): "2023-12-31 12:10:00",
+            str(self.product_2.pk): "2023-12-31 11:00:00",
+        }
+        session.save()
+
+        self.client.get(self.product_1_url)
+
+        self.assertEqual(self.client.session[VIEWED], {
+            str(self.product_1.pk): datetime.datetime(
+                2023, 12, 31, 12, 10, tzinfo=datetime.timezone.utc
+            ).timestamp(),
+        })
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 0)
+        self.client.get(self.product_2_url)
+        self.assertEqual(counters.view_counter.get(self.product_2.pk), 1)
+
+    @override_settings(PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=None)
     def test_increment_product_views_cache(self):
         """
         Test that visiting the url updates its counter in cache
         """
-        self.cache_key = f"{self.product_1.pk}_view_count"
         # visit the url
         self.client.get(self.product_1_url)
-        self.assertEqual(cache.get(self.cache_key), 1)
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 1)
 
     @freeze_time("2023-12-31 12:00:00")
     def test_increment_product_views_db(self):
         """
-        Test that the counter number in db gets updated
-        every one hour
+        Test that views are not written to the db in requests,
+        the counter stays in cache until it is flushed
         """
+        self.product_1.refresh_from_db()
+        self.assertEqual(self.product_1.views, 0)
 
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.product_1_url)
+        self.assertFalse([
+            query["sql"] for query in queries if "UPDATE" in query["sql"] and "products_product" in query["sql"]
+        ])
         self.product_1.refresh_from_db()
         self.assertEqual(self.product_1.views, 0)
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 1)
+
+        counters.flush_view_counts()
+        self.product_1.refresh_from_db()
+        self.assertEqual(self.product_1.views, 1)
 
-        self.cache_key = f"{self.product_1.pk}_view_count"
-        self.cache_last_saved_key = f"{self.product_1.pk}_view_count_last_saved"
+    @freeze_time("2023-12-31 12:00:00")
+    @override_settings(PRODUCTS_VIEW_COUNTS_FLUSH_IN_REQUEST=True)
+    def test_increment_product_views_db_in_request(self):
+        """
+        Test that with PRODUCTS_VIEW_COUNTS_FLUSH_IN_REQUEST
+        the counter number in db gets updated every one hour
+        """
+        # the first view flushes the counter right away
+        self.client.get(self.product_1_url)
+        self.product_1.refresh_from_db()
+        self.assertEqual(self.product_1.views, 1)
 
-        # set the counter in cache manually to 299 views
-        cache.set(self.cache_key, 299, 6000)
-        cache.set(self.cache_last_saved_key, "2023-12-31 12:00:00", 6000)
+        # views of other users within the hour stay in cache
+        with freeze_time("2023-12-31 12:30:00"):
+            self.client_class().get(self.product_1_url)
+        self.product_1.refresh_from_db()
+        self.assertEqual(self.product_1.views, 1)
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 1)
 
         with freeze_time("2023-12-31 13:00:05"):
-            self.client.get(self.product_1_url)
+            self.client_class().get(self.product_1_url)
         self.product_1.refresh_from_db()
-        self.assertEqual(self.product_1.views, 300)
+        self.assertEqual(self.product_1.views, 3)
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 0)
+
+
+@override_settings(
+    PRODUCTS_VIEWED_BACKEND="products.viewed.BloomFilterBackend",
+    PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=None,
+)
+class BloomFilterBackendTestCase(ViewedProducts, TestCase):
+    def test_views_are_not_stored_in_session(self):
+        self.client.get(self.product_1_url)
+
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 1)
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, self.client.cookies)
+        self.assertFalse(Session.objects.exists())
+
+    @freeze_time("2023-12-31 12:00:00")
+    def test_views_are_counted_once_per_hour(self):
+        self.client.get(self.product_1_url)
+        self.client.get(self.product_2_url)
+
+        with freeze_time("2023-12-31 12:59:00"):
+            self.client.get(self.product_1_url)
+        # still in the filter of the previous hour
+        with freeze_time("2023-12-31 13:01:00"):
+            self.client.get(self.product_1_url)
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 1)
+
+        with freeze_time("2023-12-31 14:00:01"):
+            self.client.get(self.product_1_url)
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 2)
+        self.assertEqual(counters.view_counter.get(self.product_2.pk), 1)
+
+    def test_visitors(self):
+        # visitors without a session are identified by IP address and user agent
+        self.client_class(HTTP_USER_AGENT="crawler").get(self.product_1_url)
+        self.client_class(HTTP_USER_AGENT="crawler").get(self.product_1_url)
+        self.client_class(HTTP_USER_AGENT="browser").get(self.product_1_url)
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 2)
+
+        # and by their session key otherwise
+        for i in range(2):
+            client = self.client_class(HTTP_USER_AGENT="browser")
+            session = client.session
+            session.save()
+            client.get(self.product_1_url)
+            client.get(self.product_1_url)
+        self.assertEqual(counters.view_counter.get(self.product_1.pk), 4)
+
+    def test_false_positive_rate(self):
+        backend = viewed.BloomFilterBackend()
+        bits = 0
+        for pk in range(100):
+            bits |= backend.get_mask(pk)
+
+        false_positives = sum(
+            (bits & backend.get_mask(pk)) == backend.get_mask(pk) for pk in range(100, 10100)
+        )
+        self.assertLess(false_positives / 10000, 0.02)
+
+
+class ViewDedupBenchmarkTestCase(TestCase):
+    def test_run(self):
+        generate_catalog(parents=3)
+
+        results = view_dedup_benchmark.run(iterations=2, views_per_visitor=2)
+
+        self.assertEqual(results["SessionBackend"]["requests"], 6)
+        self.assertGreater(results["SessionBackend"]["session_saves"], 0)
+        self.assertEqual(results["BloomFilterBackend"]["session_saves"], 0)
+        self.assertEqual(results["BloomFilterBackend"]["session_bytes_written"], 0)
+        json.dumps(results)
+
+
+class ViewedSessionBenchmarkTestCase(TestCase):
+    def test_run(self):
+        results = viewed_session_benchmark.run(iterations=5, entries=20)
+
+        self.assertEqual(results["revisit"]["legacy"]["modified"], 5)
+        self.assertEqual(results["revisit"]["epochs"]["modified"], 0)
+        self.assertEqual(results["new_product"]["epochs"]["modified"], 5)
+        json.dumps(results)
@@ -0,0 +1,156 @@
+import io
+import json
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from products import caching, models
+from products.benchmarks import stock_import as stock_import_benchmark
+from products.catalog_generator import generate_catalog
+from products.stock_import import import_stock, read_rows
+
+from .test_models import Stock
+
+CSV = """slug,size,quantity
+linen-floral-dress-cornflower,38,3
+linen-floral-dress-roses,36,0
+sleeveless-dress-green,40,4
+business-trousers-navy-blue,36,0
+missing-product,36,1
+sleeveless-dress-green,XXL,1
+sleeveless-dress-green,38,-1
+sleeveless-dress-green,,1
+"""
+
+
+class StockImportTestCase(TestCase, Stock):
+    def setUp(self) -> None:
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def import_csv(self, text=CSV, **kwargs):
+        return import_stock(read_rows(io.StringIO(text), "csv"), **kwargs)
+
+    def get_quantities(self):
+        return set(models.Stock.objects.values_list("product__slug", "size__name", "quantity"))
+
+    def test_import(self):
+        version = caching.get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.import_csv(batch_size=2)
+
+        self.assertEqual(
+            result.as_dict(),
+            {"created": 1, "updated": 2, "unchanged": 1, "skipped": 4, "products": 3}
+        )
+        self.assertEqual(result.changes, [
+            ("linen-floral-dress-cornflower", "38", 0, 3),
+            ("sleeveless-dress-green", "40", None, 4),
+            ("business-trousers-navy-blue", "36", 10, 0),
+        ])
+        self.assertEqual(result.errors, [
+            (6, "Unknown product: missing-product."),
+            (7, "Unknown size: XXL."),
+            (8, "Invalid quantity: -1."),
+            (9, "Malformed row."),
+        ])
+        self.assertIn(("sleeveless-dress-green", "40", 4), self.get_quantities())
+
+        # the stock summary and the catalog version are refreshed once
+        self.assertEqual(caching.get_catalog_version(), version + 1)
+        self.sleeveless_dress_green.refresh_from_db()
+        self.assertTrue(self.sleeveless_dress_green.in_stock)
+        self.assertEqual(self.sleeveless_dress_green.total_quantity, 4)
+        self.business_trousers_navy_blue.refresh_from_db()
+        self.assertFalse(self.business_trousers_navy_blue.in_stock)
+        self.linen_floral_dress_cornflower.refresh_from_db()
+        self.assertEqual(self.linen_floral_dress_cornflower.total_quantity, 8)
+        self.assertEqual(
+            self.linen_floral_dress_cornflower.available_size_ids,
+            sorted([self.size_36.pk, self.size_38.pk])
+        )
+
+        # re-running the import changes nothing
+        with self.captureOnCommitCallbacks(execute=True):
+            result = self.import_csv()
+        self.assertEqual(result.as_dict()["unchanged"], 4)
+        self.assertEqual(result.changes, [])
+        self.assertEqual(caching.get_catalog_version(), version + 1)
+
+    def test_failing_chunk(self):
+        def rows():
+            yield 2, {"slug": "sleeveless-dress-green", "size": "40", "quantity": "4"}
+            yield 3, {"slug": "business-trousers-navy-blue", "size": "36", "quantity": "0"}
+            raise OSError("Connection reset.")
+
+        version = caching.get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True), self.assertRaises(OSError):
+            import_stock(rows(), batch_size=2)
+
+        # the summary of products of the written chunk is up to date
+        self.sleeveless_dress_green.refresh_from_db()
+        self.assertTrue(self.sleeveless_dress_green.in_stock)
+        self.assertEqual(self.sleeveless_dress_green.total_quantity, 4)
+        self.business_trousers_navy_blue.refresh_from_db()
+        self.assertFalse(self.business_trousers_navy_blue.in_stock)
+        self.assertEqual(caching.get_catalog_version(), version + 1)
+
+    def test_dry_run(self):
+        quantities = self.get_quantities()
+        result = self.import_csv(dry_run=True)
+
+        self.assertEqual(len(result.changes), 3)
+        self.assertEqual(self.get_quantities(), quantities)
+
+    def test_jsonl(self):
+        rows = read_rows(io.StringIO(
+            '{"slug": "sleeveless-dress-green", "size": "36", "quantity": 2}\n'
+            '\n'
+            'not json\n'
+            '{"slug": "sleeveless-dress-green", "size": "36", "quantity": "5"}\n'
+        ), "jsonl")
+        result = import_stock(rows)
+
+        # the last row of a product and size wins
+        self.assertEqual(result.changes, [("sleeveless-dress-green", "36", None, 5)])
+        self.assertEqual(result.errors, [(3, "Malformed row.")])
+
+    def test_import_stock_command(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False) as f:
+            f.write(CSV)
+        self.addCleanup(os.remove, f.name)
+
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_stock", f.name, verbosity=2, stdout=out, stderr=err)
+
+        self.assertIn("sleeveless-dress-green 40: None -> 4", out.getvalue())
+        self.assertIn('"created": 1', out.getvalue())
+        self.assertIn("Line 6: Unknown product: missing-product.", err.getvalue())
+
+
+class StockImportBenchmarkTestCase(TestCase):
+    def test_run(self):
+        generate_catalog(parents=5)
+        quantities = list(models.Stock.objects.order_by("pk").values_list("quantity", flat=True))
+
+        results = stock_import_benchmark.run(iterations=5, changed_ratio=0.5)
+
+        self.assertEqual(results["rows"], len(quantities))
+        self.assertEqual(results["bulk"]["updated"], results["changed"])
+        self.assertEqual(results["per_row_save"]["rows"], min(5, results["changed"]))
+        self.assertIn("rows_per_second", results["bulk"])
+        json.dumps(results)
+        # all writes are rolled back
+        self.assertEqual(
+            list(models.Stock.objects.order_by("pk").values_list("quantity", flat=True)),
+            quantities
+        )
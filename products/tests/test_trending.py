@@ -0,0 +1,163 @@
+import datetime
+import json
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from freezegun import freeze_time
+
+from products import models, trending
+from products.benchmarks import trending as trending_benchmark
+from products.catalog_generator import generate_catalog
+
+from .test_models import Stock
+
+
+def at(hour, minute=0):
+    return datetime.datetime(2023, 12, 31, hour, minute, tzinfo=datetime.timezone.utc)
+
+
+@override_settings(PRODUCTS_TRENDING_HALF_LIFE=2, PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=None)
+class TrendingTestCase(TestCase, Stock):
+    def setUp(self):
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+        self.product_1 = self.linen_floral_dress_cornflower
+        self.product_2 = self.business_trousers_navy_blue
+
+    def get_score(self, product):
+        product.refresh_from_db()
+        return product.trending_score
+
+    def test_fold(self):
+        trending.record_views({self.product_1.pk: 4, self.product_2.pk: 1}, at(10, 30))
+        trending.record_views({self.product_2.pk: 2}, at(11, 59))
+        # views of the current hour are not folded yet
+        trending.record_views({self.product_2.pk: 8}, at(12, 10))
+
+        self.assertEqual(trending.fold_trending_scores(at(12, 30)), 7)
+        # views of 11:00 weigh 1, the half life is 2 hours
+        self.assertAlmostEqual(self.get_score(self.product_1), 4 * 0.5 ** 0.5)
+        self.assertAlmostEqual(self.get_score(self.product_2), 2 + 0.5 ** 0.5)
+
+        # already folded
+        self.assertIsNone(trending.fold_trending_scores(at(12, 50)))
+
+        self.assertEqual(trending.fold_trending_scores(at(14, 0)), 8)
+        # decayed by two hours
+        self.assertAlmostEqual(self.get_score(self.product_1), 4 * 0.5 ** 1.5)
+        self.assertAlmostEqual(self.get_score(self.product_2), (2 + 0.5 ** 0.5) / 2 + 8 * 0.5 ** 0.5)
+
+    def test_old_scores_are_reset(self):
+        trending.record_views({self.product_1.pk: 1}, at(10))
+        trending.fold_trending_scores(at(11))
+
+        trending.fold_trending_scores(at(23))
+        self.assertAlmostEqual(self.get_score(self.product_1), 0.5 ** 6)
+        trending.fold_trending_scores(at(23) + datetime.timedelta(hours=12))
+        self.assertEqual(self.get_score(self.product_1), 0)
+
+    def test_long_gap(self):
+        trending.record_views({self.product_1.pk: 1}, at(10))
+        trending.fold_trending_scores(at(11))
+
+        # the decay underflows to zero
+        trending.record_views({self.product_2.pk: 1}, at(10) + datetime.timedelta(days=365))
+        trending.fold_trending_scores(at(11) + datetime.timedelta(days=365))
+        self.assertEqual(self.get_score(self.product_1), 0)
+        self.assertEqual(self.get_score(self.product_2), 1)
+
+    def test_unknown_last_fold(self):
+        trending.record_views({self.product_1.pk: 1}, at(10))
+        trending.fold_trending_scores(at(11))
+        cache.delete(trending.FOLDED_KEY)
+
+        trending.record_views({self.product_1.pk: 1}, at(11))
+        trending.record_views({self.product_2.pk: 1}, at(8))
+        trending.fold_trending_scores(at(12))
+        # decayed by an hour, views of older hours are folded as well
+        self.assertAlmostEqual(self.get_score(self.product_1), 0.5 ** 0.5 + 1)
+        self.assertAlmostEqual(self.get_score(self.product_2), 0.5 ** 1.5)
+
+    def test_fold_is_locked(self):
+        trending.record_views({self.product_1.pk: 1}, at(10))
+        cache.add(trending.LOCK_KEY, 1)
+        self.assertIsNone(trending.fold_trending_scores(at(11)))
+
+        cache.delete(trending.LOCK_KEY)
+        self.assertEqual(trending.fold_trending_scores(at(11)), 1)
+
+    @freeze_time("2023-12-31 10:00:00")
+    def test_views_are_recorded(self):
+        url = reverse("product_detail", args=[self.product_1.slug])
+        self.client.get(url)
+        self.client_class().get(url)
+
+        with freeze_time("2023-12-31 11:00:00"):
+            call_command("fold_trending_scores", stdout=StringIO())
+        self.assertEqual(self.get_score(self.product_1), 2)
+
+    @freeze_time("2023-12-31 10:00:00")
+    @override_settings(PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=3600)
+    def test_scores_are_folded_hourly(self):
+        url = reverse("product_detail", args=[self.product_1.slug])
+        self.client.get(url)
+
+        with freeze_time("2023-12-31 11:05:00"):
+            # not in requests
+            self.client_class().get(url)
+            self.assertEqual(self.get_score(self.product_1), 0)
+
+            # the first call of the next hour (by the view dispatch
+            # thread) folds the previous one
+            self.assertEqual(trending.maybe_fold_trending_scores(), 1)
+            self.assertIsNone(trending.maybe_fold_trending_scores())
+        self.assertEqual(self.get_score(self.product_1), 1)
+
+    def test_trending_ordering(self):
+        trending.record_views({self.product_2.pk: 2, self.product_1.pk: 1}, at(10))
+        trending.fold_trending_scores(at(11))
+
+        response = self.client.get(reverse("product_list"), {"order_by": "trending"})
+        self.assertEqual(list(response.context["products"])[:2], [self.product_2, self.product_1])
+
+    def test_default_ordering(self):
+        models.Product.objects.filter(pk=self.product_1.pk).update(views=100)
+
+        for params in [{}, {"order_by": "popularity"}]:
+            with self.subTest(params):
+                response = self.client.get(reverse("product_list"), params)
+                products = list(response.context["products"])
+                self.assertEqual(products[0], self.product_1)
+                self.assertEqual(
+                    [product.views for product in products],
+                    sorted([product.views for product in products], reverse=True),
+                )
+        self.assertEqual(models.Product.objects.first(), self.product_1)
+
+
+class TrendingBenchmarkTestCase(TestCase):
+    def test_run(self):
+        generate_catalog(parents=3)
+        scores = list(models.Product.objects.order_by("pk").values_list("trending_score", flat=True))
+
+        results = trending_benchmark.run(hours=2)
+
+        # decay and one batch
+        self.assertEqual(results["second_fold"]["updates"], 2)
+        self.assertGreater(results["first_fold"]["views"], 0)
+        json.dumps(results)
+        # scores are restored
+        self.assertEqual(
+            list(models.Product.objects.order_by("pk").values_list("trending_score", flat=True)),
+            scores,
+        )
+        self.assertIsNone(cache.get(trending.FOLDED_KEY))
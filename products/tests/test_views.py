@@ -0,0 +1,147 @@
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from products import models
+
+from .test_models import Stock
+
+
+@override_settings(PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL=None)
+class ProductDetailTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.color = models.Color.objects.create(name="blue", hex_code="#0000ff")
+        self.size_group = models.SizeGroup.objects.create(name="Numerical")
+        self.size = models.Size.objects.create(name="38", group=self.size_group)
+        self.parent_product = models.ParentProduct.objects.create(name="Floral dress")
+        self.product_1 = models.Product.objects.create(
+            parent=self.parent_product,
+            style="royal blue",
+            color=self.color,
+            price=99,
+            main_image_url="products/floral_dress_royal_blue.jpg"
+        )
+        self.product_2 = models.Product.objects.create(
+            parent=self.parent_product,
+            style="sky blue",
+            color=self.color,
+            price=99,
+            main_image_url="products/floral_dress_sky_blue.jpg"
+        )
+        models.Stock.objects.create(product=self.product_1, size=self.size, quantity=2)
+        models.Image.objects.create(product=self.product_1, url="products/floral_dress_1.jpg")
+        self.url = reverse("product_detail", args=[self.product_1.slug])
+
+    def get_product_queries(self):
+        """
+        Requests the product and returns the response together
+        with queries of the products app (session queries are omitted).
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+            product = response.context["product"]
+            [stock.size.name for stock in product.stock.all()]
+            [image.url for image in product.images.all()]
+            [other_product.color.name for other_product in response.context["other_products"]]
+
+        return response, [query for query in queries if "products_" in query["sql"]]
+
+    def test_product_and_variants(self):
+        response, queries = self.get_product_queries()
+
+        self.assertEqual(response.context["product"], self.product_1)
+        self.assertEqual(
+            sorted(product.pk for product in response.context["other_products"]),
+            [self.product_1.pk, self.product_2.pk]
+        )
+        # product with parent, color and variants, stock with sizes, images
+        self.assertEqual(len(queries), 3)
+        # the Bloom filter backend doesn't query the session
+        with self.settings(PRODUCTS_VIEWED_BACKEND="products.viewed.BloomFilterBackend"):
+            with self.assertNumQueries(3):
+                self.client.get(self.url)
+
+    def test_product_not_found(self):
+        response = self.client.get(reverse("product_detail", args=["missing"]))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(PRODUCTS_DETAIL_CACHE_TIMEOUT=60)
+    def test_cached_product(self):
+        self.get_product_queries()
+        response, queries = self.get_product_queries()
+
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context["product"].stock.all()[0].quantity, 2)
+
+        # stock and image changes invalidate the cache
+        with self.captureOnCommitCallbacks(execute=True):
+            models.Stock.objects.filter(product=self.product_1).update(quantity=5)
+            models.Image.objects.create(product=self.product_1, url="products/floral_dress_2.jpg")
+        response, queries = self.get_product_queries()
+
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(response.context["product"].stock.all()[0].quantity, 5)
+        self.assertEqual(len(response.context["product"].images.all()), 2)
+
+
+class ProductByCategoryListTestCase(TestCase, Stock):
+    def setUp(self):
+        cache.clear()
+        self.set_categories()
+        self.set_colors()
+        self.set_size_group()
+        self.set_sizes()
+        self.set_parent_products()
+        self.set_products()
+        self.set_stocks()
+
+    def get(self, path):
+        return self.client.get(reverse("product_by_category_list", args=[path]))
+
+    def test_products_of_category_and_descendants(self):
+        response = self.get("dresses")
+
+        self.assertEqual(response.context["category"], self.category_dresses)
+        self.assertEqual(
+            list(response.context["products"]),
+            [self.linen_floral_dress_cornflower]
+        )
+        self.assertEqual(
+            response.context["categories"],
+            [
+                self.category_dresses,
+                self.category_summer_dresses,
+                self.category_summer_dresses_mini,
+                self.category_trousers,
+            ]
+        )
+
+        response = self.get("dresses/summer-dresses/mini-dresses")
+        self.assertEqual(
+            response.context["ancestors"],
+            [
+                self.category_dresses,
+                self.category_summer_dresses,
+                self.category_summer_dresses_mini,
+            ]
+        )
+
+    def test_whole_path_is_validated(self):
+        self.assertEqual(self.get("trousers/summer-dresses").status_code, 404)
+        self.assertEqual(self.get("garbage/summer-dresses").status_code, 404)
+        self.assertEqual(self.get("summer-dresses").status_code, 404)
+        self.assertEqual(self.get("dresses/summer-dresses").status_code, 200)
+
+    def test_categories_are_not_queried(self):
+        self.get("dresses")
+
+        with CaptureQueriesContext(connection) as queries:
+            self.get("dresses/summer-dresses")
+
+        self.assertFalse([
+            query for query in queries
+            if query["sql"].startswith('SELECT "products_category"')
+        ])
@@ -0,0 +1,179 @@
+"""
+Trending products: a popularity score which decays over time.
+
+Counted views are also added to a counter of the current hour in the cache
+(a BufferedCounter per hour, see record_views). fold_trending_scores()
+turns finished hours into Product.trending_score: it decays scores of all
+products with one UPDATE and adds views of the hours folded since
+the last time, weighted by their age, with a batched UPDATE.
+The weight of a view halves every PRODUCTS_TRENDING_HALF_LIFE hours
+(24 by default), hours older than PRODUCTS_TRENDING_MAX_AGE hours
+(a week) are not folded anymore.
+
+Folding takes seconds for large catalogs, so it never runs in requests:
+scores are folded with the 'fold_trending_scores' management command
+(f.e. hourly from cron) and, with PRODUCTS_VIEW_DISPATCH = "thread",
+by the thread counting views, with its first batch of every hour
+(unless PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL is None).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, router, transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from products.counters import BufferedCounter
+from products.models import Product
+
+HOUR = 3600
+DEFAULT_HALF_LIFE = 24
+DEFAULT_MAX_AGE = 7 * 24
+# the last folded hour, scores are as of its end
+FOLDED_KEY = "products:trending:folded"
+LOCK_KEY = "products:trending:lock"
+AUTO_FOLD_KEY = "products:trending:auto_fold:%s"
+# lower scores are reset to zero, so that products
+# which are not viewed anymore are not updated forever
+MIN_SCORE = 0.01
+
+
+def get_half_life():
+    return getattr(settings, "PRODUCTS_TRENDING_HALF_LIFE", DEFAULT_HALF_LIFE)
+
+
+def get_max_age():
+    return getattr(settings, "PRODUCTS_TRENDING_MAX_AGE", DEFAULT_MAX_AGE)
+
+
+def get_hour(now=None):
+    """
+    Returns the number of the hour (since the epoch).
+    """
+    return int((now or timezone.now()).timestamp()) // HOUR
+
+
+def get_counter(hour):
+    # a bucket is kept until it's too old to be folded
+    return BufferedCounter("product_trending:%s" % hour, timeout=(get_max_age() + 1) * HOUR)
+
+
+def record_views(deltas, now=None):
+    """
+    Adds views ({product pk: views}) to the counter of the current hour.
+    """
+    counter = get_counter(get_hour(now))
+    for pk, delta in deltas.items():
+        counter.incr(pk, delta)
+
+
+def get_weight(age):
+    """
+    Returns the weight of views made 'age' hours before the end
+    of the last folded hour.
+    """
+    return 0.5 ** (age / get_half_life())
+
+
+def fold_trending_scores(now=None, batch_size=500):
+    """
+    Folds views of all finished hours, which were not folded yet,
+    into Product.trending_score. Returns the number of folded views,
+    None if there was nothing to fold or another fold is in progress.
+    If the last folded hour is not known (f.e. it was evicted from
+    the cache), all hours up to PRODUCTS_TRENDING_MAX_AGE are folded
+    and scores are decayed by one hour.
+    """
+    last = get_hour(now) - 1
+    if not cache.add(LOCK_KEY, 1, HOUR):
+        return None
+
+    try:
+        folded = cache.get(FOLDED_KEY)
+        if folded is not None and folded >= last:
+            return None
+
+        first = last - get_max_age() + 1
+        if folded is None:
+            decay = get_weight(1)
+        else:
+            first = max(first, folded + 1)
+            decay = get_weight(last - folded)
+
+        hours = range(first, last + 1)
+        drained = {hour: get_counter(hour).drain() for hour in hours}
+        increments = {}
+        for hour, deltas in drained.items():
+            weight = get_weight(last - hour)
+            for pk, delta in deltas.items():
+                increments[pk] = increments.get(pk, 0) + delta * weight
+
+        try:
+            with transaction.atomic():
+                decay_scores(decay)
+                add_scores(increments, batch_size)
+        except Exception:
+            for hour, deltas in drained.items():
+                get_counter(hour).restore(deltas)
+            raise
+
+        cache.set(FOLDED_KEY, last, None)
+    finally:
+        cache.delete(LOCK_KEY)
+
+    return sum(sum(deltas.values()) for deltas in drained.values())
+
+
+def decay_scores(weight):
+    """
+    Multiplies all scores by weight with one UPDATE,
+    resetting those which would drop below MIN_SCORE.
+    """
+    products = Product.objects.filter(trending_score__gt=0)
+    if weight == 0:
+        # the weight of a long gap underflows
+        products.update(trending_score=0.0)
+        return
+
+    products.update(
+        trending_score=Case(
+            When(trending_score__lt=MIN_SCORE / weight, then=Value(0.0)),
+            default=F("trending_score") * Value(weight),
+            output_field=FloatField(),
+        )
+    )
+
+
+def add_scores(increments, batch_size=500):
+    """
+    Adds increments ({product pk: score}) to scores, with one
+    parameterized UPDATE executed for batches of products
+    (a CASE with a branch per product is compared for every row,
+    which is slower by orders of magnitude for large batches).
+    """
+    connection = connections[router.db_for_write(Product)]
+    quote = connection.ops.quote_name
+    sql = "UPDATE %s SET %s = %s + %%s WHERE %s = %%s" % (
+        quote(Product._meta.db_table),
+        quote("trending_score"),
+        quote("trending_score"),
+        quote(Product._meta.pk.column),
+    )
+    items = sorted(increments.items())
+    with connection.cursor() as cursor:
+        for i in range(0, len(items), batch_size):
+            cursor.executemany(sql, [(increment, pk) for pk, increment in items[i:i + batch_size]])
+
+
+def maybe_fold_trending_scores(now=None):
+    """
+    Folds scores with the first call in every hour, unless
+    PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL is None. It's called
+    by the view dispatch thread, not in requests.
+    """
+    if getattr(settings, "PRODUCTS_VIEW_COUNTS_FLUSH_INTERVAL", 3600) is None:
+        return None
+
+    if cache.add(AUTO_FOLD_KEY % get_hour(now), 1, 2 * HOUR):
+        return fold_trending_scores(now)
+
+    return None
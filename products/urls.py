@@ -5,6 +5,8 @@ from . import views
 urlpatterns = [
     re_path(r'^p/(?P<slug>[-\w]+)/$', views.ProductDetail.as_view(), name='product_detail'),
     path('', views.ProductList.as_view(), name='product_list'),
+    path('search/', views.ProductSearch.as_view(), name='product_search'),
+    path('autocomplete/', views.ProductAutocomplete.as_view(), name='product_autocomplete'),
     re_path(r'^(?P<path>[\w/-]+)/$', views.ProductByCategoryList.as_view(), name='product_by_category_list'),
 ]
 
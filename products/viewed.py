@@ -0,0 +1,161 @@
+"""
+Deduplication of product views: a product viewed by the same visitor
+again within an hour is not counted (see signals.add_to_viewed).
+The backend is set with PRODUCTS_VIEWED_BACKEND (a dotted path):
+
+- "products.viewed.SessionBackend" (the default) keeps viewed products
+  with times of views in the visitor's session, which writes the session
+  whenever a product is viewed for the first time within the hour.
+- "products.viewed.BloomFilterBackend" keeps a small Bloom filter per
+  visitor and hour in the cache, the session is not accessed at all.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.module_loading import import_string
+
+VIEWED = "viewed"
+
+DEFAULT_BACKEND = "products.viewed.SessionBackend"
+DEFAULT_BLOOM_BITS = 1024
+DEFAULT_BLOOM_HASHES = 7
+
+
+class ViewedBackend:
+    # seconds within which views of a product by a visitor count once
+    period = 3600
+
+    def add(self, request, session, product):
+        """
+        Records a view of the product, returns True if it's the first one
+        of the visitor within the hour (the view should be counted).
+        """
+        raise NotImplementedError
+
+
+class SessionBackend(ViewedBackend):
+    """
+    Under key VIEWED in django session instance we keep track of primary keys
+    (as strings, since they are stored as JSON keys) of all ProductVariants
+    viewed by a particular user within the last hour, with the time of the
+    view in epoch seconds as a value. Entries are in the order of views
+    (JSON objects keep it), so expired ones are at the beginning
+    and expiring stops at the first fresh entry. The session is only
+    marked as modified if an entry was added or deleted.
+    """
+    def migrate(self, viewed):
+        """
+        Returns entries stored by previous versions, with UTC time stamps
+        ('%Y-%m-%d %H:%M:%S' strings), with epoch seconds, ordered by time.
+        """
+        epochs = {
+            pk: int(parse_datetime(viewed_at).replace(tzinfo=datetime.timezone.utc).timestamp())
+            for pk, viewed_at in viewed.items()
+        }
+
+        return dict(sorted(epochs.items(), key=lambda item: item[1]))
+
+    def expire(self, viewed, now):
+        """
+        Deletes entries of views made more than an hour ago,
+        returns True if there were any.
+        """
+        expired = []
+        for pk, viewed_at in viewed.items():
+            if now - viewed_at < self.period:
+                break
+            expired.append(pk)
+        for pk in expired:
+            del viewed[pk]
+
+        return bool(expired)
+
+    def add(self, request, session, product):
+        now = int(timezone.now().timestamp())
+        viewed = session.get(VIEWED) or {}
+        changed = False
+        if viewed and isinstance(next(iter(viewed.values())), str):
+            viewed = self.migrate(viewed)
+            changed = True
+        changed |= self.expire(viewed, now)
+
+        pk = str(product.pk)
+        added = pk not in viewed
+        if added:
+            viewed[pk] = now
+        if added or changed:
+            # marks the session as modified
+            session[VIEWED] = viewed
+
+        return added
+
+
+class BloomFilterBackend(ViewedBackend):
+    """
+    Keeps products viewed by a visitor in a Bloom filter of
+    PRODUCTS_VIEWED_BLOOM_BITS bits (1024 by default, 128 bytes) per hour
+    in the cache, so memory is bounded per visitor regardless of
+    the number of viewed products. A view counts if the product is neither
+    in the filter of the current nor of the previous hour, so views of
+    a product are counted at most once per hour, and at least once in two
+    hours. With the default 7 hashes less than 1% of products are wrongly
+    considered viewed after a visitor has viewed 100 products within an hour.
+
+    Visitors are identified by their session key if they have a session,
+    otherwise (f.e. crawlers) by their IP address and user agent,
+    a session is never created.
+    """
+    key_prefix = "products:viewed"
+
+    def __init__(self):
+        self.bits = getattr(settings, "PRODUCTS_VIEWED_BLOOM_BITS", DEFAULT_BLOOM_BITS)
+        self.hashes = getattr(settings, "PRODUCTS_VIEWED_BLOOM_HASHES", DEFAULT_BLOOM_HASHES)
+
+    def get_visitor_id(self, request, session):
+        if session is not None and session.session_key:
+            visitor = "session:%s" % session.session_key
+        else:
+            visitor = "client:%s:%s" % (
+                request.META.get("REMOTE_ADDR", ""),
+                request.META.get("HTTP_USER_AGENT", ""),
+            )
+
+        return hashlib.blake2b(visitor.encode(), digest_size=12).hexdigest()
+
+    def get_mask(self, pk):
+        """
+        Returns the bits of the product in a filter, positions are
+        derived from two 64-bit hashes (h1 + i * h2, h2 is odd to cover
+        all positions of a power of two bits).
+        """
+        digest = hashlib.blake2b(str(pk).encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+        mask = 0
+        for i in range(self.hashes):
+            mask |= 1 << (h1 + i * h2) % self.bits
+
+        return mask
+
+    def add(self, request, session, product):
+        visitor = self.get_visitor_id(request, session)
+        hour = int(timezone.now().timestamp()) // self.period
+        key, previous_key = ("%s:%s:%s" % (self.key_prefix, visitor, h) for h in (hour, hour - 1))
+        filters = cache.get_many([key, previous_key])
+        mask = self.get_mask(product.pk)
+
+        if any((filters.get(k, 0) & mask) == mask for k in (key, previous_key)):
+            return False
+
+        # concurrent views of the same visitor may overwrite each
+        # other's bits, which only lets a product be counted again
+        cache.set(key, filters.get(key, 0) | mask, 2 * self.period)
+
+        return True
+
+
+def get_backend():
+    return import_string(getattr(settings, "PRODUCTS_VIEWED_BACKEND", DEFAULT_BACKEND))()
@@ -1,12 +1,18 @@
-from django.db.models import Max
-from django.views.generic import DetailView, ListView
+from django.conf import settings
+from django.db.models import Prefetch, prefetch_related_objects
+from django.http import Http404, JsonResponse
+from django.utils.translation import gettext as _
+from django.views.generic import DetailView, ListView, View
 
-from products import signals
-from products.models import Product, Category, Color, SizeGroup
+from products import autocomplete, caching, facets, signals
+from products.category_tree import get_category_tree
+from products.instrumentation import InstrumentedViewMixin
+from products.models import Product, Stock
 from products.filter import ProductFilter
+from products.pagination import CursorPaginator, InvalidCursor
 
 
-class ProductList(ListView):
+class ProductList(InstrumentedViewMixin, ListView):
     model = Product
     filter = ProductFilter
     # do not display unavailable products on product list
@@ -15,49 +21,96 @@ class ProductList(ListView):
     paginate_by = 24
     ordering_param_name = "order_by"
     ordering_options = {
-        "popularity": ["views"],
-        "price_ascending": ["discounted_price", "price"],
-        "price_descending": ["-discounted_price", "-price"],
+        "popularity": ["-views"],
+        # views weighted by their age, see products.trending
+        "trending": ["-trending_score"],
+        "price_ascending": ["effective_price"],
+        "price_descending": ["-effective_price"],
         "newest": ["-pk"],
     }
+    # "offset" - django's Paginator with page numbers,
+    # "cursor" - keyset pagination with opaque next/previous cursors,
+    # which does not count results and does not slow down on deep pages
+    pagination_mode = "offset"
+    cursor_param_name = "cursor"
+
+    # the Category products are listed for, if any
+    category = None
 
     def get_queryset(self):
         q = self.get_Q_object()
-        return self.queryset.filter(q)
+        return self.queryset.filter(q).order_by(*self.get_ordering())
+
+    def get_filter(self):
+        """
+        Returns a ProductFilter instance
+        based on query parameters
+        """
+        if not hasattr(self, "_filter"):
+            filters = {**self.request.GET}
+            self._filter = self.filter(**filters)
+
+        return self._filter
 
     def get_Q_object(self):
         """
         Returns a django Q object for filtering
         based on query parameters
         """
-        filters = {**self.request.GET}
-        return ProductFilter(**filters).get_Q()
+        return self.get_filter().get_Q()
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
         # add data for filtering
-        context['categories'] = Category.objects.filter(parent__isnull=True)
-        context['colors'] = Color.objects.all()
-        context['size_groups'] = SizeGroup.objects.all()
-        context["max_price"] = self.queryset.aggregate(Max("price"))['price__max'] or 99999
+        context.update(facets.get_filter_options())
+        context["facet_counts"] = self.get_facet_counts()
 
         return context
 
+    def get_facet_counts(self):
+        return facets.get_facet_counts(self.get_filter(), self.category)
+
     def get_ordering(self):
         ordering = self.request.GET.get(self.ordering_param_name) or ""
 
-        return self.ordering_options.get(ordering, ["views"])
+        return self.ordering_options.get(ordering, self.ordering_options["popularity"])
+
+    def paginate_queryset(self, queryset, page_size):
+        if self.pagination_mode != "cursor":
+            return super().paginate_queryset(queryset, page_size)
+
+        paginator = CursorPaginator(queryset, self.get_ordering(), page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_param_name))
+        except InvalidCursor as e:
+            raise Http404(str(e))
+
+        return paginator, page, page.object_list, page.has_other_pages()
 
 
 class ProductByCategoryList(ProductList):
+    def get_category(self):
+        """
+        Resolves the whole path (f.e. dresses/summer-dresses/floral-dresses)
+        with the in-memory category tree, so a path with a wrong
+        or missing ancestor does not resolve.
+        """
+        self.category_tree = get_category_tree()
+        return self.resolve_category()
+
+    def resolve_category(self):
+        category = self.category_tree.resolve(self.kwargs["path"])
+        if category is None:
+            raise Http404("No category found for path: %s" % self.kwargs["path"])
+
+        return category
+
     def get_queryset(self):
-        # example path: dresses/summer-dresses/floral-dresses,
-        # then crumb = "floral-dresses"
-        crumb = self.kwargs["path"].split("/")[-1]
+        self.category = self.get_category()
         ordering = super().get_ordering()
         q = self.get_Q_object()
         queryset = (
-            Product.prefetched.get_queryset_for_category(crumb)
+            Product.prefetched.get_available_products().in_category(self.category)
                 .filter(q).order_by(*ordering)
         )
 
@@ -65,32 +118,169 @@ class ProductByCategoryList(ProductList):
 
     def get_context_data(self, *, object_list=None, **kwargs):
         context = super().get_context_data(object_list=None, **kwargs)
-        crumb = self.kwargs["path"].split("/")[0]
-        context['categories'] = Category.objects.root_and_path_categories(crumb)
+        context.update(self.get_category_context())
         return context
 
+    def get_category_context(self):
+        tree = self.category_tree
+        ancestors = tree.get_ancestors(self.category, include_self=True)
+        return {
+            'category': self.category,
+            'ancestors': ancestors,
+            # all root categories plus all descendants of the selected root category
+            'categories': sorted(
+                {*tree.get_roots(), *tree.get_descendants(ancestors[0])},
+                key=lambda category: (category.tree_id, category.lft)
+            ),
+        }
 
-class ProductDetail(DetailView):
+
+class ProductSearch(ProductList):
+    """
+    Full-text search of available products (see ProductQuerySet.search),
+    combined with ProductFilter filters. Results are ordered by relevance
+    unless another ordering is selected.
+    """
+    search_param_name = "q"
+    ordering_options = {
+        "relevance": ["-search_rank"],
+        **ProductList.ordering_options,
+    }
+
+    def get_search_query(self):
+        return self.request.GET.get(self.search_param_name, "").strip()
+
+    def get_queryset(self):
+        return self.queryset.filter(self.get_Q_object()).search(
+            self.get_search_query()
+        ).order_by(*self.get_ordering())
+
+    def get_ordering(self):
+        ordering = self.request.GET.get(self.ordering_param_name) or ""
+
+        return self.ordering_options.get(ordering, self.ordering_options["relevance"])
+
+    def get_context_data(self, *, object_list=None, **kwargs):
+        context = super().get_context_data(object_list=None, **kwargs)
+        context["query"] = self.get_search_query()
+        return context
+
+    def get_facet_counts(self):
+        # counts of the search results
+        return facets.get_facet_counts(self.get_filter(), self.category, self.get_search_query())
+
+
+class ProductAutocomplete(View):
+    """
+    Suggestions of products, categories and colors for a search box,
+    looked up in the in-memory autocomplete index without database queries.
+    """
+    search_param_name = "q"
+    limit_param_name = "limit"
+    default_limit = 10
+    max_limit = 50
+
+    def get_limit(self):
+        try:
+            limit = int(self.request.GET.get(self.limit_param_name, self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+
+        return max(1, min(limit, self.max_limit))
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get(self.search_param_name, "").strip()
+
+        return JsonResponse({
+            "query": query,
+            "suggestions": autocomplete.suggest(query, self.get_limit()),
+        })
+
+
+class ProductDetail(InstrumentedViewMixin, DetailView):
     model = Product
     # fetch all products, so that the user can see
     # an unavailable product as well (f.e. added to
-    # bookmarks a week ago and currently out of stock)
-    queryset = Product.prefetched.all()
+    # bookmarks a week ago and currently out of stock);
+    # color variants are read together with the product,
+    # see get_variants_queryset
+    queryset = Product.objects.select_related("parent", "color")
+    prefetch = [
+        Prefetch("stock", queryset=Stock.objects.select_related("size")),
+        "images",
+    ]
     context_object_name = "product"
+    cache_key = "products:detail:%s"
+
+    def get_variants_queryset(self):
+        """
+        Returns all color variants of the parent product of the requested
+        product (the product itself included), so that the product and
+        its variants are read with one query.
+        """
+        slug = self.kwargs[self.slug_url_kwarg]
+        return self.get_queryset().filter(parent__product__slug=slug)
+
+    def get_product(self, variants):
+        """
+        Returns the requested product of its variants, with the variants
+        in product.parent.variants (see ProductQuerySet.with_variants).
+        """
+        slug = self.kwargs[self.slug_url_kwarg]
+        product = next((variant for variant in variants if variant.slug == slug), None)
+        if product is None:
+            raise Http404(
+                _("No %(verbose_name)s found matching the query")
+                % {"verbose_name": self.model._meta.verbose_name}
+            )
+
+        for variant in variants:
+            variant.parent = product.parent
+        product.parent.variants = variants
+
+        return product
+
+    def fetch_object(self):
+        """
+        Returns the product with its variants, stock with sizes
+        and images, read with 3 queries.
+        """
+        product = self.get_product(list(self.get_variants_queryset()))
+        prefetch_related_objects([product], *self.prefetch)
+
+        return product
+
+    def get_object(self, queryset=None):
+        """
+        Returns the product with related data, cached per slug
+        for PRODUCTS_DETAIL_CACHE_TIMEOUT seconds if it is set.
+        The cache is invalidated on any catalog change
+        (see signals.bump_catalog_version).
+        """
+        timeout = getattr(settings, "PRODUCTS_DETAIL_CACHE_TIMEOUT", None)
+        if not timeout:
+            return self.fetch_object()
+
+        return caching.get_or_set_versioned(
+            self.cache_key % self.kwargs[self.slug_url_kwarg],
+            self.fetch_object,
+            timeout,
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['other_products'] = self.queryset.filter(
-            parent=self.get_object().parent
-        )
+        context['other_products'] = self.object.parent.variants
 
         return context
 
     def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
         # send signal to increment views counter
         signals.product_viewed.send(
             sender=self.model,
             session=self.request.session,
-            product=self.get_object(self.queryset),
+            product=self.object,
+            request=self.request,
         )
-        return super().get(request, *args, **kwargs)
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)